@@ -1,14 +1,43 @@
 from alert_channels.millerbot import MillerBotChannel
+from alert_channels.local import FileChannel, SyslogChannel
+from alert_channels.resilient import ResilientChannel, CircuitBreaker, TokenBucket
 
 _CHANNEL_TYPES = {
     "millerbot": MillerBotChannel,
+    "file": FileChannel,
+    "syslog": SyslogChannel,
 }
 
 
-def channelFactory(logger, cfg):
-    """Instantiate an alert channel from its configuration object."""
-    channel_type = cfg.type
+def _channelClass(channel_type):
+    if channel_type == "mqtt":
+        # Imported lazily so paho is only needed when the channel is configured
+        from alert_channels.mqtt_channel import MqttChannel
+        return MqttChannel
     cls = _CHANNEL_TYPES.get(channel_type)
     if cls is None:
         raise ValueError(f"Unknown alert channel type: '{channel_type}'")
-    return cls(logger, cfg)
+    return cls
+
+
+def channelFactory(logger, cfg):
+    """Instantiate an alert channel from its configuration object.
+
+    Every channel is wrapped in a ResilientChannel providing a circuit breaker,
+    optional rate limit ('rate_limit') and optional fallback channel ('fallback').
+    """
+    inner = _channelClass(cfg.type)(logger, cfg)
+
+    breaker_cfg = getattr(cfg, 'circuit_breaker', None)
+    breaker = CircuitBreaker(
+        failure_threshold=getattr(breaker_cfg, 'failure_threshold', 3),
+        reset_seconds=getattr(breaker_cfg, 'reset_seconds', 300)
+    )
+
+    limiter = None
+    rate_cfg = getattr(cfg, 'rate_limit', None)
+    if rate_cfg is not None:
+        limiter = TokenBucket(rate_cfg.per_minute, getattr(rate_cfg, 'burst', None))
+
+    fallback = channelFactory(logger, cfg.fallback) if hasattr(cfg, 'fallback') else None
+    return ResilientChannel(logger, inner, breaker=breaker, limiter=limiter, fallback=fallback)
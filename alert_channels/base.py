@@ -4,10 +4,27 @@ from abc import ABC, abstractmethod
 class AlertChannel(ABC):
     """Base class for alert notification channels."""
 
+    # Retry policy used by the dispatcher when send() fails
+    max_attempts = 5
+
+    @property
+    def name(self) -> str:
+        """Name used in logs and health reports."""
+        return type(self).__name__
+
+    def retry_delay(self, attempt) -> float:
+        """Seconds to wait before retrying after the given (0-based) failed attempt."""
+        return 2 * (2 ** attempt)
+
     @abstractmethod
     def send(self, alert) -> bool:
-        """Send an alert via this channel.
+        """Make a single attempt to send an alert via this channel.
 
-        Returns True on success, False on failure.
+        Returns True on success, False on failure. Retries are handled by
+        the dispatcher, so implementations must not sleep or loop.
         """
         pass
+
+    def close(self):
+        """Release any connections held by the channel."""
+        pass
@@ -0,0 +1,160 @@
+import heapq
+import queue
+import threading
+import time
+
+
+class _Delivery:
+    """A single pending send of one alert to one channel."""
+
+    def __init__(self, channel, alert, attempt=0):
+        self.channel = channel
+        self.alert = alert
+        self.attempt = attempt
+
+
+class AlertDispatcher:
+    """Delivers alerts to channels off the caller's thread.
+
+    Deliveries go through a bounded queue drained by a pool of worker threads.
+    Failed sends are re-queued by a single timer thread once the channel's retry
+    delay has elapsed, so no worker sleeps while waiting to retry. The same timer
+    runs other short deferred callbacks (see call_later).
+    """
+
+    def __init__(self, logger, workers=2, queue_size=100):
+        self.logger = logger
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._timers = []  # heap of (due_monotonic, seq, callback)
+        self._timer_seq = 0
+        self._running_timers = 0
+        self._timer_cond = threading.Condition()
+        self._closing = False
+        self._stopped = False
+        self._threads = []
+
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker, args=())
+            worker.daemon = True
+            worker.name = f"AlertTh{i}"
+            self._threads.append(worker)
+
+        timer = threading.Thread(target=self._timer_loop, args=())
+        timer.daemon = True
+        timer.name = "AlertTimerTh"
+        self._threads.append(timer)
+
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, channel, alert, block=False):
+        """Queue an alert for delivery to a channel. Never blocks unless asked to."""
+        try:
+            self._queue.put(_Delivery(channel, alert), block=block, timeout=1 if block else None)
+            return True
+        except queue.Full:
+            self.logger.error(f"Alert queue full, dropping {alert.type.value} alert for {channel.name}")
+            return False
+
+    def pending(self):
+        """Number of deliveries and timer callbacks not yet completed."""
+        with self._timer_cond:
+            return self._queue.unfinished_tasks + len(self._timers) + self._running_timers
+
+    def call_later(self, delay, callback):
+        """Run a short, non-blocking callback on the timer thread after delay seconds.
+
+        Pending callbacks run immediately once shutdown starts.
+        """
+        with self._timer_cond:
+            self._timer_seq += 1
+            heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_seq, callback))
+            self._timer_cond.notify()
+
+    def _worker(self):
+        while True:
+            delivery = self._queue.get()
+            try:
+                # None is the stop sentinel queued by shutdown()
+                if delivery is None:
+                    return
+                self._deliver(delivery)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, delivery):
+        channel = delivery.channel
+        name = channel.name
+        try:
+            if channel.send(delivery.alert):
+                return
+        except Exception as ex:
+            self.logger.error(f"Alert channel {name} raised an exception: {ex}")
+
+        delivery.attempt += 1
+        if delivery.attempt >= channel.max_attempts:
+            self.logger.error(f"Alert channel {name} failed after {delivery.attempt} attempts: {delivery.alert.type.value}")
+            return
+
+        # While shutting down the timer fires at once instead of waiting out the backoff
+        delay = channel.retry_delay(delivery.attempt - 1)
+        self.logger.warning(f"Alert channel {name} send failed (attempt {delivery.attempt}/{channel.max_attempts}), retrying in {delay}s")
+        self.call_later(delay, lambda: self._requeue(delivery))
+
+    def _requeue(self, delivery):
+        try:
+            self._queue.put_nowait(delivery)
+        except queue.Full:
+            self.logger.error(f"Alert queue full, dropping retry of {delivery.alert.type.value} alert")
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                if not self._timers:
+                    if self._stopped:
+                        return
+                    self._timer_cond.wait()
+                    continue
+                due = self._timers[0][0] - time.monotonic()
+                if due > 0 and not self._closing:
+                    self._timer_cond.wait(due)
+                    continue
+                _, _, callback = heapq.heappop(self._timers)
+                self._running_timers += 1
+            try:
+                callback()
+            except Exception as ex:
+                self.logger.error(f"Alert dispatcher timer callback failed: {ex}")
+            finally:
+                with self._timer_cond:
+                    self._running_timers -= 1
+
+    def shutdown(self, timeout=15):
+        """Flush queued and backed-off deliveries, waiting up to timeout seconds, then stop the threads."""
+        with self._timer_cond:
+            self._closing = True
+            self._timer_cond.notify()
+
+        deadline = time.monotonic() + timeout
+        flushed = True
+        while self.pending() > 0:
+            if time.monotonic() >= deadline:
+                self.logger.warning(f"Alert dispatcher shutdown timed out with {self.pending()} undelivered alert(s)")
+                flushed = False
+                break
+            time.sleep(0.05)
+
+        # Workers exit on their sentinel, after anything still queued; the timer once it has nothing left to run
+        with self._timer_cond:
+            self._stopped = True
+            self._timer_cond.notify()
+        for thread in self._threads:
+            if thread.name.startswith("AlertTh"):
+                try:
+                    self._queue.put(None, timeout=max(deadline - time.monotonic(), 0.1))
+                except queue.Full:
+                    break
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(max(deadline - time.monotonic(), 0.1))
+        return flushed
@@ -0,0 +1,57 @@
+import os
+import json
+import threading
+from alert_channels.base import AlertChannel
+
+
+class FileChannel(AlertChannel):
+    """Alert channel that appends each alert as a JSON line to a local file."""
+
+    max_attempts = 2
+
+    def __init__(self, logger, cfg):
+        self.logger = logger
+        self.path = cfg.path
+        self._lock = threading.Lock()
+
+    def send(self, alert) -> bool:
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(alert.to_dict(), default=str) + "\n")
+            return True
+        except OSError as e:
+            self.logger.error(f"File alert channel failed to write '{self.path}': {e}")
+            return False
+
+
+class SyslogChannel(AlertChannel):
+    """Alert channel that writes alerts to the local syslog daemon."""
+
+    max_attempts = 2
+
+    def __init__(self, logger, cfg):
+        import syslog
+        self.logger = logger
+        self._syslog = syslog
+        self.ident = getattr(cfg, 'ident', 'irrigate')
+        self._priority = {
+            "critical": syslog.LOG_CRIT,
+            "warning": syslog.LOG_WARNING,
+        }
+
+    def send(self, alert) -> bool:
+        message = f"[{alert.severity.value.upper()}] {alert.type.value}"
+        if alert.valve_name:
+            message += f" (valve: {alert.valve_name})"
+        message += f": {alert.message}"
+        if alert.data:
+            message += f" {json.dumps(alert.data, default=str)}"
+        try:
+            self._syslog.openlog(self.ident, 0, self._syslog.LOG_DAEMON)
+            self._syslog.syslog(self._priority.get(alert.severity.value, self._syslog.LOG_WARNING), message)
+            return True
+        except OSError as e:
+            self.logger.error(f"Syslog alert channel failed: {e}")
+            return False
@@ -1,5 +1,5 @@
-import time
 import requests
+import http_client
 from alert_channels.base import AlertChannel
 
 
@@ -39,19 +39,10 @@ class MillerBotChannel(AlertChannel):
             "X-Api-Key": self.api_key,
         }
 
-        for attempt in range(5):
-            try:
-                response = requests.post(self.url, headers=headers, json=payload, timeout=10)
-                response.raise_for_status()
-                self.logger.info(f"MillerBot alert sent successfully: {alert.type.value}")
-                return True
-            except requests.exceptions.RequestException as e:
-                delay = 2 * (2 ** attempt)
-                if attempt < 4:
-                    self.logger.warning(
-                        f"MillerBot send failed (attempt {attempt + 1}/5), retrying in {delay}s: {e}"
-                    )
-                    time.sleep(delay)
-                else:
-                    self.logger.error(f"MillerBot send failed after 5 attempts: {e}")
-                    return False
+        try:
+            http_client.getClient().post(self.url, headers=headers, json=payload)
+            self.logger.info(f"MillerBot alert sent successfully: {alert.type.value}")
+            return True
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"MillerBot send failed: {e}")
+            return False
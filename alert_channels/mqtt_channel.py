@@ -0,0 +1,37 @@
+import json
+from paho.mqtt import client
+from alert_channels.base import AlertChannel
+
+
+class MqttChannel(AlertChannel):
+    """Alert channel that publishes alerts as JSON to an MQTT topic."""
+
+    def __init__(self, logger, cfg):
+        self.logger = logger
+        self.hostname = cfg.hostname
+        self.port = getattr(cfg, 'port', 1883)
+        self.topic = cfg.topic
+        self.mqttClient = client.Client(client.CallbackAPIVersion.VERSION1, getattr(cfg, 'client_name', 'irrigate-alerts'))
+        # Connect in the background; paho keeps reconnecting on its own network thread
+        self.mqttClient.connect_async(self.hostname, self.port)
+        self.mqttClient.loop_start()
+
+    def retry_delay(self, attempt) -> float:
+        return 5
+
+    def send(self, alert) -> bool:
+        if not self.mqttClient.is_connected():
+            self.logger.warning(f"MQTT alert channel not connected to '{self.hostname}'")
+            return False
+        result = self.mqttClient.publish(self.topic, json.dumps(alert.to_dict(), default=str), qos=1)
+        if result.rc != client.MQTT_ERR_SUCCESS:
+            self.logger.warning(f"MQTT alert publish to '{self.topic}' failed with return code {result.rc}")
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.mqttClient.disconnect()
+            self.mqttClient.loop_stop()
+        except Exception as ex:
+            self.logger.error(f"Error closing MQTT alert channel: {ex}")
@@ -0,0 +1,176 @@
+import time
+import threading
+from alert_channels.base import AlertChannel
+
+
+class CircuitBreaker:
+    """Stops calling a failing channel until a cool-down has passed.
+
+    Closed: calls go through. After failure_threshold consecutive failures the
+    breaker opens and calls fail fast. Once reset_seconds have passed a single
+    half-open probe is allowed; its result closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_seconds=300):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or a half-open probe is already in flight
+            return False
+
+    def remaining(self) -> float:
+        """Seconds until an open breaker lets a probe through (0 when closed)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Allows bursts of up to `burst` sends, refilled at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, per_minute)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class ResilientChannel(AlertChannel):
+    """Wraps a channel with a circuit breaker, optional rate limit and a fallback channel.
+
+    When the wrapped channel is open, rate limited or fails, the alert is handed
+    to the fallback channel (itself possibly resilient), so alerts still reach a
+    cheap local channel while the primary endpoint is down.
+    """
+
+    def __init__(self, logger, inner, breaker=None, limiter=None, fallback=None):
+        self.logger = logger
+        self.inner = inner
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+        self.fallback = fallback
+        self.max_attempts = inner.max_attempts
+        self.stats = {
+            "sent": 0,
+            "failed": 0,
+            "fast_failed": 0,
+            "rate_limited": 0,
+            "fallback_sent": 0,
+            "last_success": None,
+            "last_failure": None,
+            "last_error": None,
+        }
+        # Sends run concurrently on the dispatcher's workers
+        self._stats_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    def retry_delay(self, attempt) -> float:
+        # No fallback takes the alert while the breaker is open, so a retry before it can probe is wasted
+        return max(self.inner.retry_delay(attempt), self.breaker.remaining())
+
+    def _count(self, counter, **fields):
+        with self._stats_lock:
+            self.stats[counter] += 1
+            self.stats.update(fields)
+
+    def send(self, alert) -> bool:
+        if self.limiter is not None and not self.limiter.take():
+            self._count("rate_limited")
+            self.logger.warning(f"Alert channel {self.name} rate limited, skipping {alert.type.value}")
+            return self._send_fallback(alert)
+
+        if not self.breaker.allow():
+            self._count("fast_failed")
+            return self._send_fallback(alert)
+
+        try:
+            ok = self.inner.send(alert)
+            error = None if ok else "send returned failure"
+        except Exception as ex:
+            ok = False
+            error = str(ex)
+
+        if ok:
+            self.breaker.record_success()
+            self._count("sent", last_success=time.time())
+            return True
+
+        was_open = self.breaker.state == CircuitBreaker.OPEN
+        self.breaker.record_failure()
+        self._count("failed", last_failure=time.time(), last_error=error)
+        if not was_open and self.breaker.state == CircuitBreaker.OPEN:
+            self.logger.warning(f"Alert channel {self.name} circuit opened after {self.breaker.failures} failure(s)")
+        return self._send_fallback(alert)
+
+    def _send_fallback(self, alert) -> bool:
+        if self.fallback is None:
+            return False
+        try:
+            ok = self.fallback.send(alert)
+        except Exception as ex:
+            self.logger.error(f"Fallback alert channel {self.fallback.name} raised an exception: {ex}")
+            return False
+        if ok:
+            self._count("fallback_sent")
+        return ok
+
+    def health(self) -> dict:
+        """Circuit state and send counters for this channel and its fallbacks."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        result = {
+            "channel": self.name,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            **stats,
+        }
+        if self.fallback is not None:
+            result["fallback"] = self.fallback.health() if hasattr(self.fallback, 'health') else {"channel": self.fallback.name}
+        return result
+
+    def close(self):
+        self.inner.close()
+        if self.fallback is not None:
+            self.fallback.close()
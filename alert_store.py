@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta
+from clock import SYSTEM as SYSTEM_CLOCK
+
+ALERTS_FILE = os.path.join("data", "alerts.jsonl")
+
+
+class _Index:
+    """Positions of records sharing a key, with their timestamps for range lookups"""
+
+    def __init__(self):
+        self.positions = []
+        self.times = []
+
+    def add(self, position, timestamp):
+        self.positions.append(position)
+        self.times.append(timestamp)
+
+
+class AlertStore:
+    """
+    Append-only alert history kept as JSON lines in the Alert.to_dict shape.
+
+    Every line is also indexed in memory by time, type and valve so queries
+    never rescan the file. Clearing an active alert appends a marker line
+    ({"type", "valve_name", "timestamp", "cleared": true}) so rate-limit state
+    can be rebuilt after a restart.
+
+    Records are indexed at once and appended to the file by a background
+    writer, so alerting from a valve or timer thread never waits for disk.
+    """
+
+    def __init__(self, logger, filename=None, retention_days=90, clock=SYSTEM_CLOCK):
+        self.logger = logger
+        self.filename = filename if filename is not None else ALERTS_FILE
+        self.retention_days = retention_days
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Held for file I/O; taken before _lock when both are needed
+        self._file_lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = []
+        self._writing = False
+        self._closing = False
+        self._thread = None
+        self._reset_index()
+        self._load()
+
+    def _reset_index(self):
+        self._records = []
+        self._all = _Index()
+        self._by_type = {}
+        self._by_valve = {}
+        self._state = {}  # (type, valve_name) -> last alert time, None once cleared
+
+    def _index(self, record):
+        timestamp = datetime.fromisoformat(record["timestamp"])
+        key = (record["type"], record.get("valve_name"))
+        if record.get("cleared"):
+            self._state[key] = None
+            return
+        self._state[key] = timestamp
+
+        position = len(self._records)
+        self._records.append(record)
+        self._all.add(position, timestamp)
+        self._by_type.setdefault(record["type"], _Index()).add(position, timestamp)
+        if record.get("valve_name"):
+            self._by_valve.setdefault(record["valve_name"], _Index()).add(position, timestamp)
+
+    def _load(self):
+        if not os.path.isfile(self.filename):
+            return
+        with open(self.filename, 'r') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, KeyError) as ex:
+                    self.logger.warning(f"Skipping malformed alert history line {line_no}: {ex}")
+        self.logger.info(f"Loaded {len(self._records)} alert(s) from '{self.filename}'")
+
+    def _append(self, record):
+        # Caller holds _lock
+        self._index(record)
+        self._pending.append(json.dumps(record, default=str) + "\n")
+        if self._thread is None:
+            self._closing = False
+            self._thread = threading.Thread(target=self._writer, args=())
+            self._thread.daemon = True
+            self._thread.name = "AlertStoreTh"
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _write_pending(self):
+        # Caller holds _file_lock and _lock
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        with open(self.filename, 'a') as f:
+            f.writelines(lines)
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    self._thread = None
+                    return
+                self._writing = True
+            try:
+                with self._file_lock, self._lock:
+                    self._write_pending()
+            except Exception as ex:
+                self.logger.error(f"Failed to write alert history: {ex}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=5):
+        """Wait until every recorded line is in the file"""
+        # Waits for disk I/O, so in real time: a simulated clock stands still meanwhile
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.warning(f"Timed out writing {len(self._pending)} alert history line(s)")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5):
+        """Write what is pending and stop the writer thread"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        return flushed
+
+    def record(self, alert):
+        """Append a fired alert to the history"""
+        record = alert.to_dict()
+        with self._lock:
+            self._append(record)
+
+    def record_clear(self, alert_type, valve_name=None):
+        """Append a marker that an active alert condition has cleared"""
+        record = {
+            "type": alert_type.value,
+            "valve_name": valve_name,
+            "timestamp": self.clock.now().isoformat(),
+            "cleared": True
+        }
+        with self._lock:
+            self._append(record)
+
+    def active_state(self):
+        """Last alert time for every (type value, valve_name) not cleared since"""
+        with self._lock:
+            return {key: ts for key, ts in self._state.items() if ts is not None}
+
+    def query(self, alert_type=None, valve_name=None, since=None, limit=100):
+        """
+        Return matching alerts, newest first.
+
+        Args:
+            alert_type: AlertType value string to match
+            valve_name: Valve name to match
+            since: Only alerts at or after this datetime
+            limit: Maximum number of alerts returned
+        """
+        with self._lock:
+            if alert_type is not None and valve_name is not None:
+                by_type = self._by_type.get(alert_type)
+                by_valve = self._by_valve.get(valve_name)
+                if by_type is None or by_valve is None:
+                    return []
+                # Walk the smaller index and filter on the other key
+                index, field, value = (by_type, "valve_name", valve_name) if len(by_type.positions) <= len(by_valve.positions) \
+                    else (by_valve, "type", alert_type)
+            elif alert_type is not None:
+                index, field, value = self._by_type.get(alert_type), None, None
+            elif valve_name is not None:
+                index, field, value = self._by_valve.get(valve_name), None, None
+            else:
+                index, field, value = self._all, None, None
+
+            if index is None:
+                return []
+
+            start = bisect.bisect_left(index.times, since) if since is not None else 0
+            result = []
+            for position in reversed(index.positions[start:]):
+                record = self._records[position]
+                if field is not None and record.get(field) != value:
+                    continue
+                result.append(record)
+                if len(result) >= limit:
+                    break
+            return result
+
+    def _oldest_removable(self):
+        # Caller holds _lock. Kept alerts (one per active condition) are skipped,
+        # so this only looks past the first few entries while they lead the index.
+        for position, timestamp in zip(self._all.positions, self._all.times):
+            record = self._records[position]
+            if self._state.get((record["type"], record.get("valve_name"))) != timestamp:
+                return timestamp
+        return None
+
+    def compact(self):
+        """
+        Rewrite the history without alerts older than the retention window.
+        The last alert of a condition that never cleared is kept however old,
+        so the rate-limit state still survives the next restart.
+        """
+        cutoff = self.clock.now() - timedelta(days=self.retention_days)
+        with self._file_lock, self._lock:
+            # Nothing to do unless the oldest alert that may go has expired
+            oldest = self._oldest_removable()
+            if oldest is None or oldest >= cutoff:
+                return 0
+            self._write_pending()
+            if not os.path.isfile(self.filename):
+                return 0
+            with open(self.filename, 'r') as f:
+                lines = [line for line in f if line.strip()]
+
+            kept = []
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                    timestamp = datetime.fromisoformat(record["timestamp"])
+                    active = not record.get("cleared") and self._state.get((record["type"], record.get("valve_name"))) == timestamp
+                    if timestamp >= cutoff or active:
+                        kept.append(line)
+                except (ValueError, KeyError):
+                    continue
+            removed = len(lines) - len(kept)
+            if removed == 0:
+                return 0
+
+            tmp_filename = self.filename + ".tmp"
+            with open(tmp_filename, 'w') as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, self.filename)
+
+            self._reset_index()
+            for line in kept:
+                self._index(json.loads(line))
+
+        self.logger.info(f"Compacted alert history: removed {removed} entries older than {self.retention_days} days")
+        return removed
@@ -1,8 +1,13 @@
+import bisect
+import threading
 from enum import Enum
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, List
 from alert_channels import channelFactory
+from alert_channels.dispatcher import AlertDispatcher
+from alert_store import AlertStore
+from clock import SYSTEM as SYSTEM_CLOCK
 
 
 class AlertType(Enum):
@@ -56,10 +61,11 @@ class Alert:
 class AlertManager:
     """Manages alert notification and rate limiting"""
     
-    def __init__(self, logger, config, irrigate_instance):
+    def __init__(self, logger, config, irrigate_instance, history=None):
         self.logger = logger
         self.config = config
         self.irrigate = irrigate_instance  # Reference to Irrigate instance for schedule evaluation
+        self.clock = getattr(irrigate_instance, 'clock', SYSTEM_CLOCK)
         
         # Load alert configuration
         alerts_cfg = config.cfg.alerts
@@ -76,6 +82,13 @@ class AlertManager:
         # Other alert configuration
         self.leak_repeat_minutes = alerts_cfg.leak_repeat_minutes
         self.leak_detection_exclusions = alerts_cfg.leak_detection_exclusions
+        # Today's exclusion windows as (day, sorted starts, merged (start, end) windows)
+        self._exclusion_index = (None, [], [])
+
+        # Warning alerts of the same type and cause raised within this window are sent as one digest
+        self.aggregation_window_seconds = getattr(alerts_cfg, 'aggregation_window_seconds', 60)
+        self._digests: Dict[tuple, List[Alert]] = {}
+        self._digest_lock = threading.Lock()
 
         # Initialize alert channels
         self.channels: List = []
@@ -86,9 +99,38 @@ class AlertManager:
                 except Exception as ex:
                     logger.error(f"Failed to initialize alert channel '{getattr(channel_cfg, 'type', '?')}': {ex}")
 
+        # Channel sends run on the dispatcher's worker pool, never on the caller's thread
+        self.dispatcher = None
+        if self.channels:
+            dispatch_cfg = getattr(alerts_cfg, 'dispatch', None)
+            self.dispatcher = AlertDispatcher(
+                logger,
+                workers=getattr(dispatch_cfg, 'workers', 2),
+                queue_size=getattr(dispatch_cfg, 'queue_size', 100)
+            )
+
         # State tracking: key = (alert_type, valve_name), value = last_alerted_time
         self._alert_state: Dict[tuple, datetime] = {}
 
+        # Persistent alert history; also restores rate-limit state so a restart
+        # doesn't re-send every alert that is still active
+        self.history = None
+        history_cfg = getattr(alerts_cfg, 'history', None)
+        if getattr(history_cfg, 'enabled', True):
+            try:
+                retention_days = getattr(history_cfg, 'retention_days', 90)
+                if history is not None:
+                    # A config reload hands over the loaded history instead of re-reading the file
+                    self.history = history
+                    self.history.retention_days = retention_days
+                else:
+                    self.history = AlertStore(logger, retention_days=retention_days, clock=self.clock)
+                    self.history.compact()
+                self._restore_alert_state()
+            except Exception as ex:
+                self.history = None
+                logger.error(f"Failed to load alert history: {ex}")
+
         self.logger.info(f"AlertManager initialized with {len(self.channels)} channel(s)")
     
     def _should_alert(self, alert_type: AlertType, valve_name: Optional[str] = None) -> bool:
@@ -98,7 +140,7 @@ class AlertManager:
         # LEAK has repeat logic (every N minutes)
         if alert_type == AlertType.LEAK:
             if key in self._alert_state:
-                time_since_last = datetime.now() - self._alert_state[key]
+                time_since_last = self.clock.now() - self._alert_state[key]
                 if time_since_last < timedelta(minutes=self.leak_repeat_minutes):
                     return False
             return True
@@ -109,13 +151,34 @@ class AlertManager:
     def _record_alert(self, alert_type: AlertType, valve_name: Optional[str] = None):
         """Record that an alert was fired"""
         key = (alert_type, valve_name)
-        self._alert_state[key] = datetime.now()
+        self._alert_state[key] = self.clock.now()
     
+    def _restore_alert_state(self):
+        """Rebuild rate-limit state from alerts in the history that were never cleared"""
+        for (type_value, valve_name), last_alerted in self.history.active_state().items():
+            try:
+                alert_type = AlertType(type_value)
+            except ValueError:
+                continue
+            # A previous process's exit says nothing about this one
+            if alert_type == AlertType.SYSTEM_EXIT:
+                continue
+            self._alert_state[(alert_type, valve_name)] = last_alerted
+        if self._alert_state:
+            self.logger.info(f"Restored {len(self._alert_state)} active alert(s) from history")
+
     def clear_alert_state(self, alert_type: AlertType, valve_name: Optional[str] = None):
         """Clear alert state (e.g., when condition no longer exists)"""
         key = (alert_type, valve_name)
         if key in self._alert_state:
             del self._alert_state[key]
+            if self.history:
+                self.history.record_clear(alert_type, valve_name)
+
+    def compact_history(self):
+        """Drop history entries older than the retention window"""
+        if self.history:
+            self.history.compact()
     
     def _notify(self, alert: Alert):
         """Send notifications for an alert"""
@@ -134,35 +197,118 @@ class AlertManager:
         if alert.data:
             self.logger.info(f"  Alert data: {alert.data}")
 
-        # Dispatch to all configured channels
+        if not self.dispatcher:
+            return
+
+        if alert.severity == AlertSeverity.CRITICAL or self.aggregation_window_seconds <= 0:
+            self._dispatch(alert)
+            return
+
+        # Alerts of one type and cause within the window share a root cause (e.g. supply
+        # failure makes every running valve report no flow), so they are collected into a digest
+        key = (alert.type, self._cause(alert))
+        with self._digest_lock:
+            pending = self._digests.get(key)
+            if pending is not None:
+                pending.append(alert)
+                return
+            self._digests[key] = [alert]
+        self.dispatcher.call_later(self.aggregation_window_seconds, lambda: self._flush_digest(key))
+
+    @staticmethod
+    def _cause(alert: Alert):
+        """What an alert's condition stems from: its data's cause, else the sensor it names"""
+        data = alert.data or {}
+        return data.get("cause", data.get("sensor_name"))
+
+    def _dispatch(self, alert: Alert):
+        """Hand off to the dispatcher; critical alerts may wait briefly for queue space"""
         for channel in self.channels:
-            try:
-                channel.send(alert)
-            except Exception as ex:
-                self.logger.error(f"Alert channel {type(channel).__name__} raised an exception: {ex}")
+            self.dispatcher.submit(channel, alert, block=alert.severity == AlertSeverity.CRITICAL)
+
+    def _flush_digest(self, key: tuple):
+        """Send the alerts collected for a (type, cause) during its aggregation window"""
+        with self._digest_lock:
+            pending = self._digests.pop(key, [])
+        if len(pending) == 1:
+            self._dispatch(pending[0])
+        elif pending:
+            self._dispatch(self._build_digest(pending))
+
+    def _build_digest(self, pending: List[Alert]) -> Alert:
+        """Combine alerts of one type and cause into a single alert listing each valve's alerts"""
+        valves = list(dict.fromkeys(a.valve_name for a in pending if a.valve_name))
+        data: Dict[str, Any] = {"alert_count": len(pending), "affected_valves": valves}
+        cause = self._cause(pending[0])
+        if cause is not None:
+            data["cause"] = cause
+        for i, a in enumerate(pending):
+            data.setdefault(a.valve_name or f"alert_{i + 1}", []).append(a.data or a.message)
+        subject = f"{len(valves)} valves" if valves else f"{len(pending)} occurrences"
+        return Alert(
+            type=pending[0].type,
+            valve_name=None,
+            timestamp=pending[0].timestamp,
+            message=f"{pending[0].type.value} reported for {subject} within {self.aggregation_window_seconds}s",
+            data=data
+        )
+
+    def shutdown(self, timeout: float = 15):
+        """Deliver any queued alerts (e.g. SYSTEM_EXIT) before the process exits"""
+        if self.dispatcher:
+            self.dispatcher.shutdown(timeout)
+        for channel in self.channels:
+            channel.close()
+        if self.history:
+            self.history.close()
+
+    def channel_health(self) -> List[Dict[str, Any]]:
+        """Circuit state and send counters for each configured channel"""
+        return [channel.health() if hasattr(channel, 'health') else {"channel": channel.name} for channel in self.channels]
     
-    def is_in_exclusion_window(self, now: datetime) -> bool:
-        """Check if current time is within any leak detection exclusion window.
+    def _exclusion_windows(self, now: datetime):
+        """Return today's merged exclusion windows, compiling them once per day.
         Reuses existing schedule evaluation logic from Irrigate class."""
-        if not self.leak_detection_exclusions:
-            return False
-        
-        for exclusion_sched in self.leak_detection_exclusions:
+        day, starts, windows = self._exclusion_index
+        if day == now.date():
+            return starts, windows
+
+        intervals = []
+        for exclusion_sched in self.leak_detection_exclusions or []:
             # Check if schedule should run today (day/season filters)
             if not self.irrigate.shouldScheduleRun(exclusion_sched, check_date=now):
                 continue
-            
-            # Calculate when this exclusion window starts
             start_time = self.irrigate.calculateScheduleTime(exclusion_sched, now)
-            
-            # Calculate when it ends (start + duration)
-            end_time = start_time + timedelta(minutes=exclusion_sched.duration)
-            
-            # Check if now is within this window
-            if start_time <= now < end_time:
-                return True
-        
-        return False
+            intervals.append((start_time, start_time + timedelta(minutes=exclusion_sched.duration)))
+
+        # Merge overlaps so every point falls in at most one window
+        windows = []
+        for start_time, end_time in sorted(intervals):
+            if windows and start_time <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], max(windows[-1][1], end_time))
+            else:
+                windows.append((start_time, end_time))
+        starts = [w[0] for w in windows]
+        self._exclusion_index = (now.date(), starts, windows)
+        return starts, windows
+
+    def invalidate_exclusion_windows(self):
+        """Force today's exclusion windows to be recompiled (e.g. after a config change)"""
+        self._exclusion_index = (None, [], [])
+
+    def exclusion_windows_today(self, now: datetime) -> List[Dict[str, str]]:
+        """Today's leak detection exclusion windows, for display"""
+        _, windows = self._exclusion_windows(now)
+        return [{"start": start.isoformat(), "end": end.isoformat()} for start, end in windows]
+
+    def is_in_exclusion_window(self, now: datetime) -> bool:
+        """Check if current time is within any leak detection exclusion window"""
+        if not self.leak_detection_exclusions:
+            return False
+
+        starts, windows = self._exclusion_windows(now)
+        i = bisect.bisect_right(starts, now) - 1
+        return i >= 0 and now < windows[i][1]
     
     def alert(self, alert_type: AlertType, message: str, valve_name: Optional[str] = None, 
               data: Optional[Dict[str, Any]] = None):
@@ -175,9 +321,14 @@ class AlertManager:
             alert = Alert(
                 type=alert_type,
                 valve_name=valve_name,
-                timestamp=datetime.now(),
+                timestamp=self.clock.now(),
                 message=message,
                 data=data or {}
             )
             self._notify(alert)
             self._record_alert(alert_type, valve_name)
+            if self.history:
+                try:
+                    self.history.record(alert)
+                except Exception as ex:
+                    self.logger.error(f"Failed to write alert history: {ex}")
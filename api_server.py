@@ -5,12 +5,35 @@ from fastapi import FastAPI, HTTPException
 from fastapi.responses import PlainTextResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from schedule_simulator import ScheduleSimulator
+import engine_metrics
+import perf
+import profiler
 from datetime import datetime, timedelta
 from suntime import Sun
-import time
 
 app = FastAPI(title="Irrigate API", version="1.0.0")
 
+
+class PerfMiddleware:
+    """Times every API request into a perf probe named after its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = perf.now()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            perf.probe(f"api {scope['method']} {route.path if route is not None else 'unmatched'}").record(started)
+
+
+app.add_middleware(PerfMiddleware)
+
 # Global reference to Irrigate instance
 irrigate_instance = None
 
@@ -23,13 +46,21 @@ def invalidate_next_runs_cache():
     global next_runs_cache
     next_runs_cache["timestamp"] = 0
     next_runs_cache["data"] = None
+    # Schedules or valves changed: sensors re-plan their next fetch too
+    if irrigate_instance is not None:
+        irrigate_instance.schedulesChanged()
+
+
+def config_lock():
+    """Lock to hold while changing runtime-editable settings, so a background save never captures half an edit"""
+    return irrigate_instance.cfg.lock
 
 
 def is_cache_valid():
     """Check if the next runs cache is still valid"""
     if next_runs_cache["data"] is None:
         return False
-    age = time.time() - next_runs_cache["timestamp"]
+    age = irrigate_instance.clock.time() - next_runs_cache["timestamp"]
     return age < next_runs_cache["ttl"]
 
 
@@ -43,7 +74,7 @@ def get_next_scheduled_runs():
     
     try:
         tz = pytz.timezone(irrigate_instance.cfg.timezone)
-        now = tz.localize(datetime.now())
+        now = tz.localize(irrigate_instance.clock.now())
         tomorrow = now + timedelta(days=1)
         tomorrow_midnight = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
         
@@ -68,14 +99,8 @@ def get_next_scheduled_runs():
             valve_name = job['valve_name']
             schedule_time = job['schedule_time']
             
-            # Find the schedule index in the valve's schedules
             valve = job['valve']
             schedule_obj = job['schedule']
-            schedule_index = 0
-            for idx, sched in enumerate(valve.schedules):
-                if sched is schedule_obj:
-                    schedule_index = idx
-                    break
             
             # Only keep the earliest run for each valve
             if valve_name not in result or schedule_time < result[valve_name]['schedule_time']:
@@ -83,12 +108,13 @@ def get_next_scheduled_runs():
                     'schedule_time': schedule_time,
                     'schedule_time_iso': schedule_time.isoformat(),
                     'duration_minutes': job['duration_minutes'],
-                    'schedule_index': schedule_index
+                    'schedule_id': schedule_obj.id,
+                    'schedule_index': valve.schedulePosition(schedule_obj.id)
                 }
         
         # Update cache
         next_runs_cache["data"] = result
-        next_runs_cache["timestamp"] = time.time()
+        next_runs_cache["timestamp"] = irrigate_instance.clock.time()
         
         return result
         
@@ -108,6 +134,7 @@ async def get_full_status():
     # Return raw properties - let the UI determine status strings
     valves = []
     for name, v in irrigate_instance.valves.items():
+        v.updateProgress()
         valves.append({
             "name": name,
             "enabled": v.enabled,
@@ -144,7 +171,7 @@ async def get_full_status():
     
     # Calculate current time info, season, and sunrise/sunset
     tz = pytz.timezone(irrigate_instance.cfg.timezone)
-    now = datetime.now(tz)
+    now = tz.localize(irrigate_instance.clock.now())
     lat, lon = irrigate_instance.cfg.getLatLon()
     season = irrigate_instance.getSeason(lat, now)
     
@@ -189,13 +216,15 @@ async def get_full_status():
         "system": {
             "status": irrigate_instance._status,
             "temp_status": list(irrigate_instance._tempStatus.keys()),
-            "uptime_minutes": int((datetime.now() - irrigate_instance.startTime).total_seconds() / 60),
+            "uptime_minutes": int((irrigate_instance.clock.now() - irrigate_instance.startTime).total_seconds() / 60),
             "started_at": irrigate_instance.startTime.isoformat(),
             "current_time": now.isoformat(),
             "season": season,
             "sunrise": sunrise.isoformat(),
             "sunset": sunset.isoformat(),
-            "timezone": irrigate_instance.cfg.timezone
+            "timezone": irrigate_instance.cfg.timezone,
+            # Set while runtime edits could not be written to the config file
+            "config_save_error": irrigate_instance.cfg.save_error()
         },
         "valves": valves,
         "sensors": sensors,
@@ -211,6 +240,7 @@ async def get_valves():
     
     valves = []
     for name, v in irrigate_instance.valves.items():
+        v.updateProgress()
         valves.append({
             "name": name,
             "enabled": v.enabled,
@@ -231,12 +261,14 @@ async def get_valve_details(valve_name: str):
         raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
     
     v = irrigate_instance.valves[valve_name]
+    v.updateProgress()
     
     # Build schedules array
     schedules = []
     for i, s in enumerate(v.schedules):
         schedules.append({
             "index": i,
+            "id": s.id,
             "seasons": s.seasons if hasattr(s, 'seasons') else [],
             "days": s.days if hasattr(s, 'days') else [],
             "time_based_on": s.time_based_on,
@@ -277,7 +309,7 @@ async def get_next_runs():
     
     return {
         "next_runs": next_runs,
-        "cache_age_seconds": int(time.time() - next_runs_cache["timestamp"]) if next_runs_cache["data"] else 0,
+        "cache_age_seconds": int(irrigate_instance.clock.time() - next_runs_cache["timestamp"]) if next_runs_cache["data"] else 0,
         "cache_ttl_seconds": next_runs_cache["ttl"]
     }
 
@@ -327,7 +359,8 @@ async def get_queue():
                 "valve_name": job.valve.name,
                 "duration_minutes": job.duration,
                 "is_scheduled": job.sched is not None,
-                "schedule_index": getattr(job.sched, 'index', None) if job.sched else None
+                "schedule_id": job.sched.id if job.sched else None,
+                "schedule_index": job.valve.schedulePosition(job.sched.id) if job.sched else None
             })
         except:
             break
@@ -342,6 +375,50 @@ async def get_queue():
     }
 
 
+@app.get("/api/alerts")
+async def get_alerts(type: str = None, valve: str = None, since: str = None, limit: int = 100):
+    """Query alert history, newest first
+
+    Query parameters:
+    - type: Alert type (e.g. leak, malfunction_no_flow)
+    - valve: Valve name
+    - since: ISO datetime; only alerts at or after it
+    - limit: Maximum number of alerts (default: 100)
+    """
+    if irrigate_instance is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    
+    history = irrigate_instance.alerts.history if irrigate_instance.alerts else None
+    if history is None:
+        raise HTTPException(status_code=404, detail="Alert history is not enabled")
+    
+    since_dt = None
+    if since:
+        try:
+            since_dt = datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid since datetime: {since}")
+        # History timestamps are local and naive
+        if since_dt.tzinfo is not None:
+            since_dt = since_dt.astimezone().replace(tzinfo=None)
+    
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    
+    alerts = history.query(alert_type=type, valve_name=valve, since=since_dt, limit=limit)
+    return {"count": len(alerts), "alerts": alerts}
+
+
+@app.get("/api/alerts/channels")
+async def get_alert_channels():
+    """Get health (circuit state, send counters) of each alert channel"""
+    if irrigate_instance is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    
+    channels = irrigate_instance.alerts.channel_health() if irrigate_instance.alerts else []
+    return {"channels": channels}
+
+
 @app.get("/api/config")
 async def get_config():
     """Get system configuration (read-only)"""
@@ -365,6 +442,9 @@ async def get_config():
             "leak_repeat_minutes": alerts_cfg.leak_repeat_minutes if hasattr(alerts_cfg, 'leak_repeat_minutes') else 15,
             "irregular_flow_threshold": alerts_cfg.irregular_flow_threshold if hasattr(alerts_cfg, 'irregular_flow_threshold') else 2.0,
         }
+        if irrigate_instance.alerts:
+            tz = pytz.timezone(cfg.timezone)
+            alerts_config["exclusion_windows_today"] = irrigate_instance.alerts.exclusion_windows_today(tz.localize(irrigate_instance.clock.now()))
     
     # Get waterflow configuration
     waterflow_config = {}
@@ -425,11 +505,12 @@ async def update_alert_enabled(request: dict):
     # Update the alert manager
     from alerts import AlertType
     alert_type_enum = AlertType(alert_type)
-    irrigate_instance.alerts.enabled[alert_type_enum] = enabled
+    with config_lock():
+        irrigate_instance.alerts.enabled[alert_type_enum] = enabled
     
-    # Update config file
-    irrigate_instance.cfg.cfg.alerts.enabled.__dict__[alert_type] = enabled
-    irrigate_instance.cfg.save_runtime_config()
+        # Update config file
+        setattr(irrigate_instance.cfg.cfg.alerts.enabled, alert_type, enabled)
+        irrigate_instance.cfg.save_runtime_config()
     
     irrigate_instance.logger.info(f"Alert '{alert_type}' {'enabled' if enabled else 'disabled'}")
     
@@ -449,23 +530,37 @@ async def update_alert_setting(request: dict):
         raise HTTPException(status_code=400, detail="Missing setting or value")
     
     # Update the alert manager
-    if setting == "leak_repeat_minutes":
-        irrigate_instance.alerts.leak_repeat_minutes = int(value)
-        irrigate_instance.cfg.cfg.alerts.leak_repeat_minutes = int(value)
-    elif setting == "irregular_flow_threshold":
-        irrigate_instance.alerts.irregular_flow_threshold = float(value)
-        irrigate_instance.cfg.cfg.alerts.irregular_flow_threshold = float(value)
-    else:
-        raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
-    
-    # Save config file
-    irrigate_instance.cfg.save_runtime_config()
+    with config_lock():
+        if setting == "leak_repeat_minutes":
+            irrigate_instance.alerts.leak_repeat_minutes = int(value)
+            irrigate_instance.cfg.cfg.alerts.leak_repeat_minutes = int(value)
+        elif setting == "irregular_flow_threshold":
+            irrigate_instance.alerts.irregular_flow_threshold = float(value)
+            irrigate_instance.cfg.cfg.alerts.irregular_flow_threshold = float(value)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
+    
+        # Save config file
+        irrigate_instance.cfg.save_runtime_config()
     
     irrigate_instance.logger.info(f"Alert setting '{setting}' updated to {value}")
     
     return {"success": True, "setting": setting, "value": value}
 
 
+@app.post("/api/config/reload")
+def reload_config():
+    """Re-read the config file and apply only what changed (runs off the event loop)"""
+    if irrigate_instance is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    
+    changes = irrigate_instance.reloadConfig("API")
+    if "error" in changes:
+        raise HTTPException(status_code=400, detail=changes["error"])
+    
+    return {"success": True, "changes": changes}
+
+
 @app.post("/api/config/waterflow")
 async def update_waterflow_config(request: dict):
     """Update waterflow configuration (enabled, leak_detection)"""
@@ -482,19 +577,20 @@ async def update_waterflow_config(request: dict):
         raise HTTPException(status_code=400, detail="Missing setting or value")
     
     # Update waterflow settings
-    if setting == "enabled":
-        irrigate_instance.waterflow.enabled = bool(value)
-        irrigate_instance.cfg.cfg.waterflow.enabled = bool(value)
-        irrigate_instance.logger.info(f"Waterflow {'enabled' if value else 'disabled'} (requires restart to take effect)")
-    elif setting == "leak_detection":
-        irrigate_instance.waterflow.leakdetection = bool(value)
-        irrigate_instance.cfg.cfg.waterflow.leakdetection = bool(value)
-        irrigate_instance.logger.info(f"Waterflow leak detection {'enabled' if value else 'disabled'}")
-    else:
-        raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
-    
-    # Save config file
-    irrigate_instance.cfg.save_runtime_config()
+    with config_lock():
+        if setting == "enabled":
+            irrigate_instance.waterflow.enabled = bool(value)
+            irrigate_instance.cfg.cfg.waterflow.enabled = bool(value)
+            irrigate_instance.logger.info(f"Waterflow {'enabled' if value else 'disabled'} (requires restart to take effect)")
+        elif setting == "leak_detection":
+            irrigate_instance.waterflow.leakdetection = bool(value)
+            irrigate_instance.cfg.cfg.waterflow.leakdetection = bool(value)
+            irrigate_instance.logger.info(f"Waterflow leak detection {'enabled' if value else 'disabled'}")
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
+    
+        # Save config file
+        irrigate_instance.cfg.save_runtime_config()
     
     return {"success": True, "setting": setting, "value": value}
 
@@ -526,28 +622,29 @@ async def update_sensor_config(sensor_name: str, request: dict):
         raise HTTPException(status_code=404, detail=f"Sensor config for '{sensor_name}' not found")
     
     # Update sensor-specific settings
-    if sensor.type == 'OpenWeatherMap':
-        if setting == "precip_days":
-            sensor.precip_days = int(value)
-            if not hasattr(sensor_cfg, 'precipitation'):
-                from types import SimpleNamespace
-                sensor_cfg.precipitation = SimpleNamespace()
-            sensor_cfg.precipitation.days_to_aggregate = int(value)
-            irrigate_instance.logger.info(f"Sensor '{sensor_name}' precipitation days updated to {value}")
-        elif setting == "precip_threshold":
-            sensor.precip_threshold = float(value)
-            if not hasattr(sensor_cfg, 'precipitation'):
-                from types import SimpleNamespace
-                sensor_cfg.precipitation = SimpleNamespace()
-            sensor_cfg.precipitation.disable_threshold_mm = float(value)
-            irrigate_instance.logger.info(f"Sensor '{sensor_name}' precipitation threshold updated to {value}mm")
+    with config_lock():
+        if sensor.type == 'OpenWeatherMap':
+            if setting == "precip_days":
+                sensor.precip_days = int(value)
+                if not hasattr(sensor_cfg, 'precipitation'):
+                    from types import SimpleNamespace
+                    sensor_cfg.precipitation = SimpleNamespace()
+                sensor_cfg.precipitation.days_to_aggregate = int(value)
+                irrigate_instance.logger.info(f"Sensor '{sensor_name}' precipitation days updated to {value}")
+            elif setting == "precip_threshold":
+                sensor.precip_threshold = float(value)
+                if not hasattr(sensor_cfg, 'precipitation'):
+                    from types import SimpleNamespace
+                    sensor_cfg.precipitation = SimpleNamespace()
+                sensor_cfg.precipitation.disable_threshold_mm = float(value)
+                irrigate_instance.logger.info(f"Sensor '{sensor_name}' precipitation threshold updated to {value}mm")
+            else:
+                raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
         else:
-            raise HTTPException(status_code=400, detail=f"Unknown setting: {setting}")
-    else:
-        raise HTTPException(status_code=400, detail=f"Sensor type '{sensor.type}' settings not supported")
+            raise HTTPException(status_code=400, detail=f"Sensor type '{sensor.type}' settings not supported")
     
-    # Save config file
-    irrigate_instance.cfg.save_runtime_config()
+        # Save config file
+        irrigate_instance.cfg.save_runtime_config()
     
     return {"success": True, "sensor": sensor_name, "setting": setting, "value": value}
 
@@ -583,7 +680,7 @@ async def queue_valve(valve_name: str, duration_minutes: float):
         raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
     
     valve = irrigate_instance.valves[valve_name]
-    job = model.Job(valve=valve, duration=duration_minutes, sched=None)
+    job = model.Job(valve=valve, duration=duration_minutes, sched=None, trigger="api")
     irrigate_instance.queueJob(job)
     
     return {
@@ -591,7 +688,7 @@ async def queue_valve(valve_name: str, duration_minutes: float):
         "valve": valve_name,
         "duration_minutes": duration_minutes,
         "action": "queued",
-        "queued_at": datetime.now().isoformat()
+        "queued_at": irrigate_instance.clock.now().isoformat()
     }
 
 
@@ -626,10 +723,11 @@ async def enable_valve(valve_name: str):
         raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
     
     valve = irrigate_instance.valves[valve_name]
-    valve.enabled = True
+    with config_lock():
+        valve.enabled = True
     
-    # Persist changes to config file
-    irrigate_instance.cfg.save_runtime_config()
+        # Persist changes to config file
+        irrigate_instance.cfg.save_runtime_config()
     
     irrigate_instance.logger.info(f"Valve '{valve_name}' enabled")
     
@@ -648,10 +746,11 @@ async def disable_valve(valve_name: str):
         raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
     
     valve = irrigate_instance.valves[valve_name]
-    valve.enabled = False
+    with config_lock():
+        valve.enabled = False
     
-    # Persist changes to config file
-    irrigate_instance.cfg.save_runtime_config()
+        # Persist changes to config file
+        irrigate_instance.cfg.save_runtime_config()
     
     irrigate_instance.logger.info(f"Valve '{valve_name}' disabled")
     
@@ -660,6 +759,34 @@ async def disable_valve(valve_name: str):
     return {"success": True, "valve": valve_name, "action": "disabled"}
 
 
+def find_schedule_position(valve_name: str, schedule_index: int = None, schedule_id: int = None):
+    """Resolve a schedule by list position or stable id to (valve, position), raising 404 if missing"""
+    if irrigate_instance is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    
+    if valve_name not in irrigate_instance.valves:
+        raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
+    
+    valve = irrigate_instance.valves[valve_name]
+    
+    if schedule_id is not None:
+        position = valve.schedulePosition(schedule_id)
+        if position is None:
+            raise HTTPException(status_code=404, detail=f"Schedule id {schedule_id} not found for valve '{valve_name}'")
+        return valve, position
+    
+    if schedule_index < 0 or schedule_index >= len(valve.schedules):
+        raise HTTPException(status_code=404, detail=f"Schedule index {schedule_index} not found for valve '{valve_name}'")
+    return valve, schedule_index
+
+
+@app.put("/api/valves/{valve_name}/schedules/by-id/{schedule_id}")
+async def update_valve_schedule_by_id(valve_name: str, schedule_id: int, schedule_data: dict):
+    """Update a schedule by its stable id (see update_valve_schedule for the body)"""
+    valve, schedule_index = find_schedule_position(valve_name, schedule_id=schedule_id)
+    return update_schedule(valve, schedule_index, schedule_data)
+
+
 @app.put("/api/valves/{valve_name}/schedules/{schedule_index}")
 async def update_valve_schedule(valve_name: str, schedule_index: int, schedule_data: dict):
     """Update a specific schedule for a valve
@@ -675,43 +802,39 @@ async def update_valve_schedule(valve_name: str, schedule_index: int, schedule_d
         "enable_uv_adjustments": true     // optional
     }
     """
-    if irrigate_instance is None:
-        raise HTTPException(status_code=503, detail="System not initialized")
-    
-    if valve_name not in irrigate_instance.valves:
-        raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
-    
-    valve = irrigate_instance.valves[valve_name]
-    
-    if schedule_index < 0 or schedule_index >= len(valve.schedules):
-        raise HTTPException(status_code=404, detail=f"Schedule index {schedule_index} not found for valve '{valve_name}'")
-    
+    valve, schedule_index = find_schedule_position(valve_name, schedule_index)
+    return update_schedule(valve, schedule_index, schedule_data)
+
+
+def update_schedule(valve, schedule_index: int, schedule_data: dict):
+    valve_name = valve.name
     try:
         # Update the schedule object in memory
-        sched = valve.schedules[schedule_index]
-        
-        # Update fields that are provided
-        if "seasons" in schedule_data:
-            sched.seasons = schedule_data["seasons"]
-        if "days" in schedule_data:
-            sched.days = schedule_data["days"]
-        if "time_based_on" in schedule_data:
-            sched.time_based_on = schedule_data["time_based_on"]
-        if "fixed_start_time" in schedule_data:
-            sched.fixed_start_time = schedule_data["fixed_start_time"]
-        if "offset_minutes" in schedule_data:
-            sched.offset_minutes = schedule_data["offset_minutes"]
-        if "duration" in schedule_data:
-            sched.duration = schedule_data["duration"]
-        if "enable_uv_adjustments" in schedule_data:
-            sched.enable_uv_adjustments = schedule_data["enable_uv_adjustments"]
-        
-        # Validate the schedule
-        if sched.time_based_on == "fixed" and not hasattr(sched, 'fixed_start_time'):
-            raise HTTPException(status_code=400, detail="fixed_start_time is required when time_based_on is 'fixed'")
+        with config_lock():
+            sched = valve.schedules[schedule_index]
         
-        # Persist changes to config file
-        irrigate_instance.cfg.save_runtime_config()
+            # Update fields that are provided
+            if "seasons" in schedule_data:
+                sched.seasons = schedule_data["seasons"]
+            if "days" in schedule_data:
+                sched.days = schedule_data["days"]
+            if "time_based_on" in schedule_data:
+                sched.time_based_on = schedule_data["time_based_on"]
+            if "fixed_start_time" in schedule_data:
+                sched.fixed_start_time = schedule_data["fixed_start_time"]
+            if "offset_minutes" in schedule_data:
+                sched.offset_minutes = schedule_data["offset_minutes"]
+            if "duration" in schedule_data:
+                sched.duration = schedule_data["duration"]
+            if "enable_uv_adjustments" in schedule_data:
+                sched.enable_uv_adjustments = schedule_data["enable_uv_adjustments"]
+        
+            # Validate the schedule
+            if sched.time_based_on == "fixed" and not hasattr(sched, 'fixed_start_time'):
+                raise HTTPException(status_code=400, detail="fixed_start_time is required when time_based_on is 'fixed'")
+        
+            # Persist changes to config file
+            irrigate_instance.cfg.save_runtime_config()
         
         irrigate_instance.logger.info(f"Updated schedule {schedule_index} for valve '{valve_name}'")
         
@@ -721,6 +844,7 @@ async def update_valve_schedule(valve_name: str, schedule_index: int, schedule_d
             "success": True,
             "valve": valve_name,
             "schedule_index": schedule_index,
+            "schedule_id": sched.id,
             "action": "schedule_updated"
         }
         
@@ -774,10 +898,11 @@ async def create_valve_schedule(valve_name: str, schedule_data: dict):
             new_schedule.offset_minutes = schedule_data.get("offset_minutes", 0)
         
         # Add the new schedule to the valve
-        valve.schedules.append(new_schedule)
+        with config_lock():
+            schedule_id = valve.addSchedule(new_schedule)
         
-        # Persist changes to config file
-        irrigate_instance.cfg.save_runtime_config()
+            # Persist changes to config file
+            irrigate_instance.cfg.save_runtime_config()
         
         schedule_index = len(valve.schedules) - 1
         irrigate_instance.logger.info(f"Created new schedule {schedule_index} for valve '{valve_name}'")
@@ -788,6 +913,7 @@ async def create_valve_schedule(valve_name: str, schedule_data: dict):
             "success": True,
             "valve": valve_name,
             "schedule_index": schedule_index,
+            "schedule_id": schedule_id,
             "action": "schedule_created"
         }
         
@@ -798,29 +924,32 @@ async def create_valve_schedule(valve_name: str, schedule_data: dict):
         raise HTTPException(status_code=400, detail=str(ex))
 
 
+@app.delete("/api/valves/{valve_name}/schedules/by-id/{schedule_id}")
+async def delete_valve_schedule_by_id(valve_name: str, schedule_id: int):
+    """Delete a schedule by its stable id"""
+    valve, schedule_index = find_schedule_position(valve_name, schedule_id=schedule_id)
+    return delete_schedule(valve, schedule_index)
+
+
 @app.delete("/api/valves/{valve_name}/schedules/{schedule_index}")
 async def delete_valve_schedule(valve_name: str, schedule_index: int):
     """Delete a specific schedule from a valve"""
-    if irrigate_instance is None:
-        raise HTTPException(status_code=503, detail="System not initialized")
-    
-    if valve_name not in irrigate_instance.valves:
-        raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
-    
-    valve = irrigate_instance.valves[valve_name]
-    
-    if schedule_index < 0 or schedule_index >= len(valve.schedules):
-        raise HTTPException(status_code=404, detail=f"Schedule index {schedule_index} not found for valve '{valve_name}'")
-    
+    valve, schedule_index = find_schedule_position(valve_name, schedule_index)
+    return delete_schedule(valve, schedule_index)
+
+
+def delete_schedule(valve, schedule_index: int):
+    valve_name = valve.name
     if len(valve.schedules) == 1:
         raise HTTPException(status_code=400, detail=f"Cannot delete the last schedule for valve '{valve_name}'. A valve must have at least one schedule.")
     
     try:
         # Remove the schedule
-        deleted_schedule = valve.schedules.pop(schedule_index)
+        with config_lock():
+            deleted_schedule = valve.removeSchedule(schedule_index)
         
-        # Persist changes to config file
-        irrigate_instance.cfg.save_runtime_config()
+            # Persist changes to config file
+            irrigate_instance.cfg.save_runtime_config()
         
         irrigate_instance.logger.info(f"Deleted schedule {schedule_index} from valve '{valve_name}'")
         
@@ -830,6 +959,7 @@ async def delete_valve_schedule(valve_name: str, schedule_index: int):
             "success": True,
             "valve": valve_name,
             "schedule_index": schedule_index,
+            "schedule_id": deleted_schedule.id,
             "action": "schedule_deleted",
             "remaining_schedules": len(valve.schedules)
         }
@@ -852,10 +982,11 @@ async def update_valve_enabled(valve_name: str, enabled: bool):
         raise HTTPException(status_code=404, detail=f"Valve '{valve_name}' not found")
     
     valve = irrigate_instance.valves[valve_name]
-    valve.enabled = enabled
+    with config_lock():
+        valve.enabled = enabled
     
-    # Persist changes to config file
-    irrigate_instance.cfg.save_runtime_config()
+        # Persist changes to config file
+        irrigate_instance.cfg.save_runtime_config()
     
     irrigate_instance.logger.info(f"Valve '{valve_name}' enabled status set to {enabled}")
     
@@ -869,6 +1000,62 @@ async def update_valve_enabled(valve_name: str, enabled: bool):
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Engine internals in the Prometheus text exposition format"""
+    return PlainTextResponse(engine_metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/debug/perf")
+def get_debug_perf():
+    """p50/p99/max (ms) of every timing probe, with the measured cost of a probe"""
+    return {
+        "probe_overhead_ns": round(perf.overhead(1000)),
+        "probes": perf.snapshot(),
+    }
+
+
+@app.get("/api/debug/profile", response_class=PlainTextResponse)
+def get_debug_profile(seconds: float = 10, interval_ms: float = 5):
+    """
+    Sample the stacks of all threads for a while and return them collapsed
+    (one "Thread;file:func;... count" line per stack) for flame graph tools
+
+    Query parameters:
+    - seconds: How long to sample (default: 10, max: 300)
+    - interval_ms: Time between samples (default: 5)
+    """
+    if not 0 < seconds <= profiler.MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {profiler.MAX_SECONDS}")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+
+    try:
+        stacks, rounds = profiler.sample(seconds, interval_ms / 1000)
+    except profiler.ProfilerBusy as ex:
+        raise HTTPException(status_code=409, detail=str(ex))
+
+    return PlainTextResponse(profiler.collapse(stacks), headers={"X-Profile-Samples": str(rounds)})
+
+
+@app.get("/api/metrics/report")
+def get_metrics_report(weeks: int = 12, months: int = 12, cycles: int = 5, archive: bool = False):
+    """
+    Fleet-wide flow analytics: per-valve baselines, trends, z-scores of recent
+    cycles, seasonal comparison and weekly/monthly water totals
+
+    Query parameters:
+    - weeks: Number of most recent weekly totals (default: 12)
+    - months: Number of most recent monthly totals (default: 12)
+    - cycles: Number of most recent cycles scored per valve (default: 5)
+    - archive: Include the compressed monthly archives of older history (default: false)
+    """
+    if irrigate_instance is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+
+    return irrigate_instance.metricsReport(archive=archive, weeks=weeks, months=months, recent_cycles=cycles)
+
+
 @app.post("/api/simulate", response_class=PlainTextResponse)
 async def simulate_schedule(
     date: str = None,
@@ -0,0 +1,142 @@
+"""
+Configuration startup benchmark.
+
+Times loading a generated configuration the way Config did before (fresh
+jsonschema.validate plus a JSON round-trip into SimpleNamespace) against the
+current Config: a first (cold) load and repeated reloads of unchanged content.
+Daemon starts are timed in fresh interpreters: the legacy load, and Config
+without and with the record of the last validated config (a first start vs a
+restart with unchanged config). The cold-start comparison is the legacy and
+first-start lines; both include importing config.
+Also times the runtime operations that depend on the config model: writing
+runtime edits back, resolving schedules by id and valves by MQTT topic name.
+
+Usage: python bench_startup.py [valves] [repeats]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from jsonschema import validate
+
+import config
+from config import topicName
+
+def makeConfig(valves):
+  return {
+    "timezone": "Asia/Jerusalem",
+    "max_concurrent_valves": 2,
+    "location": {"latitude": 32.0, "longitude": 34.8},
+    "mqtt": {"enabled": False, "client_name": "bench", "hostname": "localhost"},
+    "telemetry": {"enabled": False},
+    "sensors": [],
+    "alerts": {"enabled": {"leak": True, "malfunction_no_flow": True, "irregular_flow": True, "sensor_error": True, "system_exit": True}},
+    "valves": [{
+      "name": f"Valve{i}",
+      "enabled": True,
+      "type": "3wire",
+      "gpio_on_pin": 1,
+      "gpio_off_pin": 2,
+      "watering_mode": "duration",
+      "schedules": [
+        {"time_based_on": "fixed", "fixed_start_time": f"{h:02d}:{i % 60:02d}", "duration": 10, "days": ["Sun", "Wed"], "enable_uv_adjustments": False}
+        for h in (5, 11, 17, 21)
+      ]
+    } for i in range(valves)]
+  }
+
+def legacyLoad(filename, schemaPath):
+  with open(filename, 'r') as stream:
+    data = json.loads(stream.read())
+  with open(schemaPath, 'r') as schemaFile:
+    validate(instance=data, schema=json.load(schemaFile))
+  return json.loads(json.dumps(data), object_hook=lambda d: SimpleNamespace(**d))
+
+# Run in a new interpreter: import config and load the file, printing the ms spent
+FRESH_LOAD = """
+import sys, time, logging
+started = time.perf_counter()
+import config
+config.Config(logging.getLogger("bench"), sys.argv[1])
+print((time.perf_counter() - started) * 1000)
+"""
+
+# The same in a new interpreter with the legacy load
+FRESH_LEGACY = """
+import sys, time
+started = time.perf_counter()
+import config
+import bench_startup
+bench_startup.legacyLoad(sys.argv[1], sys.argv[2])
+print((time.perf_counter() - started) * 1000)
+"""
+
+def freshLoad(filename, keepValidated, repeats, script = FRESH_LOAD, *args):
+  here = os.path.dirname(os.path.abspath(__file__))
+  total = 0.0
+  for _ in range(repeats):
+    if not keepValidated and os.path.exists(filename + ".validated"):
+      os.remove(filename + ".validated")
+    out = subprocess.run([sys.executable, "-c", script, filename, *args], cwd=here, check=True, capture_output=True, text=True)
+    total += float(out.stdout.split()[-1])
+  return total / repeats
+
+def timeit(fn, repeats):
+  start = time.perf_counter()
+  for _ in range(repeats):
+    fn()
+  return (time.perf_counter() - start) / repeats * 1000
+
+def main(argv):
+  valves = int(argv[0]) if len(argv) > 0 else 500
+  repeats = int(argv[1]) if len(argv) > 1 else 20
+  logger = logging.getLogger("bench")
+  logger.addHandler(logging.NullHandler())
+  logger.propagate = False
+
+  tmpDir = tempfile.mkdtemp()
+  try:
+    schemaPath = os.path.join(tmpDir, 'config.schema.json')
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.schema.json'), schemaPath)
+    filename = os.path.join(tmpDir, 'config.json')
+    with open(filename, 'w') as f:
+      json.dump(makeConfig(valves), f)
+
+    legacy = timeit(lambda: legacyLoad(filename, schemaPath), repeats)
+    legacyStart = freshLoad(filename, False, min(repeats, 5), FRESH_LEGACY, schemaPath)
+    firstStart = freshLoad(filename, False, min(repeats, 5))
+    restart = freshLoad(filename, True, min(repeats, 5))
+    os.remove(filename + ".validated")
+    cold = timeit(lambda: config.Config(logger, filename), 1)
+    warm = timeit(lambda: config.Config(logger, filename), repeats)
+
+    cfg = config.Config(logger, filename)
+    cfg.backups = 0
+    save = timeit(cfg.write_runtime_config, repeats)
+    schedules = [(valve, sched) for valve in cfg.valves.values() for sched in valve.schedules]
+    scanLookup = timeit(lambda: [next(i for i, s in enumerate(valve.schedules) if s is sched) for valve, sched in schedules], repeats)
+    idLookup = timeit(lambda: [valve.schedulePosition(sched.id) for valve, sched in schedules], repeats)
+    topics = {topicName(name): name for name in cfg.valves}
+    topicLookup = timeit(lambda: [topics[topicName(name)] for name in cfg.valves], repeats)
+  finally:
+    shutil.rmtree(tmpDir)
+
+  print(f"{valves} valves x 4 schedules, {repeats} repeats, validator: {'fastjsonschema' if config.fastjsonschema else 'jsonschema'}")
+  print(f"  legacy load (validate + round-trip): {legacy:8.2f} ms")
+  print(f"  new process, legacy load:            {legacyStart:8.2f} ms")
+  print(f"  new process, first start:            {firstStart:8.2f} ms")
+  print(f"  new process, restart (unchanged):    {restart:8.2f} ms")
+  print(f"  Config first load:                   {cold:8.2f} ms")
+  print(f"  Config reload (unchanged):           {warm:8.2f} ms")
+  print(f"  write_runtime_config:                {save:8.2f} ms")
+  print(f"  {len(schedules)} schedule positions, scan:       {scanLookup:8.2f} ms")
+  print(f"  {len(schedules)} schedule positions, by id:      {idLookup:8.2f} ms")
+  print(f"  {len(topics)} MQTT topic -> valve lookups:      {topicLookup:8.2f} ms")
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,196 @@
+"""
+Time source of the engine.
+
+Irrigate, its valve and timer threads, the valves, sensors, waterflow meters,
+background savers, AlertManager and the API read the time and sleep through a
+Clock instead of datetime/time directly.
+SYSTEM is the real clock. VirtualClock runs simulated time: sleeping threads
+are woken in order of their wake-up times as soon as every participating
+thread is asleep, so an hour of operation costs only the work done in it.
+Time jumps straight to the next wake-up, however far away it is; a thread
+blocked in get(), wait() or waitCondition() is also woken as soon as it can
+go on.
+
+  clock = VirtualClock(datetime(2024, 5, 1, 4, 0))
+  irrigate = Irrigate("config.json", clock=clock)
+  irrigate.start()
+  clock.advance(3 * 3600)
+"""
+import time
+import queue
+import threading
+from datetime import datetime, timedelta
+
+class Clock():
+  """The real clock"""
+  def now(self):
+    return datetime.now()
+
+  def time(self):
+    return time.time()
+
+  def monotonic(self):
+    return time.monotonic()
+
+  def sleep(self, seconds):
+    time.sleep(seconds)
+
+  def get(self, q, timeout, cancel = None):
+    """
+    q.get(timeout=timeout), raising queue.Empty after timeout seconds of this
+    clock (None waits for good) or once the cancel event is set; whoever sets
+    it calls interrupt(q) to wake the waiting threads.
+    """
+    if cancel is None:
+      return q.get(timeout=timeout)
+    # Queue.get, except that interrupt() also wakes it
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with q.not_empty:
+      while not q._qsize():
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if cancel.is_set() or (remaining is not None and remaining <= 0):
+          raise queue.Empty
+        q.not_empty.wait(remaining)
+      item = q._get()
+      q.not_full.notify()
+      return item
+
+  def interrupt(self, q):
+    """Wake the threads blocked in get(q) so they check their cancel event"""
+    with q.not_empty:
+      q.not_empty.notify_all()
+
+  def wait(self, event, timeout):
+    """event.wait(timeout) with timeout in seconds of this clock (None waits for good)"""
+    return event.wait(timeout)
+
+  def waitCondition(self, cond, timeout, ready):
+    """
+    cond.wait(timeout) by a thread holding cond, with timeout in seconds of
+    this clock (None waits for good); ready() tells when the thread can go on.
+    """
+    return cond.wait(timeout)
+
+  def notify(self, cond):
+    """cond.notify_all() by a thread holding cond, also waking waitCondition(cond)"""
+    cond.notify_all()
+
+  def attach(self, thread):
+    """Declare a started thread that keeps time through this clock"""
+    pass
+
+SYSTEM = Clock()
+
+class VirtualClock(Clock):
+  """
+  Simulated time, moved forward only by advance(). Threads join the
+  simulation when attached or on their first sleep() and leave when they
+  exit. A thread busy outside the clock (real I/O) is waited for up to
+  settleSeconds of real time per step before time moves on without it.
+  """
+  def __init__(self, start = None, settleSeconds = 5.0):
+    self.start = start if start is not None else datetime.now().replace(microsecond=0)
+    self.settleSeconds = settleSeconds
+    self._elapsed = 0.0
+    self._cond = threading.Condition()
+    self._threads = {}
+    self._wakeAt = {}
+    self._ready = {}  # thread ident -> callable, true once a blocked get()/wait() can return
+
+  def now(self):
+    return self.start + timedelta(seconds=self._elapsed)
+
+  def time(self):
+    return self.now().timestamp()
+
+  def monotonic(self):
+    return self._elapsed
+
+  def _block(self, seconds, ready = None):
+    me = threading.current_thread()
+    with self._cond:
+      self._threads[me.ident] = me
+      wakeAt = float('inf') if seconds is None else self._elapsed + max(seconds, 0)
+      self._wakeAt[me.ident] = wakeAt
+      if ready is not None:
+        self._ready[me.ident] = ready
+      self._cond.notify_all()
+      while self._elapsed < wakeAt and not (ready is not None and ready()):
+        self._cond.wait()
+      del self._wakeAt[me.ident]
+      self._ready.pop(me.ident, None)
+      self._cond.notify_all()
+
+  def sleep(self, seconds):
+    self._block(seconds)
+
+  def get(self, q, timeout, cancel = None):
+    deadline = float('inf') if timeout is None else self._elapsed + timeout
+    while True:
+      try:
+        return q.get_nowait()
+      except queue.Empty:
+        if self._elapsed >= deadline or (cancel is not None and cancel.is_set()):
+          raise
+        # Another worker may take the item first; then this one blocks again
+        self._block(deadline - self._elapsed, lambda: not q.empty() or (cancel is not None and cancel.is_set()))
+
+  def interrupt(self, q):
+    with self._cond:
+      self._cond.notify_all()
+
+  def wait(self, event, timeout):
+    if not event.is_set():
+      self._block(timeout, event.is_set)
+    return event.is_set()
+
+  def waitCondition(self, cond, timeout, ready):
+    if ready():
+      return True
+    cond.release()
+    try:
+      self._block(timeout, ready)
+    finally:
+      cond.acquire()
+    return ready()
+
+  def notify(self, cond):
+    cond.notify_all()
+    with self._cond:
+      self._cond.notify_all()
+
+  def attach(self, thread):
+    with self._cond:
+      self._threads[thread.ident] = thread
+
+  def _settled(self):
+    for ident, thread in list(self._threads.items()):
+      if not thread.is_alive():
+        del self._threads[ident]
+        self._wakeAt.pop(ident, None)
+      elif self._wakeAt.get(ident, self._elapsed) <= self._elapsed:
+        return False
+      elif ident in self._ready and self._ready[ident]():
+        # Fed from outside the clock (a put or set doesn't notify): wake it now
+        self._cond.notify_all()
+        return False
+    return True
+
+  def _settle(self):
+    # Exiting threads and puts don't notify, so the condition is also re-checked every 10 ms
+    deadline = time.monotonic() + self.settleSeconds
+    while not self._settled() and time.monotonic() < deadline:
+      self._cond.wait(0.01)
+
+  def advance(self, seconds):
+    """Run simulated time forward by seconds, waking each sleeper at its time"""
+    with self._cond:
+      target = self._elapsed + seconds
+      while True:
+        self._settle()
+        wakeAt = min((w for w in self._wakeAt.values() if w > self._elapsed), default=None)
+        if wakeAt is None or wakeAt > target:
+          self._elapsed = target
+          return
+        self._elapsed = wakeAt
+        self._cond.notify_all()
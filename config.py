@@ -1,11 +1,220 @@
 import json
 import os
+import time
+import shutil
+import hashlib
+import threading
+import perf
 import model
+import valve_metrics
 from valves import valveFactory
+from clock import SYSTEM as SYSTEM_CLOCK
 from types import SimpleNamespace
 from sensors.base_sensor import sensorFactory
 from waterflows import waterflowFactory
-from jsonschema import validate, ValidationError, SchemaError
+from jsonschema import ValidationError, SchemaError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+try:
+  import fastjsonschema
+except ImportError:
+  fastjsonschema = None
+
+SAVE_PROBE = perf.probe("config.save_runtime_config")
+WRITE_PROBE = perf.probe("config.write_runtime_config")
+
+class ConfigNode:
+  """Base of the config object classes generated from the schema (one per object definition)"""
+  __slots__ = ()
+
+  def __repr__(self):
+    fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if hasattr(self, name))
+    return f"{type(self).__name__}({fields})"
+
+class _CompiledSchema:
+  """
+  A loaded schema with its validators, generated node classes and validated
+  config hashes. With fastjsonschema installed configs are checked by code
+  generated from the schema, several times faster than jsonschema; jsonschema
+  is only built to explain a failure (or when fastjsonschema is missing).
+  """
+  def __init__(self, path, mtime):
+    with open(path, 'rb') as schema_file:
+      raw = schema_file.read()
+    self.schema = json.loads(raw)
+    self.digest = hashlib.sha256(raw).hexdigest()
+    self.mtime = mtime
+    self.nodeClasses = {}  # id(object schema) -> ConfigNode subclass, None if unusable
+    self.validated = {}  # config filename -> sha256 of the content last validated
+    # Both built on first use: a restart with an unchanged config needs neither
+    self._validator = None
+    self._fastValidator = None
+
+  @property
+  def validator(self):
+    if self._validator is None:
+      validatorClass = validator_for(self.schema)
+      validatorClass.check_schema(self.schema)
+      self._validator = validatorClass(self.schema)
+    return self._validator
+
+  def bestError(self, instance):
+    """The most relevant ValidationError of instance, or None when it is valid"""
+    if fastjsonschema is not None and self._fastValidator is None:
+      try:
+        # use_default=False: validation must not fill defaults into the config
+        self._fastValidator = fastjsonschema.compile(self.schema, use_default=False)
+      except fastjsonschema.JsonSchemaDefinitionException:
+        self._fastValidator = False  # jsonschema reports what is wrong with the schema
+    if self._fastValidator:
+      try:
+        self._fastValidator(instance)
+        return None
+      except fastjsonschema.JsonSchemaValueException:
+        pass  # jsonschema explains the failure
+    return best_match(self.validator.iter_errors(instance))
+
+  def resolve(self, schema):
+    while schema is not None and "$ref" in schema:
+      node = self.schema
+      for part in schema["$ref"].lstrip("#/").split("/"):
+        node = node[part]
+      schema = node
+    return schema
+
+  def nodeClass(self, schema, name):
+    """
+    ConfigNode subclass whose slots are every property the object schema
+    declares, or None if a property isn't a valid attribute name
+    """
+    key = id(schema)
+    if key not in self.nodeClasses:
+      properties = schema["properties"]
+      ok = all(prop.isidentifier() for prop in properties)
+      self.nodeClasses[key] = type(name, (ConfigNode,), {"__slots__": tuple(properties)}) if ok else None
+    return self.nodeClasses[key]
+
+# Shared by every Config loaded in this process, so reloads skip recompiling the schema
+_schemas = {}
+_schemasLock = threading.Lock()
+
+def _compiledSchema(path):
+  mtime = os.stat(path).st_mtime_ns
+  with _schemasLock:
+    compiled = _schemas.get(path)
+    if compiled is None or compiled.mtime != mtime:
+      compiled = _CompiledSchema(path, mtime)
+      _schemas[path] = compiled
+    return compiled
+
+def buildConfig(value, schema = None, compiled = None, name = "Cfg"):
+  """
+  Turn parsed JSON into config objects in one pass. Objects whose schema lists
+  every key they use become ConfigNode instances with __slots__ for all the
+  declared properties (so optional ones can still be set later); anything else
+  becomes a SimpleNamespace.
+  """
+  if compiled is not None:
+    schema = compiled.resolve(schema)
+
+  if isinstance(value, dict):
+    properties = schema.get("properties") if schema else None
+    cls = compiled.nodeClass(schema, name) if properties else None
+    if cls is not None and value.keys() <= properties.keys():
+      obj = cls()
+    else:
+      obj = SimpleNamespace()
+      properties = properties or {}
+    for key, item in value.items():
+      if isinstance(item, (dict, list)):
+        item = buildConfig(item, properties.get(key), compiled, name + key.title().replace("_", ""))
+      setattr(obj, key, item)
+    return obj
+
+  if isinstance(value, list):
+    items = schema.get("items") if schema else None
+    return [buildConfig(item, items, compiled, name) for item in value]
+
+  return value
+
+def indexByName(items):
+  """Map the 'name' of each config entry (valve, sensor) to the entry"""
+  return {item["name"]: item for item in items or []}
+
+def topicName(name):
+  """Form of a valve or sensor name used as an MQTT topic level"""
+  return name.replace(' ', '_')
+
+class ConfigSaver:
+  """
+  Persists runtime config edits on a background thread. Requests arriving
+  within debounce seconds of the first pending one are coalesced into a single
+  write, so API handlers return as soon as the in-memory state is updated.
+  """
+  def __init__(self, logger, write, debounce = 2.0, clock = SYSTEM_CLOCK):
+    self.logger = logger
+    self.write = write
+    self.debounce = debounce
+    # Times the debounce; waits for the write itself are in real time
+    self.clock = clock
+    self._cond = threading.Condition()
+    self._dueAt = None
+    self._writing = False
+    self._thread = None
+    # Message of the last failed write; None once a write succeeds
+    self.error = None
+
+  def request(self):
+    with self._cond:
+      if self._dueAt is None:
+        self._dueAt = self.clock.monotonic() + self.debounce
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._saverThread, args=())
+        self._thread.daemon = True
+        self._thread.name = "CfgSaveTh"
+        self._thread.start()
+      self.clock.notify(self._cond)
+
+  def pending(self):
+    with self._cond:
+      return self._dueAt is not None or self._writing
+
+  def flush(self, timeout = 10):
+    """Write any pending edits now and wait for them to reach the disk; False if they did not"""
+    deadline = time.monotonic() + timeout
+    with self._cond:
+      if self._dueAt is not None:
+        self._dueAt = self.clock.monotonic()
+        self.clock.notify(self._cond)
+      while self._dueAt is not None or self._writing:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          self.logger.warning("Timed out waiting for the configuration to be saved")
+          return False
+        self._cond.wait(remaining)
+      return self.error is None
+
+  def _due(self):
+    return self._dueAt is not None and self._dueAt <= self.clock.monotonic()
+
+  def _saverThread(self):
+    while True:
+      with self._cond:
+        while not self._due():
+          self.clock.waitCondition(self._cond, None if self._dueAt is None else self._dueAt - self.clock.monotonic(), self._due)
+        self._dueAt = None
+        self._writing = True
+      try:
+        self.write()
+        self.error = None
+      except Exception as ex:
+        self.logger.error(f"Error saving runtime configuration: {ex}")
+        self.error = str(ex)
+      finally:
+        with self._cond:
+          self._writing = False
+          self._cond.notify_all()
 
 class Config:
   def __init__(self, logger, filename):
@@ -13,19 +222,24 @@ class Config:
     self.filename = filename  # Store filename for later saving
     
     # Load configuration file
-    with open(filename, 'r') as stream:
+    with open(filename, 'rb') as stream:
       try:
-        config_data = json.loads(stream.read())
+        raw = stream.read()
+        config_data = json.loads(raw)
       except Exception as ex:
         self.logger.exception(ex)
         print(ex)
         raise
 
     # Validate configuration against JSON schema
-    self.validate_config_schema(config_data)
-    
-    # Convert to SimpleNamespace after validation
-    self.cfg = json.loads(json.dumps(config_data), object_hook=lambda d: SimpleNamespace(**d))
+    self.digest = hashlib.sha256(raw).hexdigest()
+    self.mtime = os.stat(filename).st_mtime_ns
+    compiled = self.validate_config_schema(config_data, self.digest)
+    # File content the live objects were built from (or last written), for reload diffs
+    self.data = config_data
+
+    # Build config objects straight from the parsed data
+    self.cfg = buildConfig(config_data, compiled.schema if compiled else None, compiled)
 
     try:
       self.mqttEnabled = self.cfg.mqtt.enabled
@@ -52,23 +266,96 @@ class Config:
       logger.error("Failed to initialize configuration with error message '%s'. Aborting." % format(ex))
       raise
 
+    # Held by whoever changes runtime-editable settings (the API) and while they are
+    # copied for saving, so a background save never captures half an edit
+    self.lock = threading.RLock()
+    persistence = self.cfg.persistence if hasattr(self.cfg, 'persistence') else None
+    self.backups = persistence.backups if hasattr(persistence, 'backups') else 3
+    self._saver = ConfigSaver(self.logger, self.write_runtime_config,
+      persistence.debounce_seconds if hasattr(persistence, 'debounce_seconds') else 2.0)
+    reload = self.cfg.reload if hasattr(self.cfg, 'reload') else None
+    self.watchFile = reload.watch_file if hasattr(reload, 'watch_file') else True
+    metrics = self.cfg.metrics if hasattr(self.cfg, 'metrics') else None
+    self.metricsRetentionDays = metrics.retention_days if hasattr(metrics, 'retention_days') else valve_metrics.RETENTION_DAYS
+    self.metricsArchiveDir = metrics.archive_dir if hasattr(metrics, 'archive_dir') else valve_metrics.ARCHIVE_DIR
+
   def getLatLon(self):
     return self.latitude, self.longitude
 
-  def validate_config_schema(self, config_data):
-    # Load the schema file
+  # Valve settings that can change on a live valve object; any other change replaces the valve
+  VALVE_LIVE_KEYS = ("name", "enabled", "schedules", "sensor")
+
+  def fileChanged(self):
+    """True if the config file now holds different content than this Config was loaded from or wrote"""
+    try:
+      mtime = os.stat(self.filename).st_mtime_ns
+    except FileNotFoundError:
+      return False
+    if mtime == self.mtime:
+      return False
+    self.mtime = mtime
+    with open(self.filename, 'rb') as f:
+      return hashlib.sha256(f.read()).hexdigest() != self.digest
+
+  def diff(self, other):
+    """
+    Compare this configuration's file content with another's. Returns a dict with
+    valves (added, removed, updated in place, replaced), sensors (added, removed,
+    changed) and the names of other top-level sections that changed.
+    """
+    oldValves, newValves = indexByName(self.data.get("valves")), indexByName(other.data.get("valves"))
+    valves = {"added": [], "removed": [], "updated": [], "replaced": []}
+    for name, valve in newValves.items():
+      if name not in oldValves:
+        valves["added"].append(name)
+      elif valve != oldValves[name]:
+        old = oldValves[name]
+        keys = set(old) | set(valve)
+        live = all(old.get(key) == valve.get(key) for key in keys if key not in self.VALVE_LIVE_KEYS)
+        valves["updated" if live else "replaced"].append(name)
+    valves["removed"] = [name for name in oldValves if name not in newValves]
+
+    oldSensors, newSensors = indexByName(self.data.get("sensors")), indexByName(other.data.get("sensors"))
+    sensors = {
+      "added": [name for name in newSensors if name not in oldSensors],
+      "removed": [name for name in oldSensors if name not in newSensors],
+      "changed": [name for name in newSensors if name in oldSensors and newSensors[name] != oldSensors[name]],
+    }
+
+    sections = sorted(key for key in set(self.data) | set(other.data)
+      if key not in ("valves", "sensors") and self.data.get(key) != other.data.get(key))
+    return {"valves": valves, "sensors": sensors, "sections": sections}
+
+  def validate_config_schema(self, config_data, digest = None):
+    """Validate against config.schema.json and return the compiled schema (None if missing).
+
+    Validation is skipped when the content hash matches the last configuration
+    validated from the same file against the same schema. The hashes are also
+    kept in a sidecar file next to the config, so a restart with an unchanged
+    config and schema skips validation too.
+    """
     schema_path = os.path.join(os.path.dirname(self.filename), 'config.schema.json')
     if not os.path.exists(schema_path):
       self.logger.warning(f"Schema file not found at {schema_path} - skipping schema validation")
-      return
+      return None
     
     try:
-      with open(schema_path, 'r') as schema_file:
-        schema = json.load(schema_file)
-      
+      compiled = _compiledSchema(schema_path)
+      filename = os.path.abspath(self.filename)
+      if digest is not None and digest in (compiled.validated.get(filename), self.read_validated(compiled)):
+        compiled.validated[filename] = digest
+        self.logger.debug("Configuration unchanged since last validation")
+        return compiled
+
       # Validate against schema
-      validate(instance=config_data, schema=schema)
+      error = compiled.bestError(config_data)
+      if error is not None:
+        raise error
+      if digest is not None:
+        compiled.validated[filename] = digest
+        self.write_validated(compiled, digest)
       self.logger.info("Configuration validation passed successfully")
+      return compiled
       
     except ValidationError as e:
       # Format validation error message
@@ -85,6 +372,24 @@ class Config:
       self.logger.error(f"Error during schema validation: {str(e)}")
       raise
 
+  def read_validated(self, compiled):
+    """Config hash recorded in the sidecar file as valid against this schema, or None"""
+    try:
+      with open(self.filename + ".validated", 'r') as f:
+        validated = json.load(f)
+      return validated["config"] if validated.get("schema") == compiled.digest else None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+      return None
+
+  def write_validated(self, compiled, digest):
+    try:
+      tmpFilename = self.filename + ".validated.tmp"
+      with open(tmpFilename, 'w') as f:
+        json.dump({"schema": compiled.digest, "config": digest}, f)
+      os.replace(tmpFilename, self.filename + ".validated")
+    except OSError as ex:
+      self.logger.warning(f"Failed to record the validated configuration: {ex}")
+
   def initValves(self):
     valves = {}
 
@@ -126,112 +431,164 @@ class Config:
       return None
     return waterflowFactory(_waterflow_cfg.type, self.logger, _waterflow_cfg)
 
+  def setClock(self, clock):
+    """Time the save debounce on clock (the engine's)"""
+    self._saver.clock = clock
+
   def save_runtime_config(self):
-    """Save runtime-editable configuration back to the config file.
+    """Schedule the runtime-editable configuration to be written back to the config file.
+
+    Returns immediately; bursts of edits are coalesced into one background
+    write (see flush_runtime_config to wait for it).
+    """
+    started = perf.now()
+    self._saver.request()
+    SAVE_PROBE.record(started)
+
+  def flush_runtime_config(self, timeout = 10):
+    """Write pending runtime configuration edits now, waiting up to timeout seconds.
+
+    Returns False if they could not be written (see save_error).
+    """
+    return self._saver.flush(timeout)
+
+  def save_error(self):
+    """Why the last runtime configuration save failed, or None"""
+    return self._saver.error
+
+  def write_runtime_config(self):
+    """Write runtime-editable configuration back to the config file.
     
     This method updates valve schedules and enabled flags - all other
     config values remain unchanged from the file.
     """
+    started = perf.now()
     try:
       # Read the current config file to preserve formatting and all other settings
       with open(self.filename, 'r') as f:
         config_data = json.load(f)
-      
-      # Update only the runtime-editable fields for each valve
-      for valve_name, valve_obj in self.valves.items():
-        # Find the matching valve in the config data
-        for valve_cfg in config_data['valves']:
-          if valve_cfg['name'] == valve_name:
-            # Update enabled flag
-            valve_cfg['enabled'] = valve_obj.enabled
-            
-            # Rebuild the schedules array completely
-            new_schedules = []
-            for schedule in valve_obj.schedules:
-              sched_dict = {}
-              
-              # Add time_based_on first
-              if hasattr(schedule, 'time_based_on'):
-                sched_dict['time_based_on'] = schedule.time_based_on
-                
-                # Add appropriate time fields based on time_based_on
-                if schedule.time_based_on == 'fixed':
-                  if hasattr(schedule, 'fixed_start_time'):
-                    sched_dict['fixed_start_time'] = schedule.fixed_start_time
-                  # Do NOT include offset_minutes for fixed time
-                else:  # sunrise or sunset
-                  if hasattr(schedule, 'offset_minutes'):
-                    sched_dict['offset_minutes'] = schedule.offset_minutes
-                  # Do NOT include fixed_start_time for sunrise/sunset
-              
-              # Add other schedule fields
-              if hasattr(schedule, 'duration'):
-                sched_dict['duration'] = schedule.duration
-              if hasattr(schedule, 'seasons') and schedule.seasons:
-                sched_dict['seasons'] = schedule.seasons
-              if hasattr(schedule, 'days') and schedule.days:
-                sched_dict['days'] = schedule.days
-              if hasattr(schedule, 'enable_uv_adjustments'):
-                sched_dict['enable_uv_adjustments'] = schedule.enable_uv_adjustments
-              
-              new_schedules.append(sched_dict)
-            
-            # Replace the schedules array
-            valve_cfg['schedules'] = new_schedules
-            break
-      
-      # Update alerts configuration if it exists
-      if hasattr(self.cfg, 'alerts') and 'alerts' in config_data:
-        alerts_cfg = self.cfg.alerts
-        
-        # Update enabled flags
-        if hasattr(alerts_cfg, 'enabled') and 'enabled' in config_data['alerts']:
-          config_data['alerts']['enabled'] = {
-            'leak': alerts_cfg.enabled.leak,
-            'malfunction_no_flow': alerts_cfg.enabled.malfunction_no_flow,
-            'irregular_flow': alerts_cfg.enabled.irregular_flow,
-            'sensor_error': alerts_cfg.enabled.sensor_error,
-            'system_exit': alerts_cfg.enabled.system_exit,
-          }
-        
-        # Update settings
-        if hasattr(alerts_cfg, 'leak_repeat_minutes'):
-          config_data['alerts']['leak_repeat_minutes'] = alerts_cfg.leak_repeat_minutes
-        if hasattr(alerts_cfg, 'irregular_flow_threshold'):
-          config_data['alerts']['irregular_flow_threshold'] = alerts_cfg.irregular_flow_threshold
-      
-      # Update waterflow configuration if it exists
-      if hasattr(self.cfg, 'waterflow') and 'waterflow' in config_data:
-        waterflow_cfg = self.cfg.waterflow
-        
-        # Update waterflow settings
-        if hasattr(waterflow_cfg, 'enabled'):
-          config_data['waterflow']['enabled'] = waterflow_cfg.enabled
-        if hasattr(waterflow_cfg, 'leakdetection'):
-          config_data['waterflow']['leakdetection'] = waterflow_cfg.leakdetection
-      
-      # Update sensors configuration if it exists
-      if hasattr(self.cfg, 'sensors') and 'sensors' in config_data:
-        for sensor_cfg in self.cfg.sensors:
-          # Find matching sensor in config_data
-          for sensor_data in config_data['sensors']:
-            if sensor_data['name'] == sensor_cfg.name:
-              # Update sensor-specific settings
-              if hasattr(sensor_cfg, 'precipitation'):
-                if 'precipitation' not in sensor_data:
-                  sensor_data['precipitation'] = {}
-                if hasattr(sensor_cfg.precipitation, 'days_to_aggregate'):
-                  sensor_data['precipitation']['days_to_aggregate'] = sensor_cfg.precipitation.days_to_aggregate
-                if hasattr(sensor_cfg.precipitation, 'disable_threshold_mm'):
-                  sensor_data['precipitation']['disable_threshold_mm'] = sensor_cfg.precipitation.disable_threshold_mm
-              break
-      
+
+      with self.lock:
+        self.apply_runtime_config(config_data)
+
       # Write the updated config back to file with nice formatting
-      with open(self.filename, 'w') as f:
-        json.dump(config_data, f, indent=2)
+      self.replace_config_file(json.dumps(config_data, indent=2))
+      self.data = config_data
       
       self.logger.info(f"Runtime configuration saved to '{self.filename}'")
       
     except Exception as ex:
       self.logger.error(f"Error saving runtime configuration: {ex}")
       raise
+    finally:
+      WRITE_PROBE.record(started)
+
+  def apply_runtime_config(self, config_data):
+    """Copy the live runtime-editable settings into parsed config file data"""
+    # Update only the runtime-editable fields for each valve
+    valve_entries = indexByName(config_data['valves'])
+    for valve_name, valve_obj in self.valves.items():
+      # Find the matching valve in the config data
+      valve_cfg = valve_entries.get(valve_name)
+      if valve_cfg is not None:
+        # Update enabled flag
+        valve_cfg['enabled'] = valve_obj.enabled
+          
+        # Rebuild the schedules array completely
+        new_schedules = []
+        for schedule in valve_obj.schedules:
+          sched_dict = {'id': schedule.id}
+            
+          # Add time_based_on first
+          if hasattr(schedule, 'time_based_on'):
+            sched_dict['time_based_on'] = schedule.time_based_on
+              
+            # Add appropriate time fields based on time_based_on
+            if schedule.time_based_on == 'fixed':
+              if hasattr(schedule, 'fixed_start_time'):
+                sched_dict['fixed_start_time'] = schedule.fixed_start_time
+              # Do NOT include offset_minutes for fixed time
+            else:  # sunrise or sunset
+              if hasattr(schedule, 'offset_minutes'):
+                sched_dict['offset_minutes'] = schedule.offset_minutes
+              # Do NOT include fixed_start_time for sunrise/sunset
+            
+          # Add other schedule fields
+          if hasattr(schedule, 'duration'):
+            sched_dict['duration'] = schedule.duration
+          if hasattr(schedule, 'seasons') and schedule.seasons:
+            sched_dict['seasons'] = schedule.seasons
+          if hasattr(schedule, 'days') and schedule.days:
+            sched_dict['days'] = schedule.days
+          if hasattr(schedule, 'enable_uv_adjustments'):
+            sched_dict['enable_uv_adjustments'] = schedule.enable_uv_adjustments
+            
+          new_schedules.append(sched_dict)
+          
+        # Replace the schedules array
+        valve_cfg['schedules'] = new_schedules
+    
+    # Update alerts configuration if it exists
+    if hasattr(self.cfg, 'alerts') and 'alerts' in config_data:
+      alerts_cfg = self.cfg.alerts
+      
+      # Update enabled flags
+      if hasattr(alerts_cfg, 'enabled') and 'enabled' in config_data['alerts']:
+        config_data['alerts']['enabled'] = {
+          'leak': alerts_cfg.enabled.leak,
+          'malfunction_no_flow': alerts_cfg.enabled.malfunction_no_flow,
+          'irregular_flow': alerts_cfg.enabled.irregular_flow,
+          'sensor_error': alerts_cfg.enabled.sensor_error,
+          'system_exit': alerts_cfg.enabled.system_exit,
+        }
+      
+      # Update settings
+      if hasattr(alerts_cfg, 'leak_repeat_minutes'):
+        config_data['alerts']['leak_repeat_minutes'] = alerts_cfg.leak_repeat_minutes
+      if hasattr(alerts_cfg, 'irregular_flow_threshold'):
+        config_data['alerts']['irregular_flow_threshold'] = alerts_cfg.irregular_flow_threshold
+    
+    # Update waterflow configuration if it exists
+    if hasattr(self.cfg, 'waterflow') and 'waterflow' in config_data:
+      waterflow_cfg = self.cfg.waterflow
+      
+      # Update waterflow settings
+      if hasattr(waterflow_cfg, 'enabled'):
+        config_data['waterflow']['enabled'] = waterflow_cfg.enabled
+      if hasattr(waterflow_cfg, 'leakdetection'):
+        config_data['waterflow']['leakdetection'] = waterflow_cfg.leakdetection
+    
+    # Update sensors configuration if it exists
+    if hasattr(self.cfg, 'sensors') and 'sensors' in config_data:
+      sensor_entries = indexByName(config_data['sensors'])
+      for sensor_cfg in self.cfg.sensors:
+        # Find matching sensor in config_data
+        sensor_data = sensor_entries.get(sensor_cfg.name)
+        if sensor_data is not None:
+          # Update sensor-specific settings
+          if hasattr(sensor_cfg, 'precipitation'):
+            if 'precipitation' not in sensor_data:
+              sensor_data['precipitation'] = {}
+            if hasattr(sensor_cfg.precipitation, 'days_to_aggregate'):
+              sensor_data['precipitation']['days_to_aggregate'] = sensor_cfg.precipitation.days_to_aggregate
+            if hasattr(sensor_cfg.precipitation, 'disable_threshold_mm'):
+              sensor_data['precipitation']['disable_threshold_mm'] = sensor_cfg.precipitation.disable_threshold_mm
+
+  def replace_config_file(self, content):
+    """Atomically replace the config file, keeping the previous versions as .1 (newest) to .N backups"""
+    tmpFilename = self.filename + ".tmp"
+    with open(tmpFilename, 'w') as f:
+      f.write(content)
+      f.flush()
+      os.fsync(f.fileno())
+
+    if self.backups > 0 and os.path.exists(self.filename):
+      for i in range(self.backups - 1, 0, -1):
+        if os.path.exists(f"{self.filename}.{i}"):
+          os.replace(f"{self.filename}.{i}", f"{self.filename}.{i + 1}")
+      shutil.copy2(self.filename, f"{self.filename}.1")
+
+    os.replace(tmpFilename, self.filename)
+    # Our own writes must not look like external edits to the file watcher
+    self.digest = hashlib.sha256(content.encode()).hexdigest()
+    self.mtime = os.stat(self.filename).st_mtime_ns
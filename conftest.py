@@ -0,0 +1,16 @@
+import pytest
+import alert_store
+import valve_metrics
+from sensors.base_sensor import BaseSensor
+from sensors.openweathermap_sensor import OpenWeatherMapSensor
+
+@pytest.fixture(autouse=True)
+def isolatedData(tmp_path, monkeypatch):
+  """Keep the metrics database, alert history and sensor state of every test under its tmp_path instead of data/"""
+  monkeypatch.setattr(alert_store, "ALERTS_FILE", str(tmp_path / "alerts.jsonl"))
+  monkeypatch.setattr(valve_metrics, "ARCHIVE_DIR", str(tmp_path / "archive"))
+  monkeypatch.setattr(BaseSensor, "STATE_FILE", str(tmp_path / "sensor_state.json"))
+  monkeypatch.setattr(OpenWeatherMapSensor, "CACHE_FILE", str(tmp_path / "openweathermap_cache.json"))
+  previous = valve_metrics.set_store(valve_metrics.MetricsStore(str(tmp_path / "valve_metrics.db"), None))
+  yield
+  valve_metrics.set_store(previous)
@@ -0,0 +1,147 @@
+"""
+Engine internals in the Prometheus text exposition format, served at /metrics.
+
+Hot paths only bump a counter (one dict update under the family's own lock).
+Values that already live elsewhere (queue depth, alert channel counters) are
+read by collectors when rendering, and the rendered text is cached for
+Registry.cacheSeconds, so frequent scrapes never touch the valve threads'
+locks more than once per interval.
+"""
+import time
+import threading
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _formatValue(value):
+  if value == float("inf"):
+    return "+Inf"
+  return repr(value) if isinstance(value, float) else str(value)
+
+def _formatSample(name, labelNames, labelValues, value):
+  if labelNames:
+    labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(labelNames, labelValues))
+    return f"{name}{{{labels}}} {_formatValue(value)}"
+  return f"{name} {_formatValue(value)}"
+
+class Metric():
+  """A counter or gauge family; samples are keyed by the tuple of label values"""
+  def __init__(self, name, help, type, labelNames = ()):
+    self.name = name
+    self.help = help
+    self.type = type
+    self.labelNames = tuple(labelNames)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def inc(self, amount = 1, labels = ()):
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+  def set(self, value, labels = ()):
+    with self._lock:
+      self._values[labels] = value
+
+  def value(self, labels = ()):
+    with self._lock:
+      return self._values.get(labels, 0)
+
+  def samples(self):
+    with self._lock:
+      values = list(self._values.items())
+    return [(self.name, labels, value) for labels, value in values]
+
+class Summary(Metric):
+  """Observation count and sum (a Prometheus summary without quantiles)"""
+  def __init__(self, name, help, labelNames = ()):
+    Metric.__init__(self, name, help, "summary", labelNames)
+
+  def observe(self, value, labels = ()):
+    with self._lock:
+      count, total = self._values.get(labels, (0, 0.0))
+      self._values[labels] = (count + 1, total + value)
+
+  def samples(self):
+    with self._lock:
+      values = list(self._values.items())
+    result = []
+    for labels, (count, total) in values:
+      result.append((self.name + "_count", labels, count))
+      result.append((self.name + "_sum", labels, total))
+    return result
+
+class Registry():
+  def __init__(self, cacheSeconds = 1.0):
+    self.cacheSeconds = cacheSeconds
+    self._metrics = []
+    self._collectors = {}
+    self._lock = threading.Lock()
+    self._cache = None
+    self._cachedAt = 0.0
+
+  def _add(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def counter(self, name, help, labelNames = ()):
+    return self._add(Metric(name, help, "counter", labelNames))
+
+  def gauge(self, name, help, labelNames = ()):
+    return self._add(Metric(name, help, "gauge", labelNames))
+
+  def summary(self, name, help, labelNames = ()):
+    return self._add(Summary(name, help, labelNames))
+
+  def setCollector(self, key, collect):
+    """
+    Register (or replace, by key) a callable returning (name, type, help,
+    labelNames, [(labelValues, value), ...]) tuples, evaluated while rendering.
+    """
+    with self._lock:
+      if collect is None:
+        self._collectors.pop(key, None)
+      else:
+        self._collectors[key] = collect
+      self._cache = None
+
+  def render(self):
+    with self._lock:
+      if self._cache is not None and time.monotonic() - self._cachedAt < self.cacheSeconds:
+        return self._cache
+      collectors = list(self._collectors.values())
+
+    lines = []
+    for metric in self._metrics:
+      lines.append(f"# HELP {metric.name} {metric.help}")
+      lines.append(f"# TYPE {metric.name} {metric.type}")
+      for name, labels, value in sorted(metric.samples(), key=lambda sample: (sample[1], sample[0])):
+        lines.append(_formatSample(name, metric.labelNames, labels, value))
+    for collect in collectors:
+      try:
+        families = collect()
+      except Exception:
+        continue
+      for name, type, help, labelNames, samples in families:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        for labels, value in samples:
+          lines.append(_formatSample(name, labelNames, labels, value))
+    text = "\n".join(lines) + "\n"
+
+    with self._lock:
+      self._cache = text
+      self._cachedAt = time.monotonic()
+    return text
+
+REGISTRY = Registry()
+
+VALVE_OPEN_SECONDS = REGISTRY.counter("irrigate_valve_open_seconds_total", "Seconds valves were open during irrigation jobs", ("valve",))
+VALVE_LITERS = REGISTRY.counter("irrigate_valve_liters_total", "Liters measured while valves ran irrigation jobs", ("valve",))
+SCHEDULER_TICK_LAG = REGISTRY.gauge("irrigate_scheduler_tick_lag_seconds", "Delay of the last schedule evaluation after the start of the oldest minute it covered")
+SCHEDULER_CATCHUP_MINUTES = REGISTRY.counter("irrigate_scheduler_catchup_minutes_total", "Minutes evaluated late because a scheduler tick skipped them")
+SCHEDULER_SKIPPED_MINUTES = REGISTRY.counter("irrigate_scheduler_skipped_minutes_total", "Minutes not evaluated because the clock jumped forward")
+MQTT_PUBLISHES = REGISTRY.counter("irrigate_mqtt_publishes_total", "MQTT messages published")
+MQTT_DROPS = REGISTRY.counter("irrigate_mqtt_publish_drops_total", "MQTT messages not published", ("reason",))
+MQTT_RECONNECTS = REGISTRY.counter("irrigate_mqtt_reconnects_total", "MQTT connections re-established after the first one")
+SENSOR_FETCH_SECONDS = REGISTRY.summary("irrigate_sensor_fetch_seconds", "Latency of sensor data fetches", ("sensor",))
+SENSOR_FETCH_ERRORS = REGISTRY.counter("irrigate_sensor_fetch_errors_total", "Failed sensor data fetch attempts", ("sensor",))
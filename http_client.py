@@ -0,0 +1,116 @@
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+try:
+  import httpx
+except ImportError:
+  httpx = None
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 15)
+
+class HttpClient:
+  """Shared HTTP client for integrations (alert channels, weather sensors).
+
+  Keeps one keep-alive session per scheme://host so repeated calls to the same
+  API reuse the TCP/TLS connection instead of handshaking every time. When
+  http2 is requested and httpx (with h2) is installed, httpx sessions are used
+  instead of requests. All errors surface as requests.exceptions.RequestException.
+  """
+
+  def __init__(self, timeout = DEFAULT_TIMEOUT, pool_size = 4, http2 = False):
+    self.timeout = timeout
+    self.pool_size = pool_size
+    self.http2 = http2 and httpx is not None
+    self._sessions = {}
+    self._lock = threading.Lock()
+    self._inflight = 0
+    self._closing = False
+
+  def _session(self, url):
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with self._lock:
+      session = self._sessions.get(key)
+      if session is None:
+        if self.http2:
+          limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+          session = httpx.Client(http2=True, limits=limits)
+        else:
+          session = requests.Session()
+          adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+          session.mount(key, adapter)
+        self._sessions[key] = session
+      return session
+
+  def request(self, method, url, timeout = None, **kwargs):
+    timeout = timeout or self.timeout
+    with self._lock:
+      self._inflight += 1
+    try:
+      session = self._session(url)
+      if not self.http2:
+        response = session.request(method, url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+      try:
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        response = session.request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+        response.raise_for_status()
+        return response
+      except httpx.HTTPError as ex:
+        raise requests.exceptions.RequestException(str(ex)) from ex
+    finally:
+      with self._lock:
+        self._inflight -= 1
+        if self._closing and self._inflight == 0:
+          self._closeSessions()
+
+  def get(self, url, **kwargs):
+    return self.request("GET", url, **kwargs)
+
+  def post(self, url, **kwargs):
+    return self.request("POST", url, **kwargs)
+
+  def close(self):
+    """Close the sessions, once the requests in flight on other threads have finished"""
+    with self._lock:
+      self._closing = True
+      if self._inflight == 0:
+        self._closeSessions()
+
+  def _closeSessions(self):
+    for session in self._sessions.values():
+      session.close()
+    self._sessions.clear()
+
+_client = None
+
+def getClient():
+  global _client
+  if _client is None:
+    _client = HttpClient()
+  return _client
+
+def setClient(client):
+  """Replace the shared client (e.g. with a test double). Returns the previous one."""
+  global _client
+  previous = _client
+  _client = client
+  return previous
+
+def configure(config):
+  """Build the shared client from the optional 'http' configuration section."""
+  if config is None:
+    client = HttpClient()
+  else:
+    timeout = (getattr(config, 'connect_timeout', DEFAULT_TIMEOUT[0]), getattr(config, 'read_timeout', DEFAULT_TIMEOUT[1]))
+    client = HttpClient(timeout=timeout, pool_size=getattr(config, 'pool_size', 4), http2=getattr(config, 'http2', False))
+  previous = setClient(client)
+  if previous is not None:
+    # Requests already running (weather fetches, alert sends) finish on the old client
+    previous.close()
+  return client
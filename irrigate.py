@@ -1,9 +1,13 @@
 import sys
+import json
 import time
 import pytz
 import model
 import queue
 import config
+import perf
+import http_client
+import engine_metrics
 import signal
 import getopt
 import logging
@@ -15,11 +19,23 @@ from suntime import Sun
 from datetime import datetime
 from datetime import timedelta
 from threading import Thread
+from timing_wheel import TimingWheel
+from clock import SYSTEM as SYSTEM_CLOCK
 from api_server import run_api_server
-from valve_metrics import write_daily_summaries, load_baselines
+from valve_metrics import write_daily_summaries, load_baselines, restore_daily_totals, archive_old_metrics, CycleRecorder, CycleRecord
 from schedule_simulator import ScheduleSimulator
+from metrics_report import build_report, format_report
 from alerts import AlertManager, AlertType
 
+TICK_PROBE = perf.probe("timer.tick")
+SCHEDULER_PROBE = perf.probe("timer.scheduler")
+LEAK_CHECK_PROBE = perf.probe("timer.leak_check")
+TELEMETRY_PROBE = perf.probe("timer.telemetry")
+VALVE_ITERATION_PROBE = perf.probe("valve.iteration")
+VALVE_FLOW_PROBE = perf.probe("valve.flow_check")
+SHOULD_DISABLE_PROBE = perf.probe("sensor.should_disable")
+GET_FACTOR_PROBE = perf.probe("sensor.get_factor")
+
 def main(argv):
   # Check for --simulate flag (with or without =)
   simulate_flag = False
@@ -33,9 +49,16 @@ def main(argv):
       simulate_flag = True
       simulateOptions = arg.split("=", 1)[1]
       break
+
+  # Check for --report flag (--report=json prints the raw report)
+  report_flag = None
+  for arg in sys.argv[1:]:
+    if arg == "--report" or arg.startswith("--report="):
+      report_flag = arg.split("=", 1)[1] if "=" in arg else "text"
+      break
   
-  # Parse other options normally (filter out --simulate so getopt doesn't complain)
-  filtered_args = [arg for arg in sys.argv[1:] if not arg.startswith("--simulate")]
+  # Parse other options normally (filter out --simulate/--report so getopt doesn't complain)
+  filtered_args = [arg for arg in sys.argv[1:] if not arg.startswith("--simulate") and not arg.startswith("--report")]
   options, remainder = getopt.getopt(filtered_args, "", ["config=", "test"])
 
   configFilename = "config.json"
@@ -55,6 +78,11 @@ def main(argv):
     simulator.print_schedule()
     sys.exit(0)
 
+  if report_flag is not None:
+    report = irrigate.metricsReport()
+    print(json.dumps(report, indent=2) if report_flag == "json" else format_report(report))
+    sys.exit(0)
+
   if test:
     irrigate.logger.info("Entering test mode. CTRL-C to exit...")
     while True:
@@ -70,6 +98,7 @@ def main(argv):
   # Start FastAPI server in background thread
   api_thread = threading.Thread(target=run_api_server, args=(irrigate,))
   api_thread.daemon = True
+  api_thread.name = "ApiTh"
   api_thread.start()
   
   irrigate.start(False)
@@ -81,22 +110,51 @@ def main(argv):
   irrigate.logger.info("Program terminated. Waiting for all threads to finish...")
 
 class Irrigate:
-  def __init__(self, configFilename):
+  def __init__(self, configFilename, clock = None):
 
     signal.signal(signal.SIGTERM, self.exit_gracefully)
+    signal.signal(signal.SIGHUP, self.reload_on_signal)
 
-    self.startTime = datetime.now()
+    # All engine timing goes through the clock; tests and simulations pass a clock.VirtualClock
+    self.clock = clock if clock is not None else SYSTEM_CLOCK
+    self.startTime = self.clock.now()
     self.logger = self.getLogger()
     self.logger.info("Reading configuration file '%s'..." % configFilename)
+    self._stopped = threading.Event()
+    # Replaced and set on each change a running cycle reacts to (see notifyChange)
+    self._changed = threading.Event()
     self.terminated = False
     self._lastAllClosed = None
-    self._intervalDict = {}
+    self.timers = TimingWheel(clock=self.clock.monotonic)
+    self._sunDebug = self.timers.flag(3600, key="eval_debuger", bootstrap=True)
+    self._lastSchedMinute = None
     self._status = None
     self._tempStatus = {}
+    self._reloadLock = threading.Lock()
     self.alerts = None  # Will be initialized in init()
     self.init(configFilename)
     self.mqtt = Mqtt(self)
     self.createThreads()
+    self.registerTimers()
+
+  @property
+  def terminated(self):
+    return self._stopped.is_set()
+
+  @terminated.setter
+  def terminated(self, terminated):
+    if not terminated:
+      self._stopped.clear()
+      return
+    self._stopped.set()
+    # Idle workers wait for a job and running cycles for a change: wake both to exit
+    self.clock.interrupt(self.q)
+    self.notifyChange()
+
+  def notifyChange(self):
+    """Wake the running cycles to re-check their valve, its sensor and shutdown"""
+    changed, self._changed = self._changed, threading.Event()
+    changed.set()
 
   def exit_gracefully(self, *args):
     self.terminated = True
@@ -104,7 +162,13 @@ class Irrigate:
     # Alert system exit
     if self.alerts:
       self.alerts.alert(AlertType.SYSTEM_EXIT, "Graceful shutdown (SIGTERM)")
+      self.alerts.shutdown()
     
+    # Write any runtime config edits and cycle records still waiting in the background
+    if not self.cfg.flush_runtime_config():
+      self.logger.error(f"Runtime configuration edits were not saved: {self.cfg.save_error()}")
+    self.cycleRecorder.flush()
+
     # Close all manually opened valves (is_open but not handled by a job)
     for valve in self.valves.values():
       if valve.is_open and not valve.handled:
@@ -117,6 +181,9 @@ class Irrigate:
       self.mqtt.shutdown()
     if self.waterflow and hasattr(self.waterflow, 'shutdown'):
       self.waterflow.shutdown()
+    for _sensor in self.sensors.values():
+      if hasattr(_sensor, 'shutdown'):
+        _sensor.shutdown()
 
   def start(self, test = True):
     if self.cfg.mqttEnabled:
@@ -128,6 +195,7 @@ class Irrigate:
       self.logger.info("Starting worker thread '%s'." % worker.name)
       worker.daemon = test
       worker.start()
+      self.clock.attach(worker)
 
     self.logger.debug("Starting sensors...")
     for _sensor in self.sensors.values():
@@ -150,25 +218,220 @@ class Irrigate:
 
     self.logger.info("Starting timer thread '%s'." % self.timer.name)
     self.timer.start()
+    self.clock.attach(self.timer)
 
     if self._status is None:
       self.setStatus("OK")
 
   def init(self, cfgFilename):
     self.cfg = config.Config(self.logger, cfgFilename)
+    self.cfg.setClock(self.clock)
     self.valves = self.cfg.valves
     self.sensors = self.cfg.sensors
     self.waterflow = self.cfg.waterflow
+    if self.waterflow is not None:
+      self.waterflow.setClock(self.clock)
     # self.waterflows = self.cfg.waterflows
     self.q = queue.Queue()
+    http_client.configure(self.cfg.cfg.http if hasattr(self.cfg.cfg, 'http') else None)
     
     # Load valve baselines from historical data
-    from valve_metrics import load_baselines
-    load_baselines(self.valves, self.logger)
+    load_baselines(self.valves, self.logger, self.clock.now().date())
+    restore_daily_totals(self.valves, self.clock.now().strftime('%Y-%m-%d'), self.logger)
+    self.cycleRecorder = CycleRecorder(self.logger, clock=self.clock)
+    engine_metrics.REGISTRY.setCollector("irrigate", self.collectMetrics)
     
     # Initialize alert manager (pass self for schedule evaluation reuse)
     self.alerts = AlertManager(self.logger, self.cfg, self)
 
+    for valve in self.valves.values():
+      self.linkValve(valve)
+    for _sensor in self.sensors.values():
+      self.linkSensor(_sensor)
+
+  def linkValve(self, valve):
+    valve.clock = self.clock
+    valve.onChange = self.notifyChange
+
+  def linkSensor(self, sensor):
+    sensor.setClock(self.clock)
+    sensor.onChange = self.notifyChange
+    # Let sensors time their fetches just ahead of the runs that depend on them
+    sensor.refreshPlanner.upcomingRuns = lambda horizon: self.upcomingSensorRuns(sensor, horizon)
+    sensor.refreshPlanner.timezone = pytz.timezone(self.cfg.timezone)
+
+  def schedulesChanged(self):
+    """Let sensors waiting for their next fetch re-plan it against the changed schedules"""
+    for sensor in list(self.sensors.values()):
+      sensor.refreshPlanner.replan()
+
+  def reload_on_signal(self, *args):
+    # Keep the signal handler short; the reload runs on its own thread
+    self.reloadInBackground("SIGHUP")
+
+  def reloadInBackground(self, reason):
+    worker = Thread(target=self.reloadConfig, args=(reason,))
+    worker.daemon = True
+    worker.name = "ReloadTh"
+    worker.start()
+    return worker
+
+  def reloadConfig(self, reason = "request"):
+    """
+    Re-read the config file and apply only what changed, keeping running cycles,
+    the job queue and unaffected connections. Returns a summary of the changes,
+    or {"error": ...} if the new file is invalid (the live config is kept).
+    """
+    with self._reloadLock:
+      self.logger.info(f"Reloading configuration '{self.cfg.filename}' ({reason})...")
+      # Pending API edits must reach the file before it is read back
+      if not self.cfg.flush_runtime_config():
+        self.logger.warning(f"Runtime edits not saved ({self.cfg.save_error()}) are replaced by the file's content")
+      try:
+        newCfg = config.Config(self.logger, self.cfg.filename)
+        newCfg.setClock(self.clock)
+      except Exception as ex:
+        self.logger.error(f"Configuration reload failed, keeping the running configuration: {ex}")
+        return {"error": str(ex)}
+
+      changes = self.cfg.diff(newCfg)
+      valves, sensors, sections = changes["valves"], changes["sensors"], changes["sections"]
+      changes["deferred"] = []
+
+      # Sensors: keep unchanged objects (and their state), swap the rest
+      for name in sensors["removed"] + sensors["changed"]:
+        if hasattr(self.sensors[name], 'shutdown'):
+          self.sensors[name].shutdown()
+        del self.sensors[name]
+      for name in sensors["added"] + sensors["changed"]:
+        sensor = newCfg.sensors[name]
+        self.linkSensor(sensor)
+        self.sensors[name] = sensor
+        if sensor.enabled:
+          try:
+            sensor.start()
+          except Exception as ex:
+            self.logger.error(f"Error starting sensor '{name}': '{format(ex)}'.")
+
+      # Waterflow meter
+      if "waterflow" in sections:
+        if self.waterflow is not None and hasattr(self.waterflow, 'shutdown'):
+          self.waterflow.shutdown()
+        self.waterflow = newCfg.waterflow
+        if self.waterflow is not None:
+          self.waterflow.setClock(self.clock)
+        if self.waterflow is not None and self.waterflow.enabled:
+          try:
+            self.waterflow.start()
+          except Exception as ex:
+            self.logger.error(f"Error starting waterflow '{format(ex)}'.")
+
+      # Valves: the dict is shared with MQTT and the API, so it is updated in place
+      for name in valves["removed"]:
+        del self.valves[name]
+      for name in valves["replaced"]:
+        if self.valves[name].handled:
+          self.logger.warning(f"Valve '{name}' is running; its hardware settings will apply on the next reload.")
+          changes["deferred"].append(name)
+          valves["updated"].append(name)
+          continue
+        old = self.valves[name]
+        valve = newCfg.valves[name]
+        valve.secondsDaily, valve.litersDaily = old.secondsDaily, old.litersDaily
+        self.linkValve(valve)
+        self.valves[name] = valve
+      for name in valves["added"]:
+        self.linkValve(newCfg.valves[name])
+        self.valves[name] = newCfg.valves[name]
+      for name in valves["updated"]:
+        valve, newValve = self.valves[name], newCfg.valves[name]
+        valve.enabled = newValve.enabled
+        valve.schedules = newValve.schedules
+      for name, valve in self.valves.items():
+        # Re-point every valve at the live sensor objects
+        sensorName = newCfg.valves[name].sensor.name if hasattr(newCfg.valves[name], 'sensor') else None
+        if sensorName is not None:
+          valve.sensor = self.sensors[sensorName]
+        elif hasattr(valve, 'sensor'):
+          del valve.sensor
+      if valves["added"] or valves["replaced"]:
+        load_baselines(self.valves, self.logger, self.clock.now().date())
+
+      # Queued jobs follow replaced valves and are dropped for removed ones
+      with self.q.mutex:
+        jobs = [job for job in self.q.queue if job.valve.name in self.valves]
+        for job in jobs:
+          job.valve = self.valves[job.valve.name]
+        self.q.unfinished_tasks -= len(self.q.queue) - len(jobs)
+        self.q.queue.clear()
+        self.q.queue.extend(jobs)
+
+      newCfg.valves, newCfg.sensors, newCfg.waterflow = self.valves, self.sensors, self.waterflow
+      newCfg.lock = self.cfg.lock
+      if changes["deferred"]:
+        # Keep the old settings of deferred valves so the next reload sees them as changed
+        liveKeys = config.Config.VALVE_LIVE_KEYS
+        for i, valveData in enumerate(newCfg.data["valves"]):
+          if valveData["name"] in changes["deferred"]:
+            oldData = next(v for v in self.cfg.data["valves"] if v["name"] == valveData["name"])
+            merged = {k: v for k, v in oldData.items() if k not in liveKeys}
+            merged.update({k: v for k, v in valveData.items() if k in liveKeys})
+            newCfg.data["valves"][i] = merged
+      self.cfg = newCfg
+
+      if "http" in sections:
+        http_client.configure(self.cfg.cfg.http if hasattr(self.cfg.cfg, 'http') else None)
+
+      if "alerts" in sections:
+        oldAlerts = self.alerts
+        self.alerts = AlertManager(self.logger, self.cfg, self, history=oldAlerts.history)
+        if self.alerts.history is oldAlerts.history:
+          oldAlerts.history = None
+        # Flushing the old channels can take seconds: don't hold up the reload
+        worker = Thread(target=oldAlerts.shutdown, args=())
+        worker.daemon = True
+        worker.name = "AlertStopTh"
+        worker.start()
+      else:
+        self.alerts.config = self.cfg
+        if "timezone" in sections or "location" in sections:
+          self.alerts.invalidate_exclusion_windows()
+
+      if self.cfg.valvesConcurrency > len(self.workers):
+        for i in range(len(self.workers), self.cfg.valvesConcurrency):
+          worker = Thread(target=self.valveThread, args=())
+          worker.daemon = False
+          worker.name = f"ValveTh{i}"
+          self.workers.append(worker)
+          if self.timer.is_alive():
+            worker.start()
+            self.clock.attach(worker)
+      elif self.cfg.valvesConcurrency < len(self.workers):
+        self.logger.warning(f"Lowering max_concurrent_valves to {self.cfg.valvesConcurrency} takes effect after a restart.")
+
+      if "mqtt" in sections:
+        self.mqtt.shutdown()
+        self.mqtt = Mqtt(self)
+        if self.cfg.mqttEnabled:
+          # Connecting blocks until the broker answers; don't hold up the caller
+          worker = Thread(target=self.mqtt.start, args=())
+          worker.daemon = True
+          worker.name = "MqttStartTh"
+          worker.start()
+      else:
+        self.mqtt.cfg = self.cfg
+        self.mqtt.indexValves()
+
+      if "telemetry" in sections:
+        self.registerTimers()
+
+      if "timezone" in sections:
+        for sensor in list(self.sensors.values()):
+          self.linkSensor(sensor)
+      self.schedulesChanged()
+      self.logger.info(f"Configuration reloaded: {changes}")
+      return changes
+
   def createThreads(self):
     self.workers = []
     for i in range(self.cfg.valvesConcurrency):
@@ -206,7 +469,7 @@ class Irrigate:
       now_naive = now.replace(tzinfo=None) if now.tzinfo else now
       tz = pytz.timezone(timezone)
       
-      if self.everyXMinutes("eval_debuger", 60, True):
+      if self._sunDebug.consume():
         self.logger.info(f"***")
         sunrise = sun.get_sunrise_time(at_date=now_naive, time_zone=tz)
         sunrise = sunrise.replace(year=now.year, month=now.month, day=now.day)
@@ -225,7 +488,7 @@ class Irrigate:
     return startTime
 
   def shouldScheduleRun(self, sched, check_date=None, check_season=None):
-    date_to_check = check_date if check_date else datetime.now()
+    date_to_check = check_date if check_date else self.clock.now()
     todayStr = calendar.day_abbr[date_to_check.weekday()]
     if len(sched.days) > 0 and todayStr not in sched.days:
       return False
@@ -243,6 +506,25 @@ class Irrigate:
     
     return True
 
+  def upcomingSensorRuns(self, sensor, horizon):
+    """Sorted start times of schedules within horizon (timedelta) whose valve uses the sensor"""
+    tz = pytz.timezone(self.cfg.timezone)
+    now = tz.localize(self.clock.now().replace(second=0, microsecond=0))
+    # Runs on the sensor's thread: snapshot what a reload or the API may change meanwhile
+    with self._reloadLock:
+      schedules = [list(valve.schedules) for valve in list(self.valves.values())
+                   if valve.enabled and valve.schedules and getattr(valve, 'sensor', None) is sensor]
+    runs = []
+    for day in range(horizon.days + 2):
+      date = now + timedelta(days=day)
+      for valveSchedules in schedules:
+        for sched in valveSchedules:
+          if self.shouldScheduleRun(sched, check_date=date):
+            startTime = self.calculateScheduleTime(sched, date)
+            if now <= startTime <= now + horizon:
+              runs.append(startTime)
+    return sorted(runs)
+
   def evalSched(self, sched, timezone, now):
     """Evaluate if schedule should trigger at the given time"""
     if not self.shouldScheduleRun(sched, check_date=now):
@@ -258,7 +540,7 @@ class Irrigate:
   def getSeason(self, lat, date=None):
     """Get season for a given latitude and optional date (defaults to today)"""
     if date is None:
-      month = datetime.today().month
+      month = self.clock.now().month
     else:
       month = date.month if hasattr(date, 'month') else date
     
@@ -284,6 +566,35 @@ class Irrigate:
 
     return season
 
+  def collectMetrics(self):
+    """Engine state sampled when /metrics is rendered (see engine_metrics.Registry.setCollector)"""
+    # Workers are created after init(); scrapes may come before
+    alive = sum(1 for w in getattr(self, 'workers', []) if w.is_alive())
+    busy = sum(1 for v in self.valves.values() if v.handled)
+    families = [
+      ("irrigate_queue_depth", "gauge", "Irrigation jobs waiting for a worker", (), [((), self.q.qsize())]),
+      ("irrigate_workers", "gauge", "Valve worker threads alive", (), [((), alive)]),
+      ("irrigate_workers_busy", "gauge", "Valve worker threads running a job", (), [((), busy)]),
+      ("irrigate_worker_utilization", "gauge", "Share of alive valve workers running a job", (), [((), busy / alive if alive else 0.0)]),
+    ]
+    channels = self.alerts.channel_health() if self.alerts else []
+    families.append(("irrigate_alert_sends_total", "counter", "Alerts delivered by each channel", ("channel",),
+      [((c["channel"],), c.get("sent", 0)) for c in channels]))
+    families.append(("irrigate_alert_failures_total", "counter", "Alerts a channel did not deliver", ("channel", "reason"),
+      [((c["channel"], reason), c.get(reason, 0)) for c in channels for reason in ("failed", "fast_failed", "rate_limited")]))
+    return families
+
+  def metricsReport(self, archive = False, **options):
+    """
+    Fleet-wide flow analytics over the metrics history (options as for metrics_report.build_report).
+    With archive set, the compressed monthly archives are included as well.
+    """
+    # Include cycles still waiting to be written
+    self.cycleRecorder.flush()
+    if archive:
+      options["archive_dir"] = self.cfg.metricsArchiveDir
+    return build_report(lambda month: self.getSeason(self.cfg.latitude, month), **options)
+
   def checkIrregularFlow(self, valve, total_seconds, total_liters):
     """Check if flow rate is off baseline at end of valve cycle"""
     # Need baseline data
@@ -323,6 +634,8 @@ class Irrigate:
         f"Valve '{valve.name}' flow rate {direction} baseline: {actual_lpm:.2f} L/min vs baseline {valve.baseline_lpm:.2f} L/min ({deviation_pct:+.1f}%)",
         valve_name=valve.name,
         data={
+          # Valves drifting the same way at once likely share a cause (supply pressure, a burst main)
+          "cause": f"flow_{direction}_baseline",
           "actual_lpm": round(actual_lpm, 2),
           "baseline_lpm": valve.baseline_lpm,
           "baseline_std_dev": valve.baseline_std_dev,
@@ -339,7 +652,9 @@ class Irrigate:
     
     if sched.enable_uv_adjustments and hasattr(valve, 'sensor') and valve.sensor:
       try:
+        started = perf.now()
         factor = valve.sensor.getFactor()
+        GET_FACTOR_PROBE.record(started)
         if factor != 1:
           self.logger.debug(f"Job duration adjusted from {sched.duration} to {jobDuration * factor} (factor: {factor}).")
           jobDuration *= factor
@@ -365,12 +680,13 @@ class Irrigate:
     self.logger.info("Valve handler thread '%s' started." % threading.current_thread().name)
     while not self.terminated:
       try:
-        irrigateJob = self.q.get(timeout=5)
+        # Blocks until a job comes or the program exits
+        irrigateJob = self.clock.get(self.q, None, cancel=self._stopped)
         self.logger.info("Thread '%s' picked up job for valve '%s'. Queue size: %s." % (threading.current_thread().name, irrigateJob.valve.name, self.q.qsize()))
         if irrigateJob.valve.handled:
           self.logger.warning("Valve '%s' already handled. Returning to queue in 1 minute." % (irrigateJob.valve.name))
-          time.sleep(61)
-          self.q.put(irrigateJob)
+          # The worker stays free meanwhile; the timer thread puts the job back
+          self.timers.after(61, lambda job=irrigateJob: self.q.put(job))
         else:
           valve = irrigateJob.valve
           valve.handled = True
@@ -386,15 +702,36 @@ class Irrigate:
           valve.secondsRemain = duration.seconds
           valve.secondsDuration = duration.seconds  # Store original duration for progress calculation
           initialOpen = valve.secondsDaily
+          cycleStartDaily = valve.secondsDaily
+          countedSeconds = 0
+          flowSamples = []
           sensorDisabled = False
           openSince = None
-          startTime = datetime.now()
-          while startTime + duration > datetime.now():
+          startTime = self.clock.now()
+          # Open times and the cycle end are on the monotonic clock, immune to wall-clock changes
+          endAt = self.clock.monotonic() + duration.total_seconds()
+          flowAt = self.clock.monotonic() + 60
+
+          def accrue():
+            if valve.is_open and openSince is not None:
+              valve.secondsLast = int(self.clock.monotonic() - openSince)
+              valve.secondsDaily = initialOpen + valve.secondsLast
+            valve.secondsRemain = max(int(endAt - self.clock.monotonic()), 0)
+          # The loop only wakes for events, so readers bring the counters up to date themselves
+          valve.progress = accrue
+          while True:
+            # Taken before the checks: a change made while they run ends the wait below at once
+            changed = self._changed
+            if self.clock.monotonic() >= endAt:
+              break
+            iterationStarted = perf.now()
             # The following two if statements needs to be together and first to prevent
             # the valve from opening if the sensor is disable.
             if irrigateJob.sensor is not None and irrigateJob.sensor.started:
               try:
+                started = perf.now()
                 holdSensorDisabled = irrigateJob.sensor.shouldDisable()
+                SHOULD_DISABLE_PROBE.record(started)
                 if holdSensorDisabled != sensorDisabled:
                   sensorDisabled = holdSensorDisabled
                   self.logger.info("Sensor disable set to '%s' for valve '%s'" % (sensorDisabled, valve.name))
@@ -413,7 +750,7 @@ class Irrigate:
             # Detect manual close during job - valve closed but we still have openSince
             # Check this BEFORE trying to open to prevent re-opening after manual close
             if not valve.is_open and openSince is not None and not sensorDisabled:
-              valve.secondsLast = (datetime.now() - openSince).seconds
+              valve.secondsLast = int(self.clock.monotonic() - openSince)
               valve.secondsDaily = initialOpen + valve.secondsLast
               self.logger.info("Irrigation valve '%s' manually closed. Terminating job. Open time %s seconds." 
                               % (valve.name, valve.secondsLast))
@@ -421,17 +758,17 @@ class Irrigate:
             
             if not valve.is_open and not sensorDisabled:
               valve.is_open = True
-              openSince = datetime.now()
+              openSince = self.clock.monotonic()
               valve.open()
               self.logger.info("Irrigation valve '%s' opened." % (valve.name))
             elif valve.is_open and openSince is None:
               # Valve already open (manually or previous job) - inherit it
-              openSince = datetime.now()
+              openSince = self.clock.monotonic()
               self.logger.info("Irrigation valve '%s' already open, job inheriting." % (valve.name))
 
             if valve.is_open and sensorDisabled:
               valve.is_open = False
-              valve.secondsLast = (datetime.now() - openSince).seconds
+              valve.secondsLast = int(self.clock.monotonic() - openSince)
               openSince = None
               valve.secondsDaily = initialOpen + valve.secondsLast
               initialOpen = valve.secondsDaily
@@ -439,10 +776,7 @@ class Irrigate:
               valve.close()
               self.logger.info("Irrigation valve '%s' closed due to sensor." % (valve.name))
             
-            if valve.is_open:
-              if openSince is not None:
-                valve.secondsLast = (datetime.now() - openSince).seconds
-                valve.secondsDaily = initialOpen + valve.secondsLast
+            accrue()
             if not valve.enabled:
               self.logger.info("Valve '%s' disabled. Terminating irrigation cycle." % (valve.name))
               break
@@ -450,14 +784,31 @@ class Irrigate:
               self.logger.warning("Program exiting. Terminating irrigation cycle for valve '%s'..." % (valve.name))
               break
 
-            valve.secondsRemain = ((startTime + duration) - datetime.now()).seconds
+            cycleOpen = initialOpen - cycleStartDaily + valve.secondsLast
+            if cycleOpen > countedSeconds:
+              engine_metrics.VALVE_OPEN_SECONDS.inc(cycleOpen - countedSeconds, (valve.name,))
+              countedSeconds = cycleOpen
+
             self.logger.debug("Irrigation valve '%s' Last Open = %ss. Remaining = %ss. Daily Total = %ss." \
               % (valve.name, valve.secondsLast, valve.secondsRemain, valve.secondsDaily))
-            time.sleep(1)
-            if valve.waterflow is not None and valve.waterflow.started and self.everyXMinutes(valve.name, 1, False):
+            VALVE_ITERATION_PROBE.record(iterationStarted)
+            # Sleep until the cycle ends, the next flow sample or a change of the valve, a
+            # sensor or shutdown. Readings holding the valve closed may also just age out.
+            wakeAt = min(endAt, flowAt)
+            if sensorDisabled:
+              wakeAt = min(wakeAt, self.clock.monotonic() + self.SENSOR_RECHECK_SECONDS)
+            self.clock.wait(changed, wakeAt - self.clock.monotonic())
+            if self.clock.monotonic() < flowAt:
+              continue
+            flowAt += 60
+            if valve.waterflow is not None and valve.waterflow.started:
+              flowStarted = perf.now()
               _lastLiter_1m = valve.waterflow.lastLiter_1m()
               valve.litersDaily = valve.litersDaily + _lastLiter_1m
               valve.litersLast = valve.litersLast + _lastLiter_1m
+              engine_metrics.VALVE_LITERS.inc(_lastLiter_1m, (valve.name,))
+              if valve.is_open:
+                flowSamples.append(_lastLiter_1m)
               
               # Check for malfunction (no flow after 60 seconds)
               if valve.is_open and valve.secondsLast >= 60 and valve.litersLast == 0:
@@ -467,11 +818,14 @@ class Irrigate:
                   valve_name=valve.name,
                   data={"seconds_open": valve.secondsLast, "liters_detected": valve.litersLast}
                 )
+              VALVE_FLOW_PROBE.record(flowStarted)
 
+          valve.progress = None
           self.logger.info("Irrigation cycle ended for valve '%s'." % (valve.name))
           if valve.is_open:
-            valve.secondsLast = (datetime.now() - openSince).seconds
+            valve.secondsLast = int(self.clock.monotonic() - openSince)
             valve.secondsDaily = initialOpen + valve.secondsLast
+          valve.secondsRemain = 0
           if valve.is_open:
             valve.is_open = False
             valve.close()
@@ -480,6 +834,23 @@ class Irrigate:
           # Check for irregular flow at cycle end
           if valve.waterflow and valve.waterflow.started and valve.secondsLast > 0:
             self.checkIrregularFlow(valve, valve.secondsLast, valve.litersLast)
+
+          cycleSeconds = valve.secondsDaily - cycleStartDaily
+          if cycleSeconds > countedSeconds:
+            engine_metrics.VALVE_OPEN_SECONDS.inc(cycleSeconds - countedSeconds, (valve.name,))
+          self.cycleRecorder.record(CycleRecord(
+            valve_name=valve.name,
+            start=startTime.isoformat(timespec='seconds'),
+            end=self.clock.now().isoformat(timespec='seconds'),
+            seconds=cycleSeconds,
+            liters=round(valve.litersLast, 2),
+            min_lpm=round(min(flowSamples), 2) if flowSamples else None,
+            max_lpm=round(max(flowSamples), 2) if flowSamples else None,
+            mean_lpm=round(valve.litersLast / cycleSeconds * 60, 2) if flowSamples and cycleSeconds > 0 else None,
+            trigger=irrigateJob.trigger))
+
+          # Fold today's totals into the baseline so the next cycle is checked against it
+          self.cycleRecorder.update_baseline(valve, self.clock.now().strftime('%Y-%m-%d'))
           
           # Clear malfunction state for next run
           self.alerts.clear_alert_state(AlertType.MALFUNCTION_NO_FLOW, valve.name)
@@ -502,12 +873,17 @@ class Irrigate:
               irrigateJob.valve.is_open = False
               irrigateJob.valve.close()
               self.logger.info("Safety-closed valve '%s' after error." % irrigateJob.valve.name)
+            irrigateJob.valve.progress = None
             irrigateJob.valve.handled = False
             irrigateJob.valve.waterflow = None
         except Exception:
           pass
     self.logger.warning("Valve handler thread '%s' exited." % threading.current_thread().name)
 
+  # While a sensor holds a valve closed its readings are re-checked this often,
+  # since they can expire (e.g. rain sliding out of the window) without a change event
+  SENSOR_RECHECK_SECONDS = 60
+
   def queueJob(self, job):
     alive_workers = sum(1 for w in self.workers if w.is_alive())
     qsize = self.q.qsize()
@@ -517,97 +893,167 @@ class Irrigate:
     else:
       self.logger.info(f"Valve '{job.valve.name}' adhoc job queued. Duration {job.duration} minutes. Queue size: {qsize + 1}. Worker threads alive: {alive_workers}/{len(self.workers)}.")
 
-  def everyXMinutes(self, key, interval, bootstrap):
-    if not key in self._intervalDict.keys():
-      self._intervalDict[key] = datetime.now()
-      return bootstrap
+  # Longer gaps (e.g. the clock being set at boot) are not caught up
+  SCHEDULER_MAX_CATCHUP = timedelta(minutes=30)
 
-    if datetime.now() >= self._intervalDict[key] + timedelta(minutes=interval):
-      self._intervalDict[key] = datetime.now()
-      return True
+  def dueMinutes(self, now):
+    """
+    Minute boundaries crossed since the last scheduler evaluation, oldest first
+    (now is the current minute, timezone aware). A late tick gets every minute
+    it skipped, so no scheduled start is lost; after the clock is set back
+    nothing is due until the last evaluated minute has passed again.
+    """
+    last = self._lastSchedMinute
+    if last is None or now - last > self.SCHEDULER_MAX_CATCHUP:
+      if last is not None:
+        self.logger.warning(f"Clock moved forward by {now - last}. Schedules in between are not caught up.")
+        engine_metrics.SCHEDULER_SKIPPED_MINUTES.inc((now - last) // timedelta(minutes=1) - 1)
+      self._lastSchedMinute = now
+      return [now]
 
-    return False
+    tz = pytz.timezone(self.cfg.timezone)
+    minutes = []
+    while last < now:
+      last = tz.normalize(last + timedelta(minutes=1))
+      minutes.append(last)
+    if minutes:
+      self._lastSchedMinute = now
+    if len(minutes) > 1:
+      self.logger.warning(f"Scheduler catching up on {len(minutes) - 1} missed minute(s).")
+      engine_metrics.SCHEDULER_CATCHUP_MINUTES.inc(len(minutes) - 1)
+    return minutes
+
+  def evalMinute(self, minute):
+    """Queue the jobs of every schedule starting at minute (evaluated exactly once per minute)"""
+    for aValve in self.valves.values():
+      if aValve.enabled:
+        if aValve.schedules is not None:
+          for valveSched in aValve.schedules:
+            if self.evalSched(valveSched, self.cfg.timezone, minute):
+              jobDuration = self.calculateJobDuration(aValve, valveSched)
+              job = model.Job(valve = aValve, duration = jobDuration, sched = valveSched)
+              self.queueJob(job)
+
+  def dailyRollover(self, midnight):
+    """Close the previous day: write its summaries and reset the daily counters"""
+    # Write yesterday's daily summaries before resetting
+    yesterday = (midnight - timedelta(days=1)).strftime('%Y-%m-%d')
+    write_daily_summaries(self.valves, yesterday, self.logger)
+
+    # Reset daily counters
+    for aValve in self.valves.values():
+      aValve.secondsDaily = 0
+      aValve.litersDaily = 0
+
+    # Reload baselines with updated data
+    load_baselines(self.valves, self.logger, self.clock.now().date())
+    self.alerts.compact_history()
+    try:
+      archive_old_metrics(self.logger, self.cfg.metricsRetentionDays, self.cfg.metricsArchiveDir, self.clock.now().date())
+    except Exception as ex:
+      self.logger.error(f"Error archiving valve metrics: {format(ex)}")
+
+  def registerTimers(self):
+    """(Re-)register the periodic work run by the timer thread; called again when the telemetry settings change"""
+    if self.cfg.telemetry:
+      self.timers.every(self.cfg.telemIdleInterval * 60, self.telemetryIdle, key="idleInterval")
+      self.timers.every(self.cfg.telemActiveInterval * 60, self.telemetryActive, key="activeInterval")
+    else:
+      self.timers.cancel("idleInterval")
+      self.timers.cancel("activeInterval")
+    self.timers.every(60, self.watchConfig, key="configWatch")
+    self.timers.every(60, self.checkLeak, key="checkLeakInterval")
+
+  def telemetryIdle(self):
+    started = perf.now()
+    delta = (self.clock.now() - self.startTime)
+    uptime = ((delta.days * 86400) + delta.seconds) // 60
+    self.mqtt.publish("/svc/uptime", uptime)
+
+    for valve in self.valves.values():
+      self.telemetryValve(valve)
+    self.publishStatus()
+
+    for sensor in self.sensors.keys():
+      self.telemetrySensor(sensor, self.sensors[sensor])
+    TELEMETRY_PROBE.record(started)
+
+  def telemetryActive(self):
+    started = perf.now()
+    for valve in self.valves.values():
+      if valve.handled:
+        self.telemetryValve(valve)
+    TELEMETRY_PROBE.record(started)
+
+  def watchConfig(self):
+    # Runs on the timer thread, which must not stall or die with a failed reload
+    if self.cfg.watchFile and self.cfg.fileChanged():
+      self.reloadInBackground("file changed")
+
+  def checkLeak(self):
+    started = perf.now()
+    if self.waterflow is not None and self.waterflow.started and self.waterflow.leakdetection:
+      all_closed = self.allValvesClosed()
+      # Check for leak (unless in exclusion window)
+      if all_closed:
+        tz = pytz.timezone(self.cfg.timezone)
+        now_tz = tz.localize(self.clock.now())
+
+        if not self.alerts.is_in_exclusion_window(now_tz):
+          flow_rate = self.waterflow.lastLiter_1m()
+          if flow_rate > 0:
+            self.alerts.alert(
+              AlertType.LEAK,
+              f"Leak detected: {flow_rate:.2f} L/min flow with all valves closed",
+              data={"flow_rate_lpm": flow_rate}
+            )
+            self.setTempStatus("Leaking")
+          else:
+            # Leak resolved
+            self.alerts.clear_alert_state(AlertType.LEAK)
+            self.clearTempStatus("Leaking")
+        else:
+          # In exclusion window - clear any existing leak state
+          self.alerts.clear_alert_state(AlertType.LEAK)
+          self.clearTempStatus("Leaking")
+    LEAK_CHECK_PROBE.record(started)
 
   def timerThread(self):
     try:
       while True:
+        tickStarted = perf.now()
         tz = pytz.timezone(self.cfg.timezone)
-        now = tz.localize(datetime.now().replace(second=0, microsecond=0))
+        now = tz.localize(self.clock.now().replace(second=0, microsecond=0))
 
-        if now.hour == 0 and now.minute == 0:
-          # Write yesterday's daily summaries before resetting
-          yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-          write_daily_summaries(self.valves, yesterday, self.logger)
-          
-          # Reset daily counters
-          for aValve in self.valves.values():
-            aValve.secondsDaily = 0
-            aValve.litersDaily = 0
-          
-          # Reload baselines with updated data
-          load_baselines(self.valves, self.logger)
+        self.timers.advance()
 
-        if self.cfg.telemetry and self.everyXMinutes("idleInterval", self.cfg.telemIdleInterval, False):
-          delta = (datetime.now() - self.startTime)
-          uptime = ((delta.days * 86400) + delta.seconds) // 60
-          self.mqtt.publish("/svc/uptime", uptime)
-          
-          for valve in self.valves.values():
-            self.telemetryValve(valve)
-          self.publishStatus()
-
-          for sensor in self.sensors.keys():
-            self.telemetrySensor(sensor, self.sensors[sensor])
-
-        if self.cfg.telemetry and self.everyXMinutes("activeInterval", self.cfg.telemActiveInterval, False):
-          for valve in self.valves.values():
-            if valve.handled:
-              self.telemetryValve(valve)
-
-        if self.everyXMinutes("checkLeakInterval", 1, False):
-          if self.waterflow is not None and self.waterflow.started and self.waterflow.leakdetection:
-            all_closed = self.allValvesClosed()
-            # Check for leak (unless in exclusion window)
-            if all_closed:
-              tz = pytz.timezone(self.cfg.timezone)
-              now_tz = tz.localize(datetime.now())
-              
-              if not self.alerts.is_in_exclusion_window(now_tz):
-                flow_rate = self.waterflow.lastLiter_1m()
-                if flow_rate > 0:
-                  self.alerts.alert(
-                    AlertType.LEAK,
-                    f"Leak detected: {flow_rate:.2f} L/min flow with all valves closed",
-                    data={"flow_rate_lpm": flow_rate}
-                  )
-                  self.setTempStatus("Leaking")
-                else:
-                  # Leak resolved
-                  self.alerts.clear_alert_state(AlertType.LEAK)
-                  self.clearTempStatus("Leaking")
-              else:
-                # In exclusion window - clear any existing leak state
-                self.alerts.clear_alert_state(AlertType.LEAK)
-                self.clearTempStatus("Leaking")
-
-        if self.everyXMinutes("scheduler", 1, True):
-          # Must not evaluate more or less than once every minute otherwise running jobs will get queued again
-          for aValve in self.valves.values():
-            if aValve.enabled:
-              if aValve.schedules is not None:
-                for valveSched in aValve.schedules:
-                  if self.evalSched(valveSched, self.cfg.timezone, now):
-                    jobDuration = self.calculateJobDuration(aValve, valveSched)
-                    job = model.Job(valve = aValve, duration = jobDuration, sched = valveSched)
-                    self.queueJob(job)
-
-        time.sleep(1)
+        minutes = self.dueMinutes(now)
+        if minutes:
+          started = perf.now()
+          # Lag of the oldest minute in the batch: how late its evaluation is
+          engine_metrics.SCHEDULER_TICK_LAG.set((self.clock.now() - minutes[0].replace(tzinfo=None)).total_seconds())
+          for minute in minutes:
+            if minute.hour == 0 and minute.minute == 0:
+              self.dailyRollover(minute)
+            self.evalMinute(minute)
+          SCHEDULER_PROBE.record(started)
+
+        TICK_PROBE.record(tickStarted)
+        self.clock.wait(self.timers.added, self.nextTickIn())
     except Exception as ex:
       traceback.print_exc(ex)
       self.setStatus("Terminating")
       self.logger.error("Timer thread exited with error '%s'. Terminating Irrigate!" % format(ex))
       self.terminated = True
   
+  def nextTickIn(self):
+    """Seconds the timer thread can sleep: until the next minute to evaluate or the next due timer"""
+    self.timers.added.clear()
+    now = self.clock.now()
+    seconds = 60 - now.second - now.microsecond / 1e6
+    due = self.timers.nextDue()
+    return seconds if due is None else min(seconds, due)
+
   def setTempStatus(self, tempStatus):
     self._tempStatus[tempStatus] = True
     self.publishStatus()
@@ -637,11 +1083,12 @@ class Irrigate:
     # report interval, typically 10 seconds). So AllValvesClosed will report True only 60 seconds
     # after all valves have been closed.
     if self._lastAllClosed is None:
-      self._lastAllClosed = datetime.now()
+      self._lastAllClosed = self.clock.monotonic()
 
-    return datetime.now() >= self._lastAllClosed + timedelta(0, 60)
+    return self.clock.monotonic() >= self._lastAllClosed + 60
 
   def telemetryValve(self, valve):
+    valve.updateProgress()
     statusStr = "enabled"
     if not valve.enabled:
       statusStr = "disabled"
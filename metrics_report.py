@@ -0,0 +1,246 @@
+"""
+Fleet-wide flow analytics over the valve metrics history.
+
+build_report() loads the daily summaries of all valves in one query and
+computes per-valve baselines (same statistics as valve_metrics.compute_baseline),
+z-scores of the most recent cycles, seasonal comparisons and weekly/monthly
+water totals. With numpy installed the summaries are read as typed columns
+(day numbers rather than date strings) and all valves are aggregated in one
+vectorized pass; otherwise an equivalent pure-Python pass is used.
+"""
+from datetime import date, datetime, timedelta
+
+from valve_metrics import BASELINE_DAYS, TREND_SAMPLES, compute_baseline, get_store, iter_archived_daily
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _season_year(year, month):
+    # December belongs to the season that continues into the next year
+    return year + 1 if month == 12 else year
+
+
+def _aggregate_python(rows, cutoff, season_of):
+    days_recorded, weekly, monthly, seasons = {}, {}, {}, {}
+    window = {}
+    for valve_name, day, seconds, liters, lpm in rows:
+        d = date.fromisoformat(day)
+        days_recorded[valve_name] = days_recorded.get(valve_name, 0) + 1
+        if day > cutoff:
+            window.setdefault(valve_name, []).append(lpm)
+
+        week = weekly.setdefault(valve_name, {}).setdefault((d - timedelta(days=d.weekday())).isoformat(), [0.0, 0.0])
+        week[0] += seconds
+        week[1] += liters
+        month = monthly.setdefault(valve_name, {}).setdefault(day[:7], [0.0, 0.0])
+        month[0] += seconds
+        month[1] += liters
+        season = seasons.setdefault(valve_name, {}).setdefault((_season_year(d.year, d.month), season_of(d.month)), [0, 0.0, 0.0])
+        season[0] += 1
+        season[1] += liters
+        season[2] += lpm
+
+    result = {}
+    for valve_name, count in days_recorded.items():
+        lpm_values = window.get(valve_name, [])
+        baseline = compute_baseline(lpm_values) if lpm_values else (None, None, None)
+        result[valve_name] = {
+            "days_recorded": count,
+            "samples": len(lpm_values),
+            "baseline": baseline,
+            "weekly": sorted((k, v[0], v[1]) for k, v in weekly[valve_name].items()),
+            "monthly": sorted((k, v[0], v[1]) for k, v in monthly[valve_name].items()),
+            "seasons": {k: (v[0], v[1], v[2] / v[0]) for k, v in seasons[valve_name].items()},
+        }
+    return result
+
+
+def _group_sums(codes, periods, *values):
+    """Sum values per (valve code, period) pair; returns (codes, periods, sums...) of the groups"""
+    span = int(periods.max()) + 1
+    unique, inverse = np.unique(codes.astype(np.int64) * span + periods, return_inverse=True)
+    sums = [np.bincount(inverse, weights=v, minlength=len(unique)) for v in values]
+    return (unique // span, unique % span, *sums)
+
+
+def _columns(rows):
+    """daily_rows()-shaped rows, ordered by valve and date, as MetricsStore.daily_columns() output"""
+    counts = {}
+    for row in rows:
+        counts[row[0]] = counts.get(row[0], 0) + 1
+    epoch = date(1970, 1, 1).toordinal()
+    return (list(counts), list(counts.values()),
+            [(date.fromisoformat(day).toordinal() - epoch, seconds, liters, lpm) for _, day, seconds, liters, lpm in rows])
+
+
+def _aggregate_numpy(valve_names, counts, rows, cutoff, season_of):
+    columns = np.array(rows, dtype=float)
+    day_numbers = columns[:, 0].astype(np.int64)
+    seconds, liters, lpm = columns[:, 1], columns[:, 2], columns[:, 3]
+    codes = np.repeat(np.arange(len(valve_names)), counts)
+    k = len(valve_names)
+    days_recorded = np.bincount(codes, minlength=k)
+
+    # Baselines over the window; rows are ordered by valve then date
+    inside = day_numbers > (date.fromisoformat(cutoff) - date(1970, 1, 1)).days
+    w_codes, w_lpm = codes[inside], lpm[inside]
+    n = np.bincount(w_codes, minlength=k)
+    starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+    pos = np.arange(len(w_codes)) - starts[w_codes]
+    nn = n[w_codes]
+    weight = np.where(pos < nn / 3, 0.5, np.where(pos < 2 * nn / 3, 1.0, 1.5))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        baseline = np.bincount(w_codes, weight * w_lpm, k) / np.bincount(w_codes, weight, k)
+        mean = np.bincount(w_codes, w_lpm, k) / n
+        dev = w_lpm - mean[w_codes]
+        std = np.where(n > 1, np.sqrt(np.bincount(w_codes, dev ** 2, k) / (n - 1)), 0.0)
+        x_dev = pos - ((n - 1) / 2)[w_codes]
+        denominator = np.bincount(w_codes, x_dev ** 2, k)
+        slope = np.where(denominator != 0, np.bincount(w_codes, x_dev * dev, k) / denominator, 0.0)
+        trend = np.where(baseline > 0, slope * 30 / baseline * 100, 0.0)
+
+    # Weekly and monthly totals: Mondays (1970-01-01 was a Thursday) and calendar months
+    days = day_numbers.astype("datetime64[D]")
+    week_starts = day_numbers - (day_numbers + 3) % 7
+    week_base = int(week_starts.min())
+    months = days.astype("datetime64[M]").astype(np.int64)
+    month_base = int(months.min())
+    w_code, w_period, w_seconds, w_liters = _group_sums(codes, week_starts - week_base, seconds, liters)
+    m_code, m_period, m_seconds, m_liters = _group_sums(codes, months - month_base, seconds, liters)
+
+    # Seasons: (season year, season) per valve
+    month_of_year = months % 12 + 1
+    season_names = [season_of(month) for month in range(1, 13)]
+    season_labels = sorted(set(season_names))
+    season_index = np.array([season_labels.index(name) for name in season_names])[month_of_year - 1]
+    season_years = months // 12 + 1970 + (month_of_year == 12)
+    year_base = int(season_years.min())
+    s_code, s_period, s_days, s_liters, s_lpm = _group_sums(
+        codes, (season_years - year_base) * len(season_labels) + season_index, np.ones(len(codes)), liters, lpm)
+
+    result = {}
+    for code, valve_name in enumerate(valve_names):
+        samples = int(n[code])
+        result[valve_name] = {
+            "days_recorded": int(days_recorded[code]),
+            "samples": samples,
+            "baseline": (float(baseline[code]), float(std[code]) if samples > 1 else 0,
+                         float(trend[code]) if samples >= TREND_SAMPLES else None) if samples else (None, None, None),
+            "weekly": [], "monthly": [], "seasons": {},
+        }
+    weeks = np.datetime_as_string(np.datetime64(week_base, "D") + w_period).tolist()
+    for code, week, secs, lit in zip(w_code.tolist(), weeks, w_seconds.tolist(), w_liters.tolist()):
+        result[valve_names[code]]["weekly"].append((week, secs, lit))
+    months = np.datetime_as_string(np.datetime64(month_base, "M") + m_period).tolist()
+    for code, month, secs, lit in zip(m_code.tolist(), months, m_seconds.tolist(), m_liters.tolist()):
+        result[valve_names[code]]["monthly"].append((month, secs, lit))
+    for code, period, count, lit, lpm_sum in zip(s_code.tolist(), s_period.tolist(), s_days.tolist(), s_liters.tolist(), s_lpm.tolist()):
+        key = (year_base + period // len(season_labels), season_labels[period % len(season_labels)])
+        result[valve_names[code]]["seasons"][key] = (int(count), lit, lpm_sum / count)
+    return result
+
+
+def build_report(season_of, store=None, now=None, weeks=12, months=12, recent_cycles=5, use_numpy=None, archive_dir=None):
+    """
+    Build the analytics report for every valve with recorded history.
+
+    Args:
+        season_of: Callable(month) -> season name for the installation's hemisphere
+        store: MetricsStore (defaults to the process-wide store)
+        now: Report time (defaults to now)
+        weeks, months: Number of most recent weekly/monthly totals to include
+        recent_cycles: Number of most recent cycles per valve to score
+        use_numpy: Set to False to use the pure-Python pass even when numpy is installed
+        archive_dir: Also stream the monthly archives in this directory (older history)
+    """
+    store = get_store() if store is None else store
+    now = datetime.now() if now is None else now
+    use_numpy = np is not None and use_numpy is not False
+    cutoff = (now.date() - timedelta(days=BASELINE_DAYS)).isoformat()
+
+    if use_numpy and archive_dir is None:
+        # Typed columns straight from SQLite: no date strings to parse
+        valve_names, counts, rows = store.daily_columns()
+    else:
+        rows = store.daily_rows()
+        if archive_dir is not None:
+            rows.extend(iter_archived_daily(archive_dir=archive_dir))
+            rows.sort(key=lambda row: (row[0], row[1]))
+        if use_numpy:
+            valve_names, counts, rows = _columns(rows)
+    aggregate = _aggregate_numpy if use_numpy and rows else _aggregate_python
+    per_valve = _aggregate_numpy(valve_names, counts, rows, cutoff, season_of) if aggregate is _aggregate_numpy else _aggregate_python(rows, cutoff, season_of)
+    cycles = store.recent_cycles(recent_cycles)
+
+    current = (_season_year(now.year, now.month), season_of(now.month))
+    previous = (current[0] - 1, current[1])
+    fleet_weekly, fleet_monthly = {}, {}
+    valves = []
+    for valve_name, data in sorted(per_valve.items()):
+        baseline_lpm, std_dev, trend_pct = data["baseline"]
+        recent = []
+        for cycle in cycles.get(valve_name, []):
+            z_score = None
+            if cycle.mean_lpm is not None and baseline_lpm is not None and std_dev:
+                z_score = round((cycle.mean_lpm - baseline_lpm) / std_dev, 2)
+            recent.append({"start": cycle.start, "seconds": cycle.seconds, "liters": cycle.liters,
+                           "mean_lpm": cycle.mean_lpm, "trigger": cycle.trigger, "z_score": z_score})
+
+        season_change = None
+        if current in data["seasons"] and previous in data["seasons"] and data["seasons"][previous][2] > 0:
+            season_change = round((data["seasons"][current][2] / data["seasons"][previous][2] - 1) * 100, 2)
+
+        for week, secs, lit in data["weekly"]:
+            fleet_weekly[week] = fleet_weekly.get(week, 0.0) + lit
+        for month, secs, lit in data["monthly"]:
+            fleet_monthly[month] = fleet_monthly.get(month, 0.0) + lit
+
+        valves.append({
+            "name": valve_name,
+            "days_recorded": data["days_recorded"],
+            "samples": data["samples"],
+            "baseline_lpm": round(baseline_lpm, 2) if baseline_lpm is not None else None,
+            "std_dev": round(std_dev, 2) if std_dev is not None else None,
+            "trend_pct": round(trend_pct, 2) if trend_pct is not None else None,
+            "recent_cycles": recent,
+            "seasons": [{"season_year": year, "season": season, "days": count,
+                         "liters": round(lit, 2), "avg_lpm": round(avg, 2)}
+                        for (year, season), (count, lit, avg) in sorted(data["seasons"].items())],
+            "season_change_pct": season_change,
+            "weekly": [{"week_start": week, "seconds": int(secs), "liters": round(lit, 2)}
+                       for week, secs, lit in data["weekly"][-weeks:]],
+            "monthly": [{"month": month, "seconds": int(secs), "liters": round(lit, 2)}
+                        for month, secs, lit in data["monthly"][-months:]],
+        })
+
+    return {
+        "generated_at": now.isoformat(timespec="seconds"),
+        "engine": "numpy" if aggregate is _aggregate_numpy else "python",
+        "window_days": BASELINE_DAYS,
+        "current_season": {"season_year": current[0], "season": current[1]},
+        "valves": valves,
+        "totals": {
+            "weekly": [{"week_start": week, "liters": round(lit, 2)} for week, lit in sorted(fleet_weekly.items())[-weeks:]],
+            "monthly": [{"month": month, "liters": round(lit, 2)} for month, lit in sorted(fleet_monthly.items())[-months:]],
+        },
+    }
+
+
+def format_report(report):
+    """Plain-text rendering of build_report() output for the command line"""
+    lines = [f"Flow report {report['generated_at']} ({report['engine']}, {report['window_days']}-day baselines, "
+             f"season: {report['current_season']['season']} {report['current_season']['season_year']})", ""]
+    lines.append(f"{'Valve':<20} {'Days':>6} {'L/min':>8} {'StdDev':>8} {'Trend%':>8} {'Season%':>8} {'Last z':>8}")
+    for valve in report["valves"]:
+        last_z = valve["recent_cycles"][0]["z_score"] if valve["recent_cycles"] else None
+        cells = [valve["baseline_lpm"], valve["std_dev"], valve["trend_pct"], valve["season_change_pct"], last_z]
+        lines.append(f"{valve['name']:<20} {valve['days_recorded']:>6} " +
+                     " ".join(f"{'-' if c is None else format(c, '.2f'):>8}" for c in cells))
+
+    lines.append("")
+    lines.append("Monthly water use (L): " + ", ".join(f"{m['month']} {m['liters']:.0f}" for m in report["totals"]["monthly"]))
+    lines.append("Weekly water use (L):  " + ", ".join(f"{w['week_start']} {w['liters']:.0f}" for w in report["totals"]["weekly"]))
+    return "\n".join(lines)
@@ -1,6 +1,8 @@
 class Job:
-  def __init__(self, valve, duration, sched):
+  def __init__(self, valve, duration, sched, trigger = None):
     self.valve = valve
     self.duration = duration
     self.sched = sched
+    # What started the job: "schedule", "mqtt", "api" or "manual"
+    self.trigger = trigger if trigger is not None else ("schedule" if sched is not None else "manual")
     self.sensor = valve.sensor if hasattr(valve, "sensor") and sched is not None else None
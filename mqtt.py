@@ -1,8 +1,13 @@
 import time
 import model
+import perf
 import threading
+import engine_metrics
+from config import topicName
 from paho.mqtt import client
 
+PUBLISH_PROBE = perf.probe("mqtt.publish")
+
 class Mqtt:
   def __init__(self, irrigate):
     self.logger = irrigate.logger
@@ -10,6 +15,14 @@ class Mqtt:
     self.valves = irrigate.valves
     self.irrigate = irrigate
     self.mqttStarted = False
+    self.mqttClient = None
+    self.terminated = False
+    self._connectedBefore = False
+    self.indexValves()
+
+  def indexValves(self):
+    """Rebuild the topic level -> valve name index (call whenever valves are added or removed)"""
+    self.valveTopics = {topicName(name): name for name in self.valves}
 
   def start(self):
     self.logger.info("Connecting to MQTT service '%s'..." % self.cfg.mqttHostName)
@@ -21,6 +34,7 @@ class Mqtt:
 
       worker = threading.Thread(target=self.mqttLooper, args=())
       worker.daemon = True
+      worker.name = "MqttTh"
       worker.start()
       while not self.mqttClient.is_connected():
         self.logger.info("Waiting for MQTT connection...")
@@ -46,17 +60,17 @@ class Mqtt:
 
   def mqttLooper(self):
     self.logger.info("MQTT thread started...")
-    while not self.irrigate.terminated:
+    while not self.irrigate.terminated and not self.terminated:
       try:
         self.mqttClient.loop_forever(retry_first_connection=True)
         # If we reach here, loop exited
-        if self.irrigate.terminated:
+        if self.irrigate.terminated or self.terminated:
           break
         self.logger.warning("MQTT loop exited, reconnecting...")
         time.sleep(5)
       except Exception as ex:
         self.logger.error("MQTT loop exception: %s. Reconnecting..." % format(ex))
-        if self.irrigate.terminated:
+        if self.irrigate.terminated or self.terminated:
           break
         time.sleep(5)
     self.logger.info("MQTT thread terminated")
@@ -65,6 +79,9 @@ class Mqtt:
     if rc == 0:
       self.logger.info("Connected to MQTT Broker. Registering subscriptions...")
       self.mqttStarted = True
+      if self._connectedBefore:
+        engine_metrics.MQTT_RECONNECTS.inc()
+      self._connectedBefore = True
       # Re-register all subscriptions on every connect/reconnect
       self.registerTopics(self.topicPrefix, "queue")
       self.registerTopics(self.topicPrefix, "enabled")
@@ -82,6 +99,7 @@ class Mqtt:
 
   def shutdown(self):
     """Gracefully shutdown MQTT connection"""
+    self.terminated = True
     if self.mqttClient:
       try:
         self.logger.info("Shutting down MQTT connection...")
@@ -95,6 +113,13 @@ class Mqtt:
     self.processMessages(msg.topic, msg.payload)
 
   def publish(self, topic, payload):
+    started = perf.now()
+    try:
+      return self._publish(topic, payload)
+    finally:
+      PUBLISH_PROBE.record(started)
+
+  def _publish(self, topic, payload):
     topicPrefix = str(self.cfg.mqttClientName)
     if not topic.startswith("/"):
       topicPrefix = topicPrefix + "/raspi/"
@@ -102,19 +127,23 @@ class Mqtt:
     full_topic = topicPrefix + topic
     
     if not self.mqttStarted:
+      engine_metrics.MQTT_DROPS.inc(labels=("not_connected",))
       self.logger.debug("MQTT not connected. Message for topic '%s' not published." % full_topic)
       return False
     
     try:
       result = self.mqttClient.publish(full_topic, payload)
       if result.rc != 0:
+        engine_metrics.MQTT_DROPS.inc(labels=("error",))
         self.logger.warning("MQTT publish failed for topic '%s' with return code %d" % (full_topic, result.rc))
         return False
       
+      engine_metrics.MQTT_PUBLISHES.inc()
       self.logger.debug("MQTT message published for topic '%s' payload '%s'." % (full_topic, payload))
       return True
       
     except Exception as ex:
+      engine_metrics.MQTT_DROPS.inc(labels=("error",))
       self.logger.error("MQTT publish exception for topic '%s': %s" % (full_topic, format(ex)))
       return False
 
@@ -122,14 +151,14 @@ class Mqtt:
     self.logger.debug("MQTT message received for topic '%s' payload '%s'." % (topic, payload))
     try:
       topicParts = topic.split("/")
-      valveName = topicParts[2].replace('_', ' ')
-      if valveName not in self.valves:
-        raise Exception(f"Valve name '{valveName}' does not exist in configuration. Ignoring message.")
+      valveName = self.valveTopics.get(topicParts[2])
+      if valveName is None or valveName not in self.valves:
+        raise Exception(f"Valve name '{topicParts[2]}' does not exist in configuration. Ignoring message.")
 
       valves = self.valves
 
       if topicParts[1] == "queue":
-        self.irrigate.queueJob(model.Job(valve=valves[valveName], sched=None, duration=float(payload)))
+        self.irrigate.queueJob(model.Job(valve=valves[valveName], sched=None, duration=float(payload), trigger="mqtt"))
         return
 
       try:
@@ -0,0 +1,60 @@
+"""
+On-demand statistical profiler for all threads of the process.
+
+sample() wakes every interval seconds on the calling thread, reads the current
+frame of every other thread (sys._current_frames) and counts the stacks. It
+only reads interpreter state, so it is safe while valves are open; the cost
+to the other threads is the GIL hand-off at each sample. collapse() renders
+the counts in the collapsed-stack format read by flamegraph.pl and speedscope:
+
+  ThreadName;module.py:outer;module.py:inner 42
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+MAX_SECONDS = 300
+
+_busy = threading.Lock()
+
+class ProfilerBusy(Exception):
+  pass
+
+def _frameLabel(frame):
+  return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+def sample(seconds, interval = 0.005):
+  """
+  Sample all other threads for seconds. Returns (Counter of collapsed stack
+  strings, number of sampling rounds). Only one profile runs at a time;
+  raises ProfilerBusy otherwise.
+  """
+  if not _busy.acquire(blocking=False):
+    raise ProfilerBusy("A profile is already running")
+  try:
+    stacks = Counter()
+    own = threading.get_ident()
+    rounds = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+      names = {t.ident: t.name for t in threading.enumerate()}
+      for ident, frame in sys._current_frames().items():
+        if ident == own:
+          continue
+        labels = []
+        while frame is not None:
+          labels.append(_frameLabel(frame))
+          frame = frame.f_back
+        labels.append(names.get(ident, f"thread-{ident}"))
+        stacks[";".join(reversed(labels))] += 1
+      rounds += 1
+      time.sleep(interval)
+    return stacks, rounds
+  finally:
+    _busy.release()
+
+def collapse(stacks):
+  """Collapsed-stack text, most frequent stacks first"""
+  return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -52,7 +52,7 @@ class ScheduleSimulator:
           if value.count('-') == 2:
             self.override_date = datetime.strptime(value, '%Y-%m-%d').date()
           else:
-            year = datetime.now().year
+            year = self.irrigate.clock.now().year
             self.override_date = datetime.strptime(f"{year}-{value}", '%Y-%m-%d').date()
           self.logger.info(f"Override date: {self.override_date}")
         
@@ -94,7 +94,7 @@ class ScheduleSimulator:
   def get_simulation_datetime(self):
     """Get the datetime to use for simulation (either override or current)"""
     tz = pytz.timezone(self.irrigate.cfg.timezone)
-    now = tz.localize(datetime.now())
+    now = tz.localize(self.irrigate.clock.now())
     
     if self.override_date or self.override_time:
       # Start with current datetime
@@ -1,19 +1,85 @@
+import os
+import json
+import threading
+
+from clock import SYSTEM as SYSTEM_CLOCK
+from sensors.refresh_planner import RefreshPlanner
+
+# Serializes writes to the shared state file across sensors
+_stateLock = threading.Lock()
+
 class BaseSensor():
+  # Last known readings of every sensor, keyed by sensor name, so a restarted
+  # daemon can make decisions before the first network refresh completes.
+  STATE_FILE = os.path.join("data", "sensor_state.json")
+
   def __init__(self, logger, config):
     self.name = config.name
     self.logger = logger
     self.config = config
     self.enabled = config.enabled
+    # Called when the readings shouldDisable() answers from change, so open valves re-check it
+    self.onChange = None
+    self.refreshPlanner = RefreshPlanner(config.refresh if hasattr(config, 'refresh') else None)
+    self.setClock(SYSTEM_CLOCK)
     self.disable = False
     self.uv = 10.2
     self.exception = False
     self.started = False
     self.uv_adjustments = config.uv_adjustments if hasattr(config, 'uv_adjustments') else []
 
+  def setClock(self, clock):
+    """Use clock (the engine's) for readings, fetch planning and retries"""
+    self.clock = clock
+    self.refreshPlanner.clock = clock
+
+  @property
+  def disable(self):
+    return self._disable
+
+  @disable.setter
+  def disable(self, disable):
+    self._disable = disable
+    self.changed()
+
+  def changed(self):
+    if self.onChange is not None:
+      self.onChange()
+
   def getFactor(self):
     """Default implementation returns 1.0 (no adjustment)"""
     return 1.0
 
+  def loadState(self):
+    """Return the state last saved by this sensor, or None"""
+    try:
+      with open(self.STATE_FILE, 'r') as f:
+        return json.load(f).get(self.name)
+    except FileNotFoundError:
+      return None
+    except Exception as ex:
+      self.logger.warning(f"Ignoring unreadable sensor state file '{self.STATE_FILE}': {ex}")
+      return None
+
+  def saveState(self, state):
+    """Persist this sensor's state (a JSON-serializable dict) atomically"""
+    with _stateLock:
+      try:
+        allStates = {}
+        try:
+          with open(self.STATE_FILE, 'r') as f:
+            allStates = json.load(f)
+        except (FileNotFoundError, ValueError):
+          pass
+        allStates[self.name] = state
+        os.makedirs(os.path.dirname(self.STATE_FILE) or ".", exist_ok=True)
+        tmpFile = self.STATE_FILE + ".tmp"
+        with open(tmpFile, 'w') as f:
+          json.dump(allStates, f)
+        os.replace(tmpFile, self.STATE_FILE)
+      except Exception as ex:
+        self.logger.warning(f"Failed to save state of sensor '{self.name}': {ex}")
+
 class TestSensor(BaseSensor):
   # Can be called multiple times. Make sure to initialize only once
   def start(self):
@@ -70,3 +136,7 @@ def sensorFactory(type, logger, config):
   if type == 'openweathermap':
     from sensors.openweathermap_sensor import OpenWeatherMapSensor
     return OpenWeatherMapSensor(logger, config)
+
+  if type == 'mqtt':
+    from sensors.mqtt_sensor import MqttWeatherSensor
+    return MqttWeatherSensor(logger, config)
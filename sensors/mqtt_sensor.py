@@ -0,0 +1,230 @@
+from threading import Lock
+from paho.mqtt import client
+
+from sensors.base_sensor import BaseSensor
+
+class RingBuffer():
+  """
+  Fixed-size time buckets covering a sliding window. Values falling in the same
+  bucket are combined (summed, or max'ed when keepMax is set) and buckets that
+  slide out of the window are reset, so memory never grows. The running total
+  is kept incrementally, so reading it is O(1). Times are epoch seconds of the
+  caller's clock.
+  """
+  def __init__(self, windowSeconds, buckets, keepMax = False):
+    self.bucketSeconds = windowSeconds / buckets
+    self.keepMax = keepMax
+    self._slots = [None] * buckets
+    self._current = None
+    self._total = 0.0
+
+  def _advance(self, now):
+    bucket = int(now // self.bucketSeconds)
+    if self._current is None or bucket - self._current >= len(self._slots):
+      if self._current is not None:
+        self._slots = [None] * len(self._slots)
+        self._total = 0.0
+      self._current = bucket
+      return
+    while self._current < bucket:
+      self._current += 1
+      slot = self._current % len(self._slots)
+      if self._slots[slot] is not None:
+        self._total -= self._slots[slot]
+        self._slots[slot] = None
+
+  def add(self, value, now):
+    self._advance(now)
+    slot = self._current % len(self._slots)
+    if self._slots[slot] is None:
+      self._slots[slot] = value
+      self._total += value
+    elif self.keepMax:
+      self._slots[slot] = max(self._slots[slot], value)
+    else:
+      self._slots[slot] += value
+      self._total += value
+
+  def sum(self, now):
+    self._advance(now)
+    return max(0.0, self._total)
+
+  def max(self, now):
+    self._advance(now)
+    values = [value for value in self._slots if value is not None]
+    return max(values) if values else None
+
+  def snapshot(self):
+    return {"current": self._current, "slots": list(self._slots)}
+
+  def restore(self, snapshot):
+    if len(snapshot["slots"]) != len(self._slots):
+      raise ValueError("window size changed")
+    self._current = snapshot["current"]
+    self._slots = list(snapshot["slots"])
+    self._total = sum(value for value in self._slots if value is not None)
+
+class MqttWeatherSensor(BaseSensor):
+  """
+  Local weather station publishing to MQTT. Rain gauge messages carry the mm
+  fallen since the previous message and are summed over the last
+  days_to_aggregate days in hourly buckets. UV messages carry the current index;
+  the factor uses the peak of the last 24 hours, like the daily UV of forecast
+  sensors. An optional soil moisture topic disables irrigation while the soil
+  is wetter than soil_moisture.disable_above_percent.
+  """
+  # Soil moisture readings older than this are ignored
+  SOIL_MAX_AGE = 6 * 60 * 60
+  # Rain/UV buffers are saved at most this often, and on shutdown
+  SAVE_INTERVAL = 10 * 60
+
+  def __init__(self, logger, config):
+    BaseSensor.__init__(self, logger, config)
+    self.type = 'MqttWeather'
+    self.hostname = config.hostname
+    self.port = config.port if hasattr(config, 'port') else 1883
+    self.clientName = config.client_name if hasattr(config, 'client_name') else f"irrigate-{config.name}"
+    self.rainTopic = config.topics.rain if hasattr(config.topics, 'rain') else None
+    self.uvTopic = config.topics.uv if hasattr(config.topics, 'uv') else None
+    self.soilTopic = config.topics.soil_moisture if hasattr(config.topics, 'soil_moisture') else None
+    self._sendTelemetry = False
+    self.mqttClient = None
+
+    if hasattr(config, 'precipitation'):
+      self.precip_days = config.precipitation.days_to_aggregate if hasattr(config.precipitation, 'days_to_aggregate') else 3
+      self.precip_threshold = config.precipitation.disable_threshold_mm if hasattr(config.precipitation, 'disable_threshold_mm') else 1.0
+    else:
+      self.precip_days = 3
+      self.precip_threshold = 1.0
+    self.soil_threshold = config.soil_moisture.disable_above_percent if hasattr(config, 'soil_moisture') else None
+
+    self._lock = Lock()
+    self._rain = RingBuffer(max(1, self.precip_days) * 24 * 60 * 60, max(1, self.precip_days) * 24)
+    self._uvPeak = RingBuffer(24 * 60 * 60, 24, keepMax=True)
+    self.uv = None
+    self.soilMoisture = None
+    self._soilUpdated = 0
+    self._dirty = False
+    self._lastSave = None
+
+    state = self.loadState()
+    if state is not None:
+      try:
+        self._rain.restore(state["rain"])
+        self._uvPeak.restore(state["uvPeak"])
+        self.logger.info(f"Sensor '{self.name}' restored {self._rain.sum(self.clock.time()):.1f}mm recent precipitation")
+      except (KeyError, TypeError, ValueError) as ex:
+        self.logger.warning(f"Ignoring saved state of sensor '{self.name}': {ex}")
+
+  # Can be called multiple times. Make sure to initialize only once
+  def start(self):
+    if self.started:
+      return
+
+    self.logger.info(f"Sensor MqttWeather '{self.name}' connecting to '{self.hostname}'...")
+    self.mqttClient = client.Client(client.CallbackAPIVersion.VERSION1, self.clientName)
+    self.mqttClient.on_connect = self.on_connect
+    self.mqttClient.on_message = self.on_message
+    # Connect in the background; paho keeps reconnecting on its own network thread
+    self.mqttClient.connect_async(self.hostname, self.port)
+    self.mqttClient.loop_start()
+    self.started = True
+
+  def shutdown(self):
+    if self.mqttClient:
+      try:
+        self.mqttClient.disconnect()
+        self.mqttClient.loop_stop()
+      except Exception as ex:
+        self.logger.error(f"Sensor MqttWeather '{self.name}' error during shutdown: {ex}")
+    self.persistState()
+
+  def persistState(self, force = True):
+    """Save the rain/UV buffers if they changed; unless forced, only once per SAVE_INTERVAL"""
+    with self._lock:
+      if not self._dirty:
+        return
+      if not force and self._lastSave is not None and self.clock.monotonic() - self._lastSave < self.SAVE_INTERVAL:
+        return
+      self._dirty = False
+      self._lastSave = self.clock.monotonic()
+      state = {"rain": self._rain.snapshot(), "uvPeak": self._uvPeak.snapshot()}
+    self.saveState(state)
+
+  def on_connect(self, client, userdata, flags, rc):
+    if rc != 0:
+      self.logger.error(f"Sensor MqttWeather '{self.name}' failed to connect, return code {rc}")
+      return
+    # Re-subscribe on every connect/reconnect
+    for topic in (self.rainTopic, self.uvTopic, self.soilTopic):
+      if topic:
+        self.mqttClient.subscribe(topic)
+    self.logger.info(f"Sensor MqttWeather '{self.name}' connected and subscribed")
+
+  def on_message(self, client, userdata, msg):
+    try:
+      self.onReading(msg.topic, float(msg.payload))
+    except ValueError:
+      self.logger.error(f"Sensor MqttWeather '{self.name}' failed to parse payload. Topic '{msg.topic}' = '{msg.payload}'")
+
+  def onReading(self, topic, value, now = None):
+    now = self.clock.time() if now is None else now
+    with self._lock:
+      if topic == self.rainTopic:
+        self._rain.add(value, now)
+      elif topic == self.uvTopic:
+        self.uv = value
+        self._uvPeak.add(value, now)
+      elif topic == self.soilTopic:
+        # Not part of the saved state
+        self.soilMoisture = value
+        self._soilUpdated = now
+      else:
+        return
+      self._sendTelemetry = True
+      self._dirty = self._dirty or topic != self.soilTopic
+    self.changed()
+    # Readings can arrive every few seconds: don't rewrite the state file for each one
+    self.persistState(force=False)
+
+  def getRecentPrecip(self):
+    with self._lock:
+      return self._rain.sum(self.clock.time())
+
+  # Called every 0.5 seconds while a valve is open: answers from memory only
+  def shouldDisable(self):
+    if self.getRecentPrecip() > self.precip_threshold:
+      return True
+
+    if self.soil_threshold is not None and self.soilMoisture is not None \
+        and self.clock.time() - self._soilUpdated <= self.SOIL_MAX_AGE and self.soilMoisture > self.soil_threshold:
+      return True
+
+    return False
+
+  def getUv(self):
+    with self._lock:
+      return self._uvPeak.max(self.clock.time())
+
+  def getFactor(self):
+    """Calculate factor based on the peak UV index of the last 24 hours"""
+    uv = self.getUv()
+    if not self.uv_adjustments or uv is None:
+      return 1.0
+
+    for adj in self.uv_adjustments:
+      if uv <= adj.max_uv_index:
+        return adj.multiplier
+
+    return self.uv_adjustments[-1].multiplier
+
+  def getTelemetry(self, forced = False):
+    res = {}
+    if self._sendTelemetry or forced:
+      res["uv"] = self.uv
+      res["uvPeak"] = self.getUv()
+      res["recentPrecip"] = self.getRecentPrecip()
+      res["soilMoisture"] = self.soilMoisture
+      res["connected"] = self.mqttClient is not None and self.mqttClient.is_connected()
+      self._sendTelemetry = False
+    return res
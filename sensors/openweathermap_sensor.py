@@ -1,12 +1,29 @@
+import os
+import json
 import time
-import requests
-from threading import Thread
+import perf
+import http_client
+import engine_metrics
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from datetime import datetime
 
 from sensors.base_sensor import BaseSensor
 
+FETCH_PROBE = perf.probe("sensor.fetch")
+
 class OpenWeatherMapSensor(BaseSensor):
+  # Precipitation totals of completed days never change, so they are kept on disk
+  # keyed by location and date and only missing days are requested.
+  CACHE_FILE = os.path.join("data", "openweathermap_cache.json")
+  # A day's summary is final once this long has passed after its midnight
+  FINAL_AFTER = timedelta(days=1, hours=3)
+  # Readings older than this (e.g. restored after a long outage) are reported as stale
+  STALE_AFTER = timedelta(hours=4)
+  # A refresh with failed requests is retried this soon instead of after a planned interval
+  RETRY_AFTER = timedelta(minutes=5)
+
   def __init__(self, logger, config):
     BaseSensor.__init__(self, logger, config)
     self.type = 'OpenWeatherMap'
@@ -26,6 +43,31 @@ class OpenWeatherMapSensor(BaseSensor):
       self.precip_days = 3
       self.precip_threshold = 1.0
 
+    self._cacheKey = f"{self.lat:.4f},{self.lon:.4f}"
+    self._cacheLock = Lock()
+    self._dayCache = None
+
+    # Warm start from the last saved readings; the first refresh runs in the background
+    self.recentPrecip = None
+    self.fetchedAt = None
+    self.restoreState()
+    self._stopped = Event()
+
+  def restoreState(self):
+    state = self.loadState()
+    if state is None:
+      return
+    try:
+      self.uv = state["uv"]
+      self.recentPrecip = state["recentPrecip"]
+      self.fetchedAt = datetime.fromisoformat(state["fetchedAt"])
+      self.logger.info(f"Sensor '{self.name}' restored readings from {self.fetchedAt.strftime('%c')}: UV {self.uv}, precipitation {self.recentPrecip}{' (stale)' if self.isStale() else ''}")
+    except (KeyError, TypeError, ValueError) as ex:
+      self.logger.warning(f"Ignoring saved state of sensor '{self.name}': {ex}")
+
+  def isStale(self):
+    return self.fetchedAt is None or self.clock.now() - self.fetchedAt > self.STALE_AFTER
+
   def start(self):
     if self.started:
       return
@@ -37,38 +79,124 @@ class OpenWeatherMapSensor(BaseSensor):
     self.worker.name = "WeatTh"
     self.worker.start()
 
+  def shutdown(self):
+    self._stopped.set()
+    self.refreshPlanner.replan()
+
   def updaterThread(self):
-    while True:
-      self.logger.debug("Updating OpenWeatherMap data...")
-      dateNow = datetime.now()
-      # Get forecast
-      url = f"https://api.openweathermap.org/data/3.0/onecall?exclude=current,minutely,hourly&units=metric&lat={self.lat}&lon={self.lon}&appid={self.apiKey}"
-      res = self.call_api(url)
-      if res is not None:
-        self.uv = res['daily'][0]['uvi']
-      self.logger.info(f"Daily UV Index ({dateNow.strftime('%c')}): {self.uv}")
-
-      # Get recent
-      self.recentPrecip = 0
-      for i in range(self.precip_days):
-        day = dateNow - timedelta(i+1)
-        url = f"https://api.openweathermap.org/data/3.0/onecall/day_summary?date={day.strftime('%Y-%m-%d')}&lat={self.lat}&lon={self.lon}&appid={self.apiKey}"
-        res = self.call_api(url)
-        if res is not None:
-          self.recentPrecip += res["precipitation"]["total"]
-      self.logger.info(f"Recent Precipitation: {self.recentPrecip}")
-      self._sendTelemetry = True
-      time.sleep(60*60*2)
+    while not self._stopped.is_set():
+      try:
+        # A fresh restored snapshot or an upcoming run far away lets this wait.
+        # The delay is recomputed after the wait, or earlier when schedules change.
+        delay = self.refreshPlanner.nextDelay(self.fetchedAt)
+        if delay > 0:
+          self.logger.info(f"Next OpenWeatherMap refresh in {delay / 60:.0f} minutes")
+          self.refreshPlanner.wait(delay)
+          continue
+        if not self.refresh():
+          self.logger.warning(f"OpenWeatherMap refresh incomplete, retrying in {self.RETRY_AFTER.total_seconds() / 60:.0f} minutes")
+          self.refreshPlanner.wait(self.RETRY_AFTER.total_seconds())
+      except Exception as ex:
+        self.logger.error(f"Error updating OpenWeatherMap data: {format(ex)}")
+        self.clock.wait(self._stopped, 60)
+    self.logger.info(f"Sensor OpenWeatherMap '{self.name}' stopped.")
+
+  def refresh(self):
+    """
+    Fetch the UV forecast and the recent precipitation. Returns False when a
+    request failed; the precipitation and the saved snapshot are then left as
+    they were, since a total that misses days would be too low.
+    """
+    self.logger.debug("Updating OpenWeatherMap data...")
+    dateNow = self.clock.now()
+    days = [(dateNow - timedelta(i+1)).date() for i in range(self.precip_days)]
+    cached = self.loadDayCache()
+    missing = [day for day in days if day.isoformat() not in cached]
+
+    # Forecast and all missing day summaries are requested concurrently
+    with ThreadPoolExecutor(max_workers=1 + min(len(missing), 4), thread_name_prefix="WeatTh-req") as executor:
+      forecast = executor.submit(self.call_api, f"https://api.openweathermap.org/data/3.0/onecall?exclude=current,minutely,hourly&units=metric&lat={self.lat}&lon={self.lon}&appid={self.apiKey}")
+      summaries = {day: executor.submit(self.call_api, f"https://api.openweathermap.org/data/3.0/onecall/day_summary?date={day.isoformat()}&lat={self.lat}&lon={self.lon}&appid={self.apiKey}") for day in missing}
+
+    res = forecast.result()
+    forecastFailed = res is None
+    if not forecastFailed:
+      self.uv = res['daily'][0]['uvi']
+    self.logger.info(f"Daily UV Index ({dateNow.strftime('%c')}): {self.uv}")
+
+    recentPrecip = sum(cached[day.isoformat()] for day in days if day.isoformat() in cached)
+    final = {}
+    failed = 0
+    for day, future in summaries.items():
+      res = future.result()
+      if res is None:
+        failed += 1
+        continue
+      total = res["precipitation"]["total"]
+      recentPrecip += total
+      if dateNow >= datetime.combine(day, datetime.min.time()) + self.FINAL_AFTER:
+        final[day.isoformat()] = total
+    # Completed days that did arrive are final either way
+    self.storeDayCache(final, days[-1] if days else dateNow.date())
+    if forecastFailed or failed:
+      self.logger.warning(f"Keeping previous precipitation {self.recentPrecip}: {failed} of {len(missing)} day summaries{' and the forecast' if forecastFailed else ''} failed")
+      return False
+
+    self.recentPrecip = recentPrecip
+    self.fetchedAt = dateNow
+    self.logger.info(f"Recent Precipitation: {self.recentPrecip} ({len(missing)} of {len(days)} days fetched)")
+    self._sendTelemetry = True
+    self.changed()
+    self.saveState({"uv": self.uv, "recentPrecip": self.recentPrecip, "fetchedAt": self.fetchedAt.isoformat()})
+    return True
+
+  def loadDayCache(self):
+    with self._cacheLock:
+      if self._dayCache is None:
+        self._dayCache = {}
+        try:
+          with open(self.CACHE_FILE, 'r') as f:
+            self._dayCache = json.load(f)
+        except FileNotFoundError:
+          pass
+        except Exception as ex:
+          self.logger.warning(f"Ignoring unreadable OpenWeatherMap cache '{self.CACHE_FILE}': {ex}")
+      return dict(self._dayCache.get(self._cacheKey, {}))
+
+  def storeDayCache(self, final, oldestDay):
+    with self._cacheLock:
+      location = self._dayCache.setdefault(self._cacheKey, {})
+      location.update(final)
+      # Forget days that have aged out of the aggregation window
+      stale = [day for day in location if day < oldestDay.isoformat()]
+      for day in stale:
+        del location[day]
+      if not final and not stale:
+        return
+      try:
+        os.makedirs(os.path.dirname(self.CACHE_FILE) or ".", exist_ok=True)
+        tmpFile = self.CACHE_FILE + ".tmp"
+        with open(tmpFile, 'w') as f:
+          json.dump(self._dayCache, f)
+        os.replace(tmpFile, self.CACHE_FILE)
+      except Exception as ex:
+        self.logger.warning(f"Failed to write OpenWeatherMap cache '{self.CACHE_FILE}': {ex}")
 
   def call_api(self, url):
     self.logger.debug("Performing OpenWeatherMap HTTP request...")
     for retry in range(1, 4):
+      started = perf.now()
       try:
-        response = requests.get(url)
+        response = http_client.getClient().get(url)
+        # Only completed requests use the budget, so a flaky network can't exhaust it
+        self.refreshPlanner.recordCall()
+        FETCH_PROBE.record(started)
+        engine_metrics.SENSOR_FETCH_SECONDS.observe((perf.now() - started) / 1e9, (self.name,))
         break
       except:
+        engine_metrics.SENSOR_FETCH_ERRORS.inc(labels=(self.name,))
         self.logger.error(f"Error calling OpenWeatherMap... Attempt #{retry}...")
-        time.sleep(2 * retry)
+        self.clock.sleep(2 * retry)
     else:
       self.logger.error("Failed calling OpenWeatherMap.")
       return None
@@ -76,6 +204,10 @@ class OpenWeatherMapSensor(BaseSensor):
     return response.json()
     
   def shouldDisable(self):
+    # No readings yet (first start, nothing saved): don't block irrigation
+    if self.recentPrecip is None:
+      return False
+
     # Disable if it rained recently
     if self.recentPrecip > self.precip_threshold:
       return True
@@ -102,5 +234,7 @@ class OpenWeatherMapSensor(BaseSensor):
     if self._sendTelemetry or forced:
       res["uv"] = self.uv
       res["recentPrecip"] = self.recentPrecip
+      res["fetchedAt"] = self.fetchedAt.isoformat() if self.fetchedAt else None
+      res["stale"] = self.isStale()
       self._sendTelemetry = False
     return res
@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+from datetime import timedelta
+from clock import SYSTEM as SYSTEM_CLOCK
+
+class RefreshPlanner():
+  """
+  Decides when a sensor should next fetch its data.
+
+  A fetch is planned lead_minutes before each upcoming run that depends on the
+  sensor; runs within that lead of the last fetch are already covered. With no
+  runs near the planner backs off up to max_interval_minutes, and never spends
+  more than daily_call_budget API calls in any 24 hours. Without a run provider
+  (e.g. sensors used outside the daemon) it falls back to a fixed interval.
+  Naive times are read in timezone, the zone the runs are planned in (the
+  system zone when unset).
+  """
+  DEFAULT_INTERVAL = timedelta(hours=2)
+
+  def __init__(self, config = None):
+    self.lead = timedelta(minutes=config.lead_minutes if hasattr(config, 'lead_minutes') else 15)
+    self.minInterval = timedelta(minutes=config.min_interval_minutes if hasattr(config, 'min_interval_minutes') else 20)
+    self.maxInterval = timedelta(minutes=config.max_interval_minutes if hasattr(config, 'max_interval_minutes') else 360)
+    self.dailyBudget = config.daily_call_budget if hasattr(config, 'daily_call_budget') else 100
+    # Callable(horizon) -> sorted aware datetimes of upcoming runs using the sensor
+    self.upcomingRuns = None
+    self.timezone = None
+    self.clock = SYSTEM_CLOCK
+    self._calls = deque()
+    self._replan = threading.Event()
+
+  def replan(self):
+    """Wake a sensor waiting in wait(), e.g. because schedules changed, so it recomputes its delay"""
+    self._replan.set()
+
+  def wait(self, seconds):
+    """Sleep up to seconds; returns True when woken early by replan()"""
+    woken = self.clock.wait(self._replan, seconds)
+    self._replan.clear()
+    return woken
+
+  def recordCall(self, when = None):
+    """Count one completed API call against the daily budget"""
+    self._calls.append(self.clock.monotonic() if when is None else when)
+
+  def callsLastDay(self, mono = None):
+    mono = self.clock.monotonic() if mono is None else mono
+    while self._calls and self._calls[0] <= mono - 86400:
+      self._calls.popleft()
+    return len(self._calls)
+
+  def localize(self, when):
+    if self.timezone is None:
+      return when.astimezone()
+    if when.tzinfo is not None:
+      return when.astimezone(self.timezone)
+    return self.timezone.localize(when) if hasattr(self.timezone, 'localize') else when.replace(tzinfo=self.timezone)
+
+  def nextDelay(self, lastFetch, now = None, mono = None):
+    """Seconds to wait before the next fetch, given the (naive, local) time of the last one"""
+    now = self.localize(self.clock.now() if now is None else now)
+    mono = self.clock.monotonic() if mono is None else mono
+
+    if lastFetch is None:
+      due = now
+    else:
+      lastFetch = self.localize(lastFetch)
+      if self.upcomingRuns is None:
+        due = lastFetch + self.DEFAULT_INTERVAL
+      else:
+        due = lastFetch + self.maxInterval
+        for run in self.upcomingRuns(self.maxInterval + self.lead):
+          if run - self.lead > lastFetch:
+            due = min(due, max(run - self.lead, lastFetch + self.minInterval))
+            break
+
+    delay = max(0.0, (due - now).total_seconds())
+
+    # Out of budget: wait until the oldest call of the last 24 hours expires
+    if self.callsLastDay(mono) >= self.dailyBudget:
+      delay = max(delay, self._calls[0] + 86400 - mono)
+
+    return delay
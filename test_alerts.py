@@ -0,0 +1,331 @@
+import time
+import logging
+import pytest
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from alerts import Alert, AlertType, AlertManager
+from alert_store import AlertStore
+from alert_channels.base import AlertChannel
+from alert_channels import channelFactory
+from alert_channels.dispatcher import AlertDispatcher
+from alert_channels.resilient import ResilientChannel, CircuitBreaker, TokenBucket
+
+logger = logging.getLogger("test_alerts")
+
+class FakeChannel(AlertChannel):
+  def __init__(self, failures = 0, delay = 0, retryDelay = 0.1):
+    self.failures = failures
+    self.delay = delay
+    self.retryDelay = retryDelay
+    self.attempts = 0
+    self.sent = []
+
+  def retry_delay(self, attempt):
+    return self.retryDelay
+
+  def send(self, alert):
+    self.attempts += 1
+    time.sleep(self.delay)
+    if self.attempts <= self.failures:
+      return False
+    self.sent.append(alert)
+    return True
+
+def makeAlert(alertType = AlertType.LEAK, valveName = None, timestamp = None):
+  return Alert(type=alertType, valve_name=valveName, timestamp=timestamp or datetime.now(), message="test", data={})
+
+def makeManager(channel, window = 0.5):
+  enabled = SimpleNamespace(leak=True, malfunction_no_flow=True, irregular_flow=True, sensor_error=True, system_exit=True)
+  alertsCfg = SimpleNamespace(enabled=enabled, leak_repeat_minutes=15, leak_detection_exclusions=[], aggregation_window_seconds=window,
+                              history=SimpleNamespace(enabled=False))
+  manager = AlertManager(logger, SimpleNamespace(cfg=SimpleNamespace(alerts=alertsCfg)), None)
+  manager.channels = [channel]
+  manager.dispatcher = AlertDispatcher(logger, workers=1)
+  return manager
+
+def test_dispatchDoesNotBlockCaller():
+  dispatcher = AlertDispatcher(logger, workers=1)
+  channel = FakeChannel(delay=1)
+  start = time.monotonic()
+  dispatcher.submit(channel, makeAlert())
+  assert time.monotonic() - start < 0.1
+  assert dispatcher.shutdown(5)
+  assert len(channel.sent) == 1
+
+def test_dispatchRetriesWithoutHoldingWorker():
+  dispatcher = AlertDispatcher(logger, workers=1)
+  failing = FakeChannel(failures=2, retryDelay=0.5)
+  healthy = FakeChannel()
+  dispatcher.submit(failing, makeAlert())
+  time.sleep(0.1)
+  # The single worker is free while the failed send waits for its retry
+  dispatcher.submit(healthy, makeAlert())
+  time.sleep(0.2)
+  assert len(healthy.sent) == 1
+  assert len(failing.sent) == 0
+  time.sleep(1.5)
+  assert failing.attempts == 3
+  assert len(failing.sent) == 1
+
+def test_dispatchGivesUpAfterMaxAttempts():
+  dispatcher = AlertDispatcher(logger, workers=1)
+  channel = FakeChannel(failures=100, retryDelay=0.01)
+  channel.max_attempts = 3
+  dispatcher.submit(channel, makeAlert())
+  assert dispatcher.shutdown(5)
+  assert channel.attempts == 3
+  assert len(channel.sent) == 0
+
+def test_dispatchQueueFullDrops():
+  dispatcher = AlertDispatcher(logger, workers=1, queue_size=1)
+  channel = FakeChannel(delay=0.5)
+  assert dispatcher.submit(channel, makeAlert())
+  time.sleep(0.1)
+  assert dispatcher.submit(channel, makeAlert())
+  assert not dispatcher.submit(channel, makeAlert())
+
+def test_shutdownStopsThreads():
+  dispatcher = AlertDispatcher(logger, workers=2)
+  channel = FakeChannel()
+  dispatcher.submit(channel, makeAlert())
+  assert dispatcher.shutdown(5)
+  assert len(channel.sent) == 1
+  assert not any(thread.is_alive() for thread in dispatcher._threads)
+
+def test_shutdownFlushesPendingRetries():
+  dispatcher = AlertDispatcher(logger, workers=1)
+  channel = FakeChannel(failures=1, retryDelay=60)
+  dispatcher.submit(channel, makeAlert(AlertType.SYSTEM_EXIT))
+  time.sleep(0.1)
+  start = time.monotonic()
+  assert dispatcher.shutdown(5)
+  assert time.monotonic() - start < 2
+  assert len(channel.sent) == 1
+
+def test_warningsAggregatedIntoDigest():
+  channel = FakeChannel()
+  manager = makeManager(channel)
+  for name in ["Test1", "Test2", "Test3"]:
+    manager.alert(AlertType.MALFUNCTION_NO_FLOW, "no flow", valve_name=name, data={"seconds_open": 60})
+  time.sleep(0.2)
+  assert len(channel.sent) == 0
+  time.sleep(0.6)
+  assert len(channel.sent) == 1
+  digest = channel.sent[0]
+  assert digest.type == AlertType.MALFUNCTION_NO_FLOW
+  assert digest.data["affected_valves"] == ["Test1", "Test2", "Test3"]
+  assert digest.data["Test2"] == [{"seconds_open": 60}]
+
+def test_digestsGroupedByCause():
+  channel = FakeChannel()
+  manager = makeManager(channel, window=0.3)
+  manager.alert(AlertType.IRREGULAR_FLOW, "low", valve_name="Test1", data={"cause": "flow_below_baseline", "actual_lpm": 1})
+  manager.alert(AlertType.IRREGULAR_FLOW, "low", valve_name="Test2", data={"cause": "flow_below_baseline", "actual_lpm": 2})
+  manager.alert(AlertType.IRREGULAR_FLOW, "high", valve_name="Test3", data={"cause": "flow_above_baseline", "actual_lpm": 9})
+  manager.clear_alert_state(AlertType.IRREGULAR_FLOW, "Test1")
+  manager.alert(AlertType.IRREGULAR_FLOW, "low again", valve_name="Test1", data={"cause": "flow_below_baseline", "actual_lpm": 0.5})
+  time.sleep(0.8)
+  assert len(channel.sent) == 2
+  low = next(a for a in channel.sent if a.data.get("cause") == "flow_below_baseline")
+  assert low.data["affected_valves"] == ["Test1", "Test2"]
+  assert [d["actual_lpm"] for d in low.data["Test1"]] == [1, 0.5]
+  high = next(a for a in channel.sent if a is not low)
+  assert high.valve_name == "Test3"
+
+def test_singleWarningSentUnchanged():
+  channel = FakeChannel()
+  manager = makeManager(channel, window=0.2)
+  manager.alert(AlertType.IRREGULAR_FLOW, "irregular", valve_name="Test1", data={"actual_lpm": 3})
+  time.sleep(0.5)
+  assert len(channel.sent) == 1
+  assert channel.sent[0].valve_name == "Test1"
+
+def test_criticalNotAggregated():
+  channel = FakeChannel()
+  manager = makeManager(channel, window=60)
+  manager.alert(AlertType.LEAK, "leak", data={"flow_rate_lpm": 4})
+  time.sleep(0.2)
+  assert len(channel.sent) == 1
+
+def test_shutdownFlushesDigest():
+  channel = FakeChannel()
+  manager = makeManager(channel, window=60)
+  manager.alert(AlertType.SENSOR_ERROR, "sensor", data={"sensor_name": "s1"})
+  manager.shutdown(5)
+  assert len(channel.sent) == 1
+
+def test_storeQueryByIndex(tmp_path):
+  store = AlertStore(logger, filename=str(tmp_path / "alerts.jsonl"))
+  now = datetime.now()
+  for i in range(10):
+    store.record(makeAlert(AlertType.IRREGULAR_FLOW, "Test1" if i % 2 else "Test2", now - timedelta(hours=10 - i)))
+  store.record(makeAlert(AlertType.LEAK, None, now))
+  assert len(store.query()) == 11
+  assert store.query(limit=1)[0]["type"] == "leak"
+  assert len(store.query(valve_name="Test1")) == 5
+  assert len(store.query(alert_type="irregular_flow", valve_name="Test2")) == 5
+  recent = store.query(alert_type="irregular_flow", since=now - timedelta(hours=3, minutes=30))
+  assert len(recent) == 3
+  assert recent[0]["timestamp"] > recent[-1]["timestamp"]
+  assert store.query(alert_type="leak", valve_name="Test1") == []
+
+def test_storeReloadAndCompact(tmp_path):
+  filename = str(tmp_path / "alerts.jsonl")
+  store = AlertStore(logger, filename=filename, retention_days=30)
+  store.record(makeAlert(AlertType.IRREGULAR_FLOW, "Test1", datetime.now() - timedelta(days=40)))
+  store.record(makeAlert(AlertType.IRREGULAR_FLOW, "Test1", datetime.now() - timedelta(days=35)))
+  store.record(makeAlert(AlertType.MALFUNCTION_NO_FLOW, "Test2"))
+  store.record(makeAlert(AlertType.SENSOR_ERROR))
+  store.record_clear(AlertType.SENSOR_ERROR)
+  assert store.flush()
+  reloaded = AlertStore(logger, filename=filename, retention_days=30)
+  assert len(reloaded.query()) == 4
+  assert set(reloaded.active_state().keys()) == {("irregular_flow", "Test1"), ("malfunction_no_flow", "Test2")}
+  # The older Test1 alert goes; the last one is kept while its condition is still active
+  assert reloaded.compact() == 1
+  compacted = AlertStore(logger, filename=filename)
+  assert len(compacted.query()) == 3
+  assert set(compacted.active_state().keys()) == {("irregular_flow", "Test1"), ("malfunction_no_flow", "Test2")}
+
+def test_storeCompactSkipsKeptActiveAlerts(tmp_path, monkeypatch):
+  import alert_store
+  filename = str(tmp_path / "alerts.jsonl")
+  store = AlertStore(logger, filename=filename, retention_days=30)
+  store.record(makeAlert(AlertType.IRREGULAR_FLOW, "Test1", datetime.now() - timedelta(days=40)))
+  store.record(makeAlert(AlertType.MALFUNCTION_NO_FLOW, "Test2"))
+  assert store.flush()
+  # Only a never-cleared alert is past the cutoff: the file isn't read or rewritten
+  def unexpectedOpen(*args, **kwargs):
+    raise AssertionError("history rewritten")
+  monkeypatch.setattr(alert_store, "open", unexpectedOpen, raising=False)
+  assert store.compact() == 0
+
+def test_storeWritesInBackgroundWithClock(tmp_path):
+  from clock import VirtualClock
+  filename = tmp_path / "alerts.jsonl"
+  clock = VirtualClock(datetime(2024, 5, 1, 6, 0))
+  store = AlertStore(logger, filename=str(filename), clock=clock)
+  store.record(makeAlert(AlertType.LEAK, None, clock.now()))
+  store.record_clear(AlertType.LEAK)
+  # Indexed at once, written by the writer thread
+  assert store.active_state() == {}
+  assert store.close()
+  lines = filename.read_text().splitlines()
+  assert len(lines) == 2 and '"2024-05-01T06:00:00"' in lines[1]
+
+def test_restartDoesNotResendActiveAlert(tmp_path):
+  channel = FakeChannel()
+  manager = makeManager(channel, window=0)
+  manager.history = AlertStore(logger, filename=str(tmp_path / "alerts.jsonl"))
+  manager.alert(AlertType.MALFUNCTION_NO_FLOW, "no flow", valve_name="Test1")
+  manager.alert(AlertType.SYSTEM_EXIT, "exit")
+  assert manager.history.flush()
+  restarted = makeManager(channel, window=0)
+  restarted.history = AlertStore(logger, filename=str(tmp_path / "alerts.jsonl"))
+  restarted._restore_alert_state()
+  restarted.alert(AlertType.MALFUNCTION_NO_FLOW, "no flow", valve_name="Test1")
+  restarted.alert(AlertType.SYSTEM_EXIT, "exit")
+  time.sleep(0.3)
+  assert [a.type for a in channel.sent].count(AlertType.MALFUNCTION_NO_FLOW) == 1
+  assert [a.type for a in channel.sent].count(AlertType.SYSTEM_EXIT) == 2
+
+def test_reloadedManagerReusesHistory(tmp_path, monkeypatch):
+  history = AlertStore(logger, filename=str(tmp_path / "alerts.jsonl"))
+  history.record(makeAlert(AlertType.MALFUNCTION_NO_FLOW, "Test1"))
+  monkeypatch.setattr(AlertStore, "_load", lambda self: pytest.fail("history re-read on reload"))
+  enabled = SimpleNamespace(leak=True, malfunction_no_flow=True, irregular_flow=True, sensor_error=True, system_exit=True)
+  alertsCfg = SimpleNamespace(enabled=enabled, leak_repeat_minutes=15, leak_detection_exclusions=[], history=SimpleNamespace(retention_days=7))
+  manager = AlertManager(logger, SimpleNamespace(cfg=SimpleNamespace(alerts=alertsCfg)), None, history=history)
+  assert manager.history is history and history.retention_days == 7
+  assert (AlertType.MALFUNCTION_NO_FLOW, "Test1") in manager._alert_state
+  manager.shutdown(1)
+
+class FakeScheduler:
+  def __init__(self):
+    self.calls = 0
+
+  def shouldScheduleRun(self, sched, check_date = None):
+    return sched.days is None or check_date.strftime("%a") in sched.days
+
+  def calculateScheduleTime(self, sched, now):
+    self.calls += 1
+    hours, minutes = sched.fixed_start_time.split(":")
+    return now.replace(hour=int(hours), minute=int(minutes), second=0, microsecond=0)
+
+def test_exclusionWindowsCompiledOncePerDay():
+  manager = makeManager(FakeChannel())
+  scheduler = FakeScheduler()
+  manager.irrigate = scheduler
+  manager.leak_detection_exclusions = [
+    SimpleNamespace(fixed_start_time="06:00", duration=30, days=None),
+    SimpleNamespace(fixed_start_time="06:20", duration=30, days=None),
+    SimpleNamespace(fixed_start_time="20:00", duration=10, days=None),
+    SimpleNamespace(fixed_start_time="12:00", duration=10, days=[]),
+  ]
+  day = datetime(2026, 5, 4)
+  assert not manager.is_in_exclusion_window(day.replace(hour=5, minute=59))
+  assert manager.is_in_exclusion_window(day.replace(hour=6, minute=0))
+  assert manager.is_in_exclusion_window(day.replace(hour=6, minute=45))
+  assert not manager.is_in_exclusion_window(day.replace(hour=6, minute=50))
+  assert not manager.is_in_exclusion_window(day.replace(hour=12, minute=5))
+  assert manager.is_in_exclusion_window(day.replace(hour=20, minute=9))
+  assert not manager.is_in_exclusion_window(day.replace(hour=20, minute=10))
+  assert scheduler.calls == 3
+  assert len(manager.exclusion_windows_today(day)) == 2
+  manager.is_in_exclusion_window(day + timedelta(days=1))
+  assert scheduler.calls == 6
+
+def test_circuitBreakerOpensAndProbes():
+  inner = FakeChannel(failures=3)
+  channel = ResilientChannel(logger, inner, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0.3))
+  assert not channel.send(makeAlert())
+  assert not channel.send(makeAlert())
+  assert channel.breaker.state == CircuitBreaker.OPEN
+  # Open circuit fails fast without calling the endpoint
+  assert not channel.send(makeAlert())
+  assert inner.attempts == 2
+  time.sleep(0.4)
+  # Half-open probe fails and re-opens the circuit
+  assert not channel.send(makeAlert())
+  assert inner.attempts == 3
+  assert channel.breaker.state == CircuitBreaker.OPEN
+  time.sleep(0.4)
+  assert channel.send(makeAlert())
+  assert channel.breaker.state == CircuitBreaker.CLOSED
+  health = channel.health()
+  assert health["sent"] == 1 and health["failed"] == 3 and health["fast_failed"] == 1
+
+def test_openBreakerDelaysRetries():
+  inner = FakeChannel(failures=2, retryDelay=0.01)
+  channel = ResilientChannel(logger, inner, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0.3))
+  dispatcher = AlertDispatcher(logger, workers=2)
+  dispatcher.submit(channel, makeAlert())
+  time.sleep(0.1)
+  # Opened after two failures: the next retry waits for the probe instead of fast-failing away its attempts
+  assert channel.breaker.state == CircuitBreaker.OPEN
+  assert 0.1 < channel.retry_delay(2) <= 0.3
+  time.sleep(0.4)
+  assert len(inner.sent) == 1 and channel.health()["fast_failed"] == 0
+  dispatcher.shutdown(1)
+
+def test_rateLimitAndFallback():
+  fallback = FakeChannel()
+  channel = ResilientChannel(logger, FakeChannel(), limiter=TokenBucket(per_minute=60, burst=2), fallback=fallback)
+  for i in range(4):
+    assert channel.send(makeAlert())
+  assert len(channel.inner.sent) == 2
+  assert len(fallback.sent) == 2
+  assert channel.health()["rate_limited"] == 2
+
+def test_factoryBuildsFallbackChain(tmp_path):
+  path = str(tmp_path / "alerts.log")
+  cfg = SimpleNamespace(type="millerbot", url="http://127.0.0.1:9/none", user_id=1, api_key="k", role="r",
+                        circuit_breaker=SimpleNamespace(failure_threshold=1),
+                        fallback=SimpleNamespace(type="file", path=path))
+  channel = channelFactory(logger, cfg)
+  assert channel.name == "MillerBotChannel"
+  assert channel.fallback.name == "FileChannel"
+  assert channel.send(makeAlert())
+  assert channel.breaker.state == CircuitBreaker.OPEN
+  with open(path) as f:
+    assert '"type": "leak"' in f.readline()
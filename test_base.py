@@ -1,7 +1,7 @@
 import pytz
-import time
 import datetime
 from irrigate import Irrigate
+from clock import VirtualClock
 from suntime import Sun
 
 def assertValves(valves, valveNames, status, assumption = None):
@@ -12,15 +12,21 @@ def assertValves(valves, valveNames, status, assumption = None):
     ord = ord + 1
 
 def setStartTimeToNow(cfg, valve_name, deltaInMinutes = None, duration = None):
-  nowTime = datetime.datetime.now()
+  nowTime = _clock.now()
   if deltaInMinutes is not None:
     nowTime = nowTime + datetime.timedelta(minutes=deltaInMinutes)
   if duration is not None:
     cfg.valves[valve_name].schedules[0].duration = duration
   cfg.valves[valve_name].schedules[0].fixed_start_time = str(nowTime.hour) + ":" + str(nowTime.minute)
 
-def init(configFilename):
-  irrigate = Irrigate(configFilename)
+# Clock of the engine created by the latest init(); the tests advance it instead of sleeping
+_clock = None
+
+def init(configFilename, clock = None):
+  global _clock
+  # On a whole minute, so a schedule set to start now is evaluated before the first advance()
+  _clock = clock if clock is not None else VirtualClock(datetime.datetime.now().replace(second=0, microsecond=0))
+  irrigate = Irrigate(configFilename, clock=_clock)
   return irrigate, irrigate.logger, irrigate.cfg, irrigate.valves, irrigate.q
 
 def test_sh_initAllNoRuns():
@@ -29,7 +35,7 @@ def test_sh_initAllNoRuns():
   assertValves(cfg.valves, ["Test1", "Test2", "Test3"], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(2)
+  irrigate.clock.advance(2)
   assertValves(cfg.valves, ["Test1", "Test2", "Test3"], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
 
@@ -61,7 +67,7 @@ def test_sh_initAllNoRuns():
 
 #   irrigate.start()
 #   assertValves(valves, ['valve4'], [(False, False)])
-#   time.sleep(5)
+#   irrigate.clock.advance(5)
 #   assertValves(valves, ['valve4'], [(True, True)])
 
 # def test_sunrise():
@@ -90,7 +96,7 @@ def test_sh_initAllNoRuns():
 
 #   irrigate.start()
 #   assertValves(valves, ['valve4'], [(False, False)])
-#   time.sleep(5)
+#   irrigate.clock.advance(5)
 #   assertValves(valves, ['valve4'], [(True, True)])
 
 def test_sh_valveDisableInitially():
@@ -103,11 +109,11 @@ def test_sh_valveDisableInitially():
   cfg.valves['Test2'].enabled = False
   cfg.valves['Test3'].enabled = False
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assert len(q.queue) == 0
   assertValves(valves, ["Test1", "Test2", "Test3"], [(False, False), (False, False), (False, False)])
   cfg.valves['Test1'].enabled = True
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ["Test1", "Test2", "Test3"], [(False, False), (False, False), (False, False)])
 
 def test_valveDisableDuring():
@@ -118,13 +124,13 @@ def test_valveDisableDuring():
   assertValves(valves, ["Test1", "Test2", "Test3"], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ["Test1", "Test2", "Test3"], [(True, True), (False, False), (False, False)])
   assert len(q.queue) == 0
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ["Test1", "Test2", "Test3"], [(True, True), (True, True), (False, False)])
   cfg.valves['Test1'].enabled = False
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ["Test1", "Test2", "Test3"], [(False, False), (True, True), (False, False)])
   assert len(q.queue) == 0
 
@@ -134,22 +140,26 @@ def xtest_terminate():
   setStartTimeToNow(cfg, 'sched1')
   setStartTimeToNow(cfg, 'sched2', deltaInMinutes=1)
   irrigate.start(False)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['valve1', 'valve2'], [(True, True), (True, True)])
   assert len(q.queue) == 0
   irrigate.terminated = True
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['valve1', 'valve2'], [(False, False), (False, False)])
 
-def test_everyXMinutes():
-  irrigate, logger, cfg, valves, q = init("test_config.json")
+def test_periodicTimerFlags():
+  clock = VirtualClock()
+  irrigate, logger, cfg, valves, q = init("test_config.json", clock)
+  flag1 = irrigate.timers.flag(3, key="test1")
+  flag2 = irrigate.timers.flag(12, key="test2", bootstrap=True)
   test1 = 0
   test2 = 0
   for i in range(13):
-    if irrigate.everyXMinutes("test1", 0.05, False):
+    irrigate.timers.advance()
+    if flag1.consume():
       test1 += 1
-    if irrigate.everyXMinutes("test2", 0.2, True):
+    if flag2.consume():
       test2 += 1
-    time.sleep(1)
+    clock.advance(1)
   assert test1 == 4
   assert test2 == 2
@@ -0,0 +1,89 @@
+import time
+import queue
+import pytest
+import threading
+import datetime
+import perf
+import valve_metrics
+from clock import VirtualClock
+
+def test_virtualClockWakesSleepersInOrder():
+  clock = VirtualClock(datetime.datetime(2024, 5, 1, 6, 0))
+  woken = []
+  def sleeper(name, seconds, times):
+    for _ in range(times):
+      clock.sleep(seconds)
+      woken.append((name, clock.monotonic()))
+  threads = [threading.Thread(target=sleeper, args=("fast", 2, 5)), threading.Thread(target=sleeper, args=("slow", 3, 2))]
+  for thread in threads:
+    thread.start()
+    clock.attach(thread)
+
+  started = time.monotonic()
+  clock.advance(7)
+  assert time.monotonic() - started < 2
+  assert clock.now() == datetime.datetime(2024, 5, 1, 6, 0, 7)
+  assert [w for w in woken if w[0] == "fast"] == [("fast", 2), ("fast", 4), ("fast", 6)]
+  assert [w for w in woken if w[0] == "slow"] == [("slow", 3), ("slow", 6)]
+  clock.advance(10)
+  for thread in threads:
+    thread.join(1)
+  assert len(woken) == 7
+
+def test_getCancelledWhileWaitingForJob():
+  from clock import SYSTEM
+  q = queue.Queue()
+  stop = threading.Event()
+  # An idle worker waits for good, and still leaves promptly on shutdown
+  threading.Timer(0.1, lambda: (stop.set(), SYSTEM.interrupt(q))).start()
+  started = time.monotonic()
+  with pytest.raises(queue.Empty):
+    SYSTEM.get(q, None, cancel=stop)
+  assert time.monotonic() - started < 2
+  threading.Timer(0.1, q.put, args=("job",)).start()
+  assert SYSTEM.get(q, None, cancel=threading.Event()) == "job"
+
+def test_simulatedIrrigationCycle(tmp_path):
+  from irrigate import Irrigate
+  from test_config import writeConfig
+  clock = VirtualClock(datetime.datetime(2024, 5, 1, 4, 0))
+  irrigate = Irrigate(writeConfig(tmp_path, duration=5), clock=clock)
+  irrigate.start()
+  valve = irrigate.valves["Front"]
+
+  # The sunrise schedule comes up within the simulated three hours, which pass in a fraction of a second
+  started = time.monotonic()
+  clock.advance(3 * 3600)
+  assert time.monotonic() - started < 2
+  assert valve.secondsDaily == 300
+  assert not valve.is_open and not valve.handled
+
+  irrigate.terminated = True
+  clock.advance(10)
+  irrigate.cycleRecorder.flush()
+  cycles = valve_metrics.get_store().cycles("Front", "2024-05-01")
+  assert len(cycles) == 1 and cycles[0].seconds == 300
+  assert "2024-05-01T04:00" < cycles[0].start < "2024-05-01T07:00"
+
+def test_simulatedWeek(tmp_path):
+  from irrigate import Irrigate
+  from test_config import writeConfig
+  clock = VirtualClock(datetime.datetime(2024, 5, 1, 4, 0))
+  irrigate = Irrigate(writeConfig(tmp_path, duration=5), clock=clock)
+  irrigate.start()
+  iterations = perf.probe("valve.iteration").count
+
+  # Time jumps from one wake-up to the next: the scheduler's minute ticks and a few per run
+  started = time.monotonic()
+  clock.advance(7 * 24 * 3600)
+  elapsed = time.monotonic() - started
+  iterations = perf.probe("valve.iteration").count - iterations
+  irrigate.terminated = True
+  clock.advance(10)
+  irrigate.cycleRecorder.flush()
+  store = valve_metrics.get_store()
+  days = [(datetime.date(2024, 5, 1) + datetime.timedelta(days=day)).isoformat() for day in range(8)]
+  assert [len(store.cycles("Front", days[day], days[day + 1])) for day in range(7)] == [1] * 7
+  # A 5-minute run wakes its worker for the valve changes and the flow samples, not every second
+  assert iterations <= 7 * 10
+  assert elapsed < 5
@@ -0,0 +1,205 @@
+import json
+import shutil
+import logging
+import pytest
+import config
+
+def writeConfig(tmp_path, valveName = "Front", extraValves = [], duration = 5):
+  if not (tmp_path / "config.schema.json").exists():
+    shutil.copy("config.schema.json", tmp_path / "config.schema.json")
+  data = {
+    "timezone": "Asia/Jerusalem",
+    "max_concurrent_valves": 1,
+    "location": {"latitude": 32.0, "longitude": 34.8},
+    "mqtt": {"enabled": False, "client_name": "test", "hostname": "localhost"},
+    "telemetry": {"enabled": False},
+    "sensors": [],
+    "alerts": {"enabled": {"leak": True, "malfunction_no_flow": True, "irregular_flow": True, "sensor_error": True, "system_exit": True},
+      "leak_repeat_minutes": 60, "leak_detection_exclusions": [], "history": {"enabled": False}},
+    "valves": [{"name": name, "enabled": True, "type": "3wire", "gpio_on_pin": 1, "gpio_off_pin": 2, "watering_mode": "duration",
+      "schedules": [{"time_based_on": "sunrise", "offset_minutes": 0, "duration": duration, "enable_uv_adjustments": False}]}
+      for name in [valveName] + extraValves]
+  }
+  filename = tmp_path / "config.json"
+  filename.write_text(json.dumps(data))
+  return str(filename)
+
+def test_configNodesHaveSchemaSlots(tmp_path):
+  cfg = config.Config(logging.getLogger("test_config"), writeConfig(tmp_path))
+  sched = cfg.valves["Front"].schedules[0]
+  assert isinstance(sched, config.ConfigNode)
+  assert not hasattr(sched, "fixed_start_time")
+  # Optional properties declared by the schema can still be set later
+  sched.fixed_start_time = "05:00"
+  with pytest.raises(AttributeError):
+    sched.not_in_schema = 1
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_configValidationErrorExplained(tmp_path, monkeypatch, fast):
+  if fast:
+    pytest.importorskip("fastjsonschema")
+  else:
+    monkeypatch.setattr(config, "fastjsonschema", None)
+  filename = writeConfig(tmp_path)
+  data = json.loads(open(filename).read())
+  data["valves"][0]["type"] = "4wire"
+  open(filename, "w").write(json.dumps(data))
+  with pytest.raises(ValueError, match="at 'valves -> 0 -> type'"):
+    config.Config(logging.getLogger("test_config"), filename)
+  assert not (tmp_path / "config.json.validated").exists()
+
+def test_configValidationSkippedWhenUnchanged(tmp_path, monkeypatch):
+  filename = writeConfig(tmp_path)
+  config.Config(logging.getLogger("test_config"), filename)
+  compiled = config._compiledSchema(str(tmp_path / "config.schema.json"))
+  calls = []
+  bestError = compiled.bestError
+
+  def countingBestError(data):
+    calls.append(1)
+    return bestError(data)
+  monkeypatch.setattr(compiled, "bestError", countingBestError)
+
+  config.Config(logging.getLogger("test_config"), filename)
+  assert calls == []
+
+  writeConfig(tmp_path, valveName="Back")
+  config.Config(logging.getLogger("test_config"), filename)
+  assert calls == [1]
+
+def test_configValidationSkippedAfterRestart(tmp_path, monkeypatch):
+  filename = writeConfig(tmp_path)
+  schemaPath = str(tmp_path / "config.schema.json")
+  config.Config(logging.getLogger("test_config"), filename)
+  assert (tmp_path / "config.json.validated").exists()
+
+  # A new process starts without the in-memory cache
+  def freshValidations():
+    monkeypatch.delitem(config._schemas, schemaPath, raising=False)
+    compiled = config._compiledSchema(schemaPath)
+    calls = []
+    bestError = compiled.bestError
+
+    def countingBestError(data):
+      calls.append(1)
+      return bestError(data)
+    monkeypatch.setattr(compiled, "bestError", countingBestError)
+    config.Config(logging.getLogger("test_config"), filename)
+    return calls
+
+  assert freshValidations() == []
+
+  # A changed schema invalidates the record
+  schema = json.loads((tmp_path / "config.schema.json").read_text())
+  schema["description"] = "changed"
+  (tmp_path / "config.schema.json").write_text(json.dumps(schema))
+  assert freshValidations() == [1]
+  assert freshValidations() == []
+
+def test_runtimeConfigSavesAreCoalescedAndAtomic(tmp_path, monkeypatch):
+  filename = writeConfig(tmp_path)
+  cfg = config.Config(logging.getLogger("test_config"), filename)
+  writes = []
+  original = cfg.replace_config_file
+  monkeypatch.setattr(cfg, "replace_config_file", lambda content: writes.append(1) or original(content))
+
+  for duration in (6, 7, 8):
+    cfg.valves["Front"].schedules[0].duration = duration
+    cfg.save_runtime_config()
+  assert cfg.flush_runtime_config()
+  assert len(writes) == 1
+  assert json.loads((tmp_path / "config.json").read_text())["valves"][0]["schedules"][0]["duration"] == 8
+  assert json.loads((tmp_path / "config.json.1").read_text())["valves"][0]["schedules"][0]["duration"] == 5
+
+  # Older versions rotate out after `backups` saves
+  for duration in (9, 10, 11):
+    cfg.valves["Front"].schedules[0].duration = duration
+    cfg.save_runtime_config()
+    cfg.flush_runtime_config()
+  assert len(writes) == 4
+  assert json.loads((tmp_path / "config.json.3").read_text())["valves"][0]["schedules"][0]["duration"] == 8
+  assert not (tmp_path / "config.json.4").exists()
+  assert not (tmp_path / "config.json.tmp").exists()
+
+def test_runtimeConfigSaveWaitsForEditsAndReportsFailures(tmp_path, monkeypatch):
+  filename = writeConfig(tmp_path)
+  cfg = config.Config(logging.getLogger("test_config"), filename)
+  cfg._saver.debounce = 0
+
+  # An edit in progress holds the lock: the save waits for it to complete
+  with cfg.lock:
+    cfg.valves["Front"].schedules[0].duration = 6
+    cfg.save_runtime_config()
+    assert not cfg.flush_runtime_config(0.2)
+    cfg.valves["Front"].schedules[0].days = ["Mon"]
+  assert cfg.flush_runtime_config()
+  saved = json.loads((tmp_path / "config.json").read_text())["valves"][0]["schedules"][0]
+  assert saved["duration"] == 6 and saved["days"] == ["Mon"]
+
+  def failing(content):
+    raise OSError("disk full")
+  monkeypatch.setattr(cfg, "replace_config_file", failing)
+  cfg.save_runtime_config()
+  assert not cfg.flush_runtime_config()
+  assert cfg.save_error() == "disk full"
+
+  monkeypatch.undo()
+  cfg.save_runtime_config()
+  assert cfg.flush_runtime_config()
+  assert cfg.save_error() is None
+
+def test_configDiff(tmp_path):
+  logger = logging.getLogger("test_config")
+  old = config.Config(logger, writeConfig(tmp_path, extraValves=["Side", "Back"]))
+  data = json.loads((tmp_path / "config.json").read_text())
+  data["valves"][0]["schedules"][0]["duration"] = 9
+  data["valves"][1]["gpio_on_pin"] = 7
+  del data["valves"][2]
+  data["valves"].append(dict(data["valves"][0], name="New"))
+  data["timezone"] = "UTC"
+  (tmp_path / "config.json").write_text(json.dumps(data))
+  assert old.fileChanged()
+
+  changes = old.diff(config.Config(logger, str(tmp_path / "config.json")))
+  assert changes["valves"] == {"added": ["New"], "removed": ["Back"], "updated": ["Front"], "replaced": ["Side"]}
+  assert changes["sections"] == ["timezone"]
+
+def test_reloadKeepsLiveValves(tmp_path):
+  from irrigate import Irrigate
+  filename = writeConfig(tmp_path)
+  irrigate = Irrigate(filename)
+  valves = irrigate.valves
+  front = valves["Front"]
+
+  writeConfig(tmp_path, extraValves=["Back"], duration=12)
+  changes = irrigate.reloadConfig()
+  assert changes["valves"]["added"] == ["Back"]
+  assert irrigate.valves is valves and valves["Front"] is front
+  assert front.schedules[0].duration == 12
+  assert irrigate.cfg.valves is valves
+
+  # An invalid file is rejected and the running configuration kept
+  (tmp_path / "config.json").write_text("{}")
+  assert "error" in irrigate.reloadConfig()
+  assert set(irrigate.valves) == {"Front", "Back"}
+
+def test_stableScheduleIds(tmp_path):
+  from types import SimpleNamespace
+  cfg = config.Config(logging.getLogger("test_config"), writeConfig(tmp_path))
+  valve = cfg.valves["Front"]
+  first = valve.schedules[0]
+  assert first.id == 1
+  second = valve.addSchedule(SimpleNamespace(time_based_on="fixed", fixed_start_time="06:00", duration=3, enable_uv_adjustments=False))
+  third = valve.addSchedule(SimpleNamespace(time_based_on="fixed", fixed_start_time="07:00", duration=3, enable_uv_adjustments=False))
+
+  # Deleting shifts positions but not ids, and ids are not reused
+  valve.removeSchedule(valve.schedulePosition(second))
+  assert valve.schedulePosition(third) == 1
+  assert valve.scheduleById(second) is None
+  assert valve.addSchedule(SimpleNamespace(time_based_on="fixed", fixed_start_time="08:00", duration=3, enable_uv_adjustments=False)) == 4
+
+  cfg.write_runtime_config()
+  saved = json.loads((tmp_path / "config.json").read_text())["valves"][0]["schedules"]
+  assert [s["id"] for s in saved] == [1, 3, 4]
+  reloaded = config.Config(logging.getLogger("test_config"), str(tmp_path / "config.json"))
+  assert reloaded.valves["Front"].scheduleById(3).fixed_start_time == "07:00"
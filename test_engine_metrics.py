@@ -0,0 +1,34 @@
+import engine_metrics
+
+def test_renderCountersSummariesAndCollectors():
+  registry = engine_metrics.Registry(cacheSeconds=0)
+  opened = registry.counter("test_open_seconds_total", "Open seconds", ("valve",))
+  latency = registry.summary("test_fetch_seconds", "Fetch latency", ("sensor",))
+  opened.inc(5, ("Front",))
+  opened.inc(2, ("Front",))
+  opened.inc(1, ('Back "2"',))
+  latency.observe(0.25, ("owm",))
+  latency.observe(0.5, ("owm",))
+  registry.setCollector("engine", lambda: [("test_queue_depth", "gauge", "Queue depth", (), [((), 3)])])
+
+  text = registry.render()
+  assert "# TYPE test_open_seconds_total counter" in text
+  assert 'test_open_seconds_total{valve="Front"} 7' in text
+  assert 'test_open_seconds_total{valve="Back \\"2\\""} 1' in text
+  assert 'test_fetch_seconds_count{sensor="owm"} 2' in text
+  assert 'test_fetch_seconds_sum{sensor="owm"} 0.75' in text
+  assert "test_queue_depth 3" in text
+  assert text.endswith("\n")
+
+  # A failing collector doesn't break the scrape
+  registry.setCollector("engine", lambda: 1 / 0)
+  assert "test_queue_depth" not in registry.render()
+
+def test_renderIsCached():
+  registry = engine_metrics.Registry(cacheSeconds=60)
+  sent = registry.counter("test_sent_total", "Sent")
+  sent.inc()
+  assert "test_sent_total 1" in registry.render()
+  sent.inc()
+  assert "test_sent_total 1" in registry.render()
+  assert sent.value() == 2
@@ -0,0 +1,70 @@
+import logging
+import http_client
+from types import SimpleNamespace
+from datetime import datetime
+from alerts import Alert, AlertType
+from http_client import HttpClient
+from alert_channels.millerbot import MillerBotChannel
+
+class FakeClient:
+  def __init__(self):
+    self.calls = []
+
+  def post(self, url, **kwargs):
+    self.calls.append((url, kwargs))
+
+def test_sessionPerHost():
+  client = HttpClient()
+  assert client._session("https://api.example.com/a") is client._session("https://api.example.com/b?x=1")
+  assert client._session("https://api.example.com/a") is not client._session("https://other.example.com/a")
+  client.close()
+
+def test_configureTimeouts():
+  client = http_client.configure(SimpleNamespace(connect_timeout=2, read_timeout=7, pool_size=8))
+  assert http_client.getClient() is client
+  assert client.timeout == (2, 7)
+  assert client.pool_size == 8
+  http_client.configure(None)
+
+def test_reloadDuringRequest():
+  import threading
+  started, release = threading.Event(), threading.Event()
+  class SlowSession:
+    closed = False
+    def request(self, method, url, **kwargs):
+      started.set()
+      release.wait(5)
+      assert not self.closed
+      return SimpleNamespace(raise_for_status=lambda: None, status_code=200)
+    def close(self):
+      self.closed = True
+
+  http_client.configure(None)
+  old = http_client.getClient()
+  session = SlowSession()
+  old._sessions["https://api.example.com"] = session
+  results = []
+  worker = threading.Thread(target=lambda: results.append(old.get("https://api.example.com/a").status_code))
+  worker.start()
+  assert started.wait(5)
+
+  # A reload swaps the client; the old one closes when its request is done
+  assert http_client.configure(None) is not old
+  assert not session.closed
+  release.set()
+  worker.join(5)
+  assert results == [200]
+  assert session.closed and not old._sessions
+
+def test_channelUsesSharedClient():
+  fake = FakeClient()
+  previous = http_client.setClient(fake)
+  try:
+    cfg = SimpleNamespace(url="https://bot.example.com/proactive", user_id=1, api_key="key", role="irrigate")
+    channel = MillerBotChannel(logging.getLogger("test_http_client"), cfg)
+    alert = Alert(type=AlertType.LEAK, valve_name=None, timestamp=datetime.now(), message="test", data={})
+    assert channel.send(alert)
+    assert fake.calls[0][0] == cfg.url
+    assert fake.calls[0][1]["headers"]["X-Api-Key"] == "key"
+  finally:
+    http_client.setClient(previous)
@@ -0,0 +1,100 @@
+import csv
+import time
+import random
+import logging
+import pytest
+from datetime import date, datetime, timedelta
+import valve_metrics
+import metrics_report
+
+def seasonOf(month):
+  return {12: "Winter", 1: "Winter", 2: "Winter", 3: "Spring", 4: "Spring", 5: "Spring",
+          6: "Summer", 7: "Summer", 8: "Summer"}.get(month, "Fall")
+
+@pytest.fixture
+def store(tmp_path):
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), None)
+  rng = random.Random(3)
+  end = date(2025, 6, 20)
+  for valve, lpm in (("Back", 12.0), ("Front", 8.0)):
+    for i in range(420):
+      if rng.random() < 0.3:
+        continue
+      seconds = rng.randint(300, 1200)
+      store.add_daily_summary(valve, (end - timedelta(days=i)).isoformat(), seconds, round(seconds / 60 * lpm * rng.uniform(0.8, 1.2), 2),
+                              round(lpm * rng.uniform(0.8, 1.2), 2))
+  store.add_cycles([valve_metrics.CycleRecord("Front", f"2025-06-{d:02d}T06:00:00", f"2025-06-{d:02d}T06:10:00", 600, 80.0,
+                                              7.5, 8.5, 8.0 + d / 10, "schedule") for d in range(10, 20)])
+  yield store
+  store.close()
+
+def test_reportMatchesPerValveBaselines(store):
+  now = datetime(2025, 6, 20, 12, 0)
+  report = metrics_report.build_report(seasonOf, store=store, now=now, weeks=4, months=3, recent_cycles=3, use_numpy=False)
+  assert report["engine"] == "python"
+  assert [v["name"] for v in report["valves"]] == ["Back", "Front"]
+
+  front = report["valves"][1]
+  lpm = [row[4] for row in store.daily_rows() if row[0] == "Front" and row[1] > "2025-05-21"]
+  expected = valve_metrics.compute_baseline(lpm)
+  assert front["samples"] == len(lpm)
+  assert front["baseline_lpm"] == round(expected[0], 2)
+  assert front["std_dev"] == round(expected[1], 2)
+  assert front["trend_pct"] == round(expected[2], 2)
+
+  # Newest cycles first, scored against the baseline
+  assert [c["start"][:10] for c in front["recent_cycles"]] == ["2025-06-19", "2025-06-18", "2025-06-17"]
+  assert front["recent_cycles"][0]["z_score"] == round((8.0 + 1.9 - expected[0]) / expected[1], 2)
+  assert report["valves"][0]["recent_cycles"] == []
+
+  # Summer 2025 compared with summer 2024
+  assert report["current_season"] == {"season_year": 2025, "season": "Summer"}
+  assert front["season_change_pct"] is not None
+  assert [m["month"] for m in front["monthly"]] == ["2025-04", "2025-05", "2025-06"]
+  assert front["weekly"][-1]["week_start"] == "2025-06-16"
+  june = sum(row[3] for row in store.daily_rows() if row[1].startswith("2025-06"))
+  assert report["totals"]["monthly"][-1]["liters"] == pytest.approx(june, abs=0.02)
+  assert "Front" in metrics_report.format_report(report)
+
+def test_numpyReportMatchesPython(store):
+  pytest.importorskip("numpy")
+  now = datetime(2025, 6, 20, 12, 0)
+  python = metrics_report.build_report(seasonOf, store=store, now=now, use_numpy=False)
+  vectorized = metrics_report.build_report(seasonOf, store=store, now=now, use_numpy=True)
+  assert vectorized["engine"] == "numpy"
+  python.pop("engine"), vectorized.pop("engine")
+  assert vectorized == python
+
+def test_reportIncludesArchivedHistory(store, tmp_path):
+  now = datetime(2025, 6, 20, 12, 0)
+  before = metrics_report.build_report(seasonOf, store=store, now=now, use_numpy=False)
+  archiveDir = str(tmp_path / "archive")
+  assert store.archive("2024-09-01", archiveDir) > 0
+
+  trimmed = metrics_report.build_report(seasonOf, store=store, now=now, use_numpy=False)
+  assert trimmed["valves"][1]["season_change_pct"] is None
+  archived = metrics_report.build_report(seasonOf, store=store, now=now, use_numpy=False, archive_dir=archiveDir)
+  assert archived == before
+
+def test_reportAtScaleWithinBudget(tmp_path):
+  pytest.importorskip("numpy")
+  # The request's scale: 100 valves with three years of daily history
+  end = date(2025, 6, 20)
+  history = tmp_path / "history.csv"
+  with open(history, "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["valve_name", "date", "total_seconds", "total_liters", "avg_liters_per_minute"])
+    for valve in range(100):
+      for i in range(3 * 365):
+        writer.writerow([f"Valve{valve:03d}", (end - timedelta(days=i)).isoformat(), 600, 80.0, 8.0 + (valve + i) % 5 / 10])
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), str(history))
+  assert store.migrated_rows == 100 * 3 * 365
+
+  def timed():
+    started = time.perf_counter()
+    report = metrics_report.build_report(seasonOf, store=store, now=datetime(2025, 6, 20, 12, 0))
+    assert report["engine"] == "numpy" and len(report["valves"]) == 100
+    return time.perf_counter() - started
+  # Best of a few runs, so a busy machine doesn't fail the bound; about 0.3 s on an x86 dev machine
+  assert min(timed() for _ in range(3)) < 0.4
+  store.close()
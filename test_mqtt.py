@@ -1,4 +1,3 @@
-import time
 from test_base import init
 from test_base import assertValves
 from test_base import setStartTimeToNow
@@ -9,11 +8,11 @@ def test_sh_mqttQueue():
   cfg.valves['Test2'].schedules.clear()
   cfg.valves['Test3'].schedules.clear()
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.mqtt.processMessages("xxx/queue/Test1/command", 0.2)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (False, False), (False, False)])
   assert len(q.queue) == 0
   return irrigate, logger, valves, q, cfg
@@ -25,11 +24,11 @@ def test_sh_mqttQueueDisabled():
   cfg.valves['Test3'].schedules.clear()
   cfg.valves['Test1'].enabled = False
   irrigate.start()
-  time.sleep(4)
+  irrigate.clock.advance(4)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.mqtt.processMessages("xxx/queue/Test1/command", 1)
-  time.sleep(4)
+  irrigate.clock.advance(4)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
 
@@ -39,32 +38,32 @@ def test_sh_mqttDisable():
   cfg.valves['Test2'].schedules.clear()
   cfg.valves['Test3'].schedules.clear()
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.mqtt.processMessages("xxx/enabled/Test1/command", 0)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   irrigate.mqtt.processMessages("xxx/queue/Test1/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   irrigate.mqtt.processMessages("xxx/enabled/Test1/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   irrigate.mqtt.processMessages("xxx/queue/Test1/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (False, False), (False, False)])
   assert len(q.queue) == 0
 
 def test_sh_mqttDisableAfterQueue():
   irrigate, logger, cfg, valves, q = init("test_config.json")
   cfg.valves['Test1'].enabled = False
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
 
 def test_sh_mqttQueue2():
   irrigate, logger, valves, q, cfg = test_sh_mqttQueue()
   irrigate.mqtt.processMessages("xxx/queue/Test2/command", 0.2)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 0
   return irrigate, logger, valves, q, cfg
@@ -72,21 +71,21 @@ def test_sh_mqttQueue2():
 def test_mqttQueue3():
   irrigate, logger, valves, q, cfg = test_sh_mqttQueue2()
   irrigate.mqtt.processMessages("xxx/queue/Test3/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
-  time.sleep(10)
+  irrigate.clock.advance(10)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (True, True)])
   assert len(q.queue) == 0
 
 def test_sh_mqttDisableWhileInQueue():
   irrigate, logger, valves, q, cfg = test_sh_mqttQueue2()
   irrigate.mqtt.processMessages("xxx/queue/Test3/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
   cfg.valves['Test1'].enabled = False
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (True, True), (True, True)])
   assert len(q.queue) == 0
 
@@ -102,16 +101,16 @@ def test_sh_sensorOverridesMqtt():
   cfg.valves['Test4'].schedules.clear()
   cfg.valves['Test5'].sensor.disable = True
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   # Should be handled but not opened
   assertValves(valves, ['Test5'], [(True, False)])
 
   # Sensor is disabling - valve stays closed
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, False)])
 
   cfg.valves['Test5'].sensor.disable = False
-  time.sleep(3)
+  irrigate.clock.advance(3)
   # Should open because the sensor is now enabled
   assertValves(valves, ['Test5'], [(True, True)])
 
@@ -122,19 +121,19 @@ def test_sh_mqttErrors():
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(2)
+  irrigate.clock.advance(2)
   irrigate.mqtt.processMessages("xxx/queue/Test1/command", "asd")
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("xxx/enable/Test1/command", "")
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("xxx/enable/Test1/command", 4)
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("xxx/enable/asd/command", 4)
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("xxx/enable/valve786/command", 4)
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("", "")
-  time.sleep(1)
+  irrigate.clock.advance(1)
   irrigate.mqtt.processMessages("/", 4)
-  time.sleep(30)
+  irrigate.clock.advance(30)
   assert valves['Test1'].secondsDaily == 30
@@ -0,0 +1,32 @@
+import asyncio
+import perf
+import api_server
+
+def test_probePercentilesFromBuckets():
+  probe = perf.Probe("test")
+  for elapsed in [1500] * 98 + [3_000_000, 40_000_000]:
+    probe.record(perf.now() - elapsed)
+  summary = probe.summary()
+  assert summary["count"] == 100
+  # 1.5 us lands in the bucket ending at 2048 ns; the tail is reported up to the maximum
+  assert summary["p50_ms"] == 0.002
+  assert 3 <= summary["p99_ms"] <= 4.2
+  assert summary["max_ms"] >= 40
+  assert perf.probe("test.shared") is perf.probe("test.shared")
+
+def test_probeOverheadUnderOneMicrosecond():
+  # Best of a few runs, so a busy machine doesn't fail the bound
+  assert min(perf.overhead(20000) for _ in range(5)) < 1000
+
+def test_apiRequestsTimedPerRoute():
+  class Route:
+    path = "/api/valves/{valve_name}"
+
+  async def inner(scope, receive, send):
+    scope["route"] = Route()
+
+  middleware = api_server.PerfMiddleware(inner)
+  before = perf.probe("api GET /api/valves/{valve_name}").count
+  asyncio.run(middleware({"type": "http", "method": "GET"}, None, None))
+  assert perf.probe("api GET /api/valves/{valve_name}").count == before + 1
+  assert "api GET /api/valves/{valve_name}" in api_server.get_debug_perf()["probes"]
@@ -0,0 +1,37 @@
+import time
+import threading
+import pytest
+import profiler
+
+def busyLoop(stop):
+  while not stop.is_set():
+    sum(range(1000))
+
+def test_sampleCollapsesStacksPerThread():
+  stop = threading.Event()
+  worker = threading.Thread(target=busyLoop, args=(stop,), name="ValveTh9")
+  worker.start()
+  try:
+    stacks, rounds = profiler.sample(0.3, 0.01)
+  finally:
+    stop.set()
+    worker.join()
+
+  assert rounds > 5
+  text = profiler.collapse(stacks)
+  lines = [line for line in text.splitlines() if line.startswith("ValveTh9;")]
+  assert lines
+  assert all(";test_profiler.py:busyLoop" in line for line in lines)
+  assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) <= rounds
+  # The sampling thread never profiles itself
+  assert "profiler.py:sample" not in text
+
+def test_oneProfileAtATime():
+  result = {}
+  first = threading.Thread(target=lambda: result.update(first=profiler.sample(0.3)))
+  first.start()
+  time.sleep(0.05)
+  with pytest.raises(profiler.ProfilerBusy):
+    profiler.sample(0.1)
+  first.join()
+  assert result["first"][1] > 0
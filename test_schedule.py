@@ -1,4 +1,3 @@
-import time
 import datetime
 import calendar
 from test_base import init
@@ -13,10 +12,10 @@ def test_schedSimple():
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 0
-  time.sleep(6)
+  irrigate.clock.advance(6)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   assert valves['Test1'].secondsDaily >= 6
@@ -29,16 +28,16 @@ def test_schedThirdWaiting():
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 0
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
-  time.sleep(12)
+  irrigate.clock.advance(12)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (True, True)])
   assert len(q.queue) == 0
-  time.sleep(10)
+  irrigate.clock.advance(10)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
 
@@ -54,18 +53,18 @@ def test_schedConflict():
   assertValves(valves, ['Test1'], [(False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(5)
+  irrigate.clock.advance(5)
   assertValves(valves, ['Test1'], [(True, True)])
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1'], [(True, True)])
   assert len(q.queue) == 0
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1'], [(True, True)])
   assert len(q.queue) == 0
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1'], [(True, True)])
   assert len(q.queue) == 0
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assert len(q.queue) == 0
   assert valves['Test1'].secondsDaily == 240
 
@@ -79,12 +78,12 @@ def test_schedOverlap():
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(5)
+  irrigate.clock.advance(5)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (False, False), (False, False)])
   assert len(q.queue) == 0
-  time.sleep(10)
+  irrigate.clock.advance(10)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
-  time.sleep(65)
+  irrigate.clock.advance(65)
   assert valves['Test1'].secondsDaily == 12
   assert len(q.queue) == 0
 
@@ -96,13 +95,13 @@ def test_schedDupCheck():
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
-  time.sleep(60)
+  irrigate.clock.advance(60)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (True, True), (False, False)])
   assert len(q.queue) == 1
 
@@ -111,14 +110,14 @@ def test_schedPerDay():
   setStartTimeToNow(cfg, 'Test1', duration=1)
   setStartTimeToNow(cfg, 'Test2', duration=1)
   cfg.valves['Test1'].schedules[0].days.clear()
-  dayStr = calendar.day_abbr[datetime.datetime.today().weekday()]
+  dayStr = calendar.day_abbr[irrigate.clock.now().weekday()]
   cfg.valves['Test1'].schedules[0].days.append(dayStr)
   cfg.valves['Test2'].schedules[0].days.clear()
-  dayStr = calendar.day_abbr[(datetime.datetime.today() + datetime.timedelta(days=1)).weekday()]
+  dayStr = calendar.day_abbr[(irrigate.clock.now() + datetime.timedelta(days=1)).weekday()]
   cfg.valves['Test2'].schedules[0].days.append(dayStr)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (False, False), (False, False)])
 
 def test_schedPerSeason():
@@ -131,5 +130,35 @@ def test_schedPerSeason():
   cfg.valves['Test2'].schedules[0].seasons.append(irrigate.getSeason(-1 * cfg.latitude))
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3'], [(True, True), (False, False), (False, False)])
+
+def test_schedCatchUpMissedMinutes(tmp_path):
+  import pytz
+  import engine_metrics
+  from irrigate import Irrigate
+  from test_config import writeConfig
+  irrigate = Irrigate(writeConfig(tmp_path))
+  tz = pytz.timezone(irrigate.cfg.timezone)
+  start = tz.localize(datetime.datetime(2024, 5, 1, 6, 0))
+  minute = datetime.timedelta(minutes=1)
+
+  # First evaluation, then the same minute again
+  assert irrigate.dueMinutes(start) == [start]
+  assert irrigate.dueMinutes(start) == []
+  assert irrigate.dueMinutes(start + minute) == [start + minute]
+
+  # A late tick evaluates every minute it crossed, oldest first
+  caughtUp = engine_metrics.SCHEDULER_CATCHUP_MINUTES.value()
+  assert irrigate.dueMinutes(start + 4 * minute) == [start + 2 * minute, start + 3 * minute, start + 4 * minute]
+  assert engine_metrics.SCHEDULER_CATCHUP_MINUTES.value() == caughtUp + 2
+
+  # Clock set back: nothing is due until the last evaluated minute has passed
+  assert irrigate.dueMinutes(start + 2 * minute) == []
+  assert irrigate.dueMinutes(start + 5 * minute) == [start + 5 * minute]
+
+  # A jump beyond the catch-up limit is not replayed
+  skipped = engine_metrics.SCHEDULER_SKIPPED_MINUTES.value()
+  later = start + 5 * minute + datetime.timedelta(hours=2)
+  assert irrigate.dueMinutes(later) == [later]
+  assert engine_metrics.SCHEDULER_SKIPPED_MINUTES.value() == skipped + 119
@@ -1,3 +1,5 @@
+import logging
+import json
 import time
 from test_base import init
 from test_base import assertValves
@@ -10,13 +12,13 @@ def test_sh_sensorOnOff():
   cfg.valves['Test2'].schedules.clear()
   cfg.valves['Test3'].schedules.clear()
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, True)])
   cfg.valves['Test5'].sensor.disable = True
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, False)])
   cfg.valves['Test5'].sensor.disable = False
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, True)])
 
 def test_sh_sensorFactor():
@@ -27,9 +29,9 @@ def test_sh_sensorFactor():
   cfg.valves['Test3'].schedules.clear()
   cfg.valves['Test6'].sensor.uv = 0.5
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test6'], [(True, True)])
-  time.sleep(15)
+  irrigate.clock.advance(15)
   assertValves(valves, ['Test6'], [(False, False)])
   assert valves['Test6'].secondsDaily == 12
 
@@ -39,14 +41,14 @@ def test_sh_sensorIgnoredOnMqttQueue():
   cfg.valves['Test2'].schedules.clear()
   cfg.valves['Test3'].schedules.clear()
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3', 'Test5'], [(False, False), (False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.mqtt.processMessages("xxx/queue/Test5/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, True)])
   cfg.valves['Test5'].sensor.disable = True
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, True)])
 
 def test_sh_mqttQueueOnSensorDisabled():
@@ -56,11 +58,11 @@ def test_sh_mqttQueueOnSensorDisabled():
   cfg.valves['Test3'].schedules.clear()
   cfg.valves['Test5'].sensor.disable = True
   irrigate.start()
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test1', 'Test2', 'Test3', 'Test5'], [(False, False), (False, False), (False, False), (False, False)])
   assert len(q.queue) == 0
   irrigate.mqtt.processMessages("xxx/queue/Test5/command", 1)
-  time.sleep(3)
+  irrigate.clock.advance(3)
   assertValves(valves, ['Test5'], [(True, True)])
 
 def test_sh_scheduleSensorShouldDisable():
@@ -75,10 +77,10 @@ def test_sh_scheduleSensorShouldDisable():
   setStartTimeToNow(cfg, 'Test5')
   cfg.valves['Test5'].sensor.disable = True
   irrigate.start()
-  time.sleep(5)
+  irrigate.clock.advance(5)
   assertValves(valves, ['Test4', 'Test2', 'Test3'], [(False, False), (False, False), (False, False)])
   cfg.valves['Test5'].sensor.disable = False
-  time.sleep(5)
+  irrigate.clock.advance(5)
   assert valves['Test5'].secondsDaily <= 5
 
 def test_sh_badSensor():
@@ -91,8 +93,242 @@ def test_sh_badSensor():
   sensor.exception = False
   irrigate.start()
   sensor.exception = True
-  time.sleep(2)
+  irrigate.clock.advance(2)
   assertValves(valves, ['Test5'], [(True, True)])
-  time.sleep(7)
+  irrigate.clock.advance(7)
   assertValves(valves, ['Test5'], [(False, False)])
   assert valves['Test5'].secondsDaily >= 5
+
+class FakeWeatherResponse:
+  def __init__(self, data):
+    self.data = data
+
+  def json(self):
+    return self.data
+
+class FakeWeatherClient:
+  def __init__(self):
+    self.urls = []
+    self.failing = ""
+
+  def get(self, url):
+    self.urls.append(url)
+    if self.failing and self.failing in url:
+      raise ConnectionError(url)
+    if "day_summary" in url:
+      return FakeWeatherResponse({"precipitation": {"total": 0.5}})
+    return FakeWeatherResponse({"daily": [{"uvi": 6.5}]})
+
+def makeWeatherSensor(tmp_path, monkeypatch, days = 3):
+  from types import SimpleNamespace
+  from sensors.openweathermap_sensor import OpenWeatherMapSensor
+  monkeypatch.setattr(OpenWeatherMapSensor, "CACHE_FILE", str(tmp_path / "owm_cache.json"))
+  monkeypatch.setattr(OpenWeatherMapSensor, "STATE_FILE", str(tmp_path / "sensor_state.json"))
+  cfg = SimpleNamespace(name="Weather", enabled=True, api_key="key", latitude=32.1, longitude=34.8,
+                        precipitation=SimpleNamespace(days_to_aggregate=days, disable_threshold_mm=1.0))
+  return OpenWeatherMapSensor(logging.getLogger("test_sensors"), cfg)
+
+def test_weatherRefreshUsesDayCache(tmp_path, monkeypatch):
+  import http_client
+  fake = FakeWeatherClient()
+  previous = http_client.setClient(fake)
+  try:
+    sensor = makeWeatherSensor(tmp_path, monkeypatch, days=4)
+    sensor.refresh()
+    assert len(fake.urls) == 5
+    assert sensor.uv == 6.5
+    assert sensor.recentPrecip == 2.0
+    assert sensor.shouldDisable()
+
+    # A restarted sensor reads completed days from disk and only asks for the forecast
+    fake.urls.clear()
+    sensor = makeWeatherSensor(tmp_path, monkeypatch, days=4)
+    sensor.refresh()
+    assert len([url for url in fake.urls if "day_summary" in url]) <= 1
+    assert sensor.recentPrecip == 2.0
+  finally:
+    http_client.setClient(previous)
+
+def test_weatherWarmStart(tmp_path, monkeypatch):
+  import http_client
+  previous = http_client.setClient(FakeWeatherClient())
+  try:
+    sensor = makeWeatherSensor(tmp_path, monkeypatch)
+    # Nothing fetched or saved yet: no error, irrigation not blocked
+    assert not sensor.shouldDisable()
+    assert sensor.isStale()
+    sensor.refresh()
+  finally:
+    http_client.setClient(previous)
+
+  restored = makeWeatherSensor(tmp_path, monkeypatch)
+  assert restored.uv == 6.5
+  assert restored.recentPrecip == 1.5
+  assert restored.shouldDisable()
+  assert not restored.isStale()
+  assert restored.getTelemetry(True)["stale"] is False
+
+def test_weatherRefreshKeepsReadingsWhenADayFails(tmp_path, monkeypatch):
+  import http_client
+  from datetime import datetime, timedelta
+  fake = FakeWeatherClient()
+  previous = http_client.setClient(fake)
+  try:
+    sensor = makeWeatherSensor(tmp_path, monkeypatch)
+    monkeypatch.setattr(sensor.clock, "sleep", lambda seconds: None)
+    assert sensor.refresh()
+    fetchedAt = sensor.fetchedAt
+
+    # A day not in the cache yet is requested, and fails: the partial total is not taken
+    sensor.recentPrecip = 9.0
+    sensor.precip_days = 4
+    fake.failing = "date=" + (datetime.now() - timedelta(days=4)).date().isoformat()
+    assert not sensor.refresh()
+    assert sensor.recentPrecip == 9.0
+    assert sensor.fetchedAt == fetchedAt
+  finally:
+    http_client.setClient(previous)
+
+  # The snapshot written by the successful refresh is what a restart sees
+  restored = makeWeatherSensor(tmp_path, monkeypatch)
+  assert restored.recentPrecip == 1.5
+  assert restored.fetchedAt == fetchedAt
+
+def test_sensorsKeepEngineTime(tmp_path, monkeypatch):
+  import http_client
+  from datetime import datetime
+  from types import SimpleNamespace
+  from clock import VirtualClock
+  from sensors.mqtt_sensor import MqttWeatherSensor
+  clock = VirtualClock(datetime(2024, 5, 1, 6, 0))
+
+  # Replayed readings age on the engine's clock, not the wall clock
+  previous = http_client.setClient(FakeWeatherClient())
+  try:
+    weather = makeWeatherSensor(tmp_path, monkeypatch)
+    weather.setClock(clock)
+    assert weather.refresh()
+  finally:
+    http_client.setClient(previous)
+  assert weather.fetchedAt == datetime(2024, 5, 1, 6, 0)
+  assert weather.refreshPlanner.nextDelay(weather.fetchedAt) == 2 * 3600
+  clock.advance(5 * 3600)
+  assert weather.isStale()
+
+  monkeypatch.setattr(MqttWeatherSensor, "STATE_FILE", str(tmp_path / "sensor_state.json"))
+  cfg = SimpleNamespace(name="station", enabled=True, hostname="localhost", topics=SimpleNamespace(rain="ws/rain"),
+    precipitation=SimpleNamespace(days_to_aggregate=1, disable_threshold_mm=1.0))
+  station = MqttWeatherSensor(logging.getLogger("test_sensors"), cfg)
+  station.setClock(clock)
+  changes = []
+  station.onChange = lambda: changes.append(clock.now())
+  station.onReading("ws/rain", 3.0)
+  assert station.shouldDisable() and changes == [clock.now()]
+  clock.advance(25 * 3600)
+  assert not station.shouldDisable()
+
+def test_refreshPlannerTimesFetchBeforeRuns():
+  from datetime import datetime, timedelta
+  from sensors.refresh_planner import RefreshPlanner
+  planner = RefreshPlanner()
+  now = datetime.now().astimezone()
+  lastFetch = (now - timedelta(hours=1)).replace(tzinfo=None)
+
+  # No provider: legacy fixed interval
+  assert abs(planner.nextDelay(lastFetch, now, 0) - 3600) < 1
+  assert planner.nextDelay(None, now, 0) == 0
+
+  # Fetch lead_minutes before the next run
+  planner.upcomingRuns = lambda horizon: [now + timedelta(hours=3)]
+  assert abs(planner.nextDelay(lastFetch, now, 0) - (3 * 3600 - 15 * 60)) < 1
+
+  # No runs near: back off to max interval after the last fetch
+  planner.upcomingRuns = lambda horizon: []
+  assert abs(planner.nextDelay(lastFetch, now, 0) - 5 * 3600) < 1
+
+  # Run already covered by the last fetch: plan for the one after it
+  planner.upcomingRuns = lambda horizon: [now + timedelta(minutes=5), now + timedelta(hours=2)]
+  recent = (now - timedelta(minutes=5)).replace(tzinfo=None)
+  assert abs(planner.nextDelay(recent, now, 0) - (2 * 3600 - 15 * 60)) < 1
+
+def test_refreshPlannerUsesConfiguredTimezone():
+  import pytz
+  from datetime import datetime, timedelta
+  from sensors.refresh_planner import RefreshPlanner
+  planner = RefreshPlanner()
+  planner.timezone = pytz.timezone("Asia/Jerusalem")
+  # Naive times are engine time in the configured zone, whatever the system zone is
+  now = datetime(2024, 5, 1, 12, 0)
+  planner.upcomingRuns = lambda horizon: [planner.timezone.localize(datetime(2024, 5, 1, 14, 0))]
+  assert planner.nextDelay(now - timedelta(hours=1), now, 0) == 2 * 3600 - 15 * 60
+
+def test_weatherFailedRequestsDontUseBudget(tmp_path, monkeypatch):
+  import http_client
+  fake = FakeWeatherClient()
+  fake.failing = "api.openweathermap.org"
+  previous = http_client.setClient(fake)
+  try:
+    sensor = makeWeatherSensor(tmp_path, monkeypatch)
+    monkeypatch.setattr(sensor.clock, "sleep", lambda seconds: None)
+    assert sensor.call_api("https://api.openweathermap.org/data/3.0/onecall") is None
+    assert len(fake.urls) == 3
+    assert sensor.refreshPlanner.callsLastDay() == 0
+    fake.failing = ""
+    assert sensor.call_api("https://api.openweathermap.org/data/3.0/onecall") is not None
+    assert sensor.refreshPlanner.callsLastDay() == 1
+  finally:
+    http_client.setClient(previous)
+
+def test_refreshPlannerCallBudget():
+  from datetime import datetime
+  from types import SimpleNamespace
+  from sensors.refresh_planner import RefreshPlanner
+  planner = RefreshPlanner(SimpleNamespace(daily_call_budget=2))
+  now = datetime.now().astimezone()
+  planner.recordCall(1000)
+  planner.recordCall(2000)
+  assert planner.nextDelay(None, now, 3000) == 86400 - 2000
+  assert planner.nextDelay(None, now, 1000 + 86400) == 0
+
+def test_refreshPlannerReplanWakesWait():
+  import threading
+  from sensors.refresh_planner import RefreshPlanner
+  planner = RefreshPlanner()
+  threading.Timer(0.1, planner.replan).start()
+  assert planner.wait(30)
+  assert not planner.wait(0.05)
+
+def test_mqttWeatherRingBuffers(tmp_path, monkeypatch):
+  from types import SimpleNamespace
+  from sensors.mqtt_sensor import MqttWeatherSensor
+  monkeypatch.setattr(MqttWeatherSensor, "STATE_FILE", str(tmp_path / "sensor_state.json"))
+  cfg = SimpleNamespace(name="station", enabled=True, hostname="localhost",
+    topics=SimpleNamespace(rain="ws/rain", uv="ws/uv", soil_moisture="ws/soil"),
+    precipitation=SimpleNamespace(days_to_aggregate=2, disable_threshold_mm=1.0),
+    uv_adjustments=[SimpleNamespace(max_uv_index=5, multiplier=0.5), SimpleNamespace(max_uv_index=20, multiplier=1.5)])
+  sensor = MqttWeatherSensor(logging.getLogger("test_sensors"), cfg)
+  start = time.time() - 3 * 24 * 3600
+
+  # Rain older than the 2-day window slides out
+  sensor.onReading("ws/rain", 5.0, start)
+  sensor.onReading("ws/rain", 0.4, time.time() - 3600)
+  sensor.onReading("ws/rain", 0.4, time.time())
+  assert abs(sensor.getRecentPrecip() - 0.8) < 1e-9
+  assert not sensor.shouldDisable()
+  sensor.onReading("ws/rain", 0.5, time.time())
+  assert sensor.shouldDisable()
+
+  # Factor follows the 24-hour UV peak, not the current reading
+  sensor.onReading("ws/uv", 8, time.time() - 7200)
+  sensor.onReading("ws/uv", 1, time.time())
+  assert sensor.getUv() == 8
+  assert sensor.getFactor() == 1.5
+
+  # State is written once per SAVE_INTERVAL, and the remainder on shutdown
+  with open(tmp_path / "sensor_state.json") as f:
+    assert json.load(f)["station"]["rain"]["slots"].count(None) == 47
+  sensor.shutdown()
+
+  # Rain totals survive a restart
+  restored = MqttWeatherSensor(logging.getLogger("test_sensors"), cfg)
+  assert abs(restored.getRecentPrecip() - 1.3) < 1e-9
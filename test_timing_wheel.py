@@ -0,0 +1,75 @@
+from timing_wheel import TimingWheel
+
+class FakeClock:
+  def __init__(self, now = 1000.0):
+    self.now = now
+
+  def __call__(self):
+    return self.now
+
+def test_periodicAndOneShotTimers():
+  clock = FakeClock()
+  wheel = TimingWheel(slots=8, clock=clock)
+  runs = []
+  wheel.every(3, lambda: runs.append("every"), key="periodic")
+  wheel.after(20, lambda: runs.append("after"))
+  for _ in range(21):
+    clock.now += 1
+    wheel.advance()
+  # Due at 1003, 1006, ... 1021: beyond one turn of the 8-slot wheel
+  assert runs.count("every") == 7
+  assert runs.count("after") == 1
+  assert wheel.pending() == 1
+
+  # Re-registering a key replaces the timer; cancel by key removes it
+  wheel.every(1, lambda: runs.append("replaced"), key="periodic")
+  clock.now += 1
+  wheel.advance()
+  assert runs[-1] == "replaced" and runs.count("every") == 7
+  wheel.cancel("periodic")
+  clock.now += 5
+  assert wheel.advance() == 0
+
+def test_lateWheelRunsOnceAndFlags():
+  clock = FakeClock()
+  wheel = TimingWheel(slots=8, clock=clock)
+  runs = []
+  wheel.every(2, lambda: runs.append(clock.now))
+  flag = wheel.flag(5, bootstrap=True)
+  assert flag.consume() and not flag.consume()
+
+  # A stall of many wheel turns expires each timer once, then keeps the period
+  clock.now += 100
+  assert wheel.advance() == 2
+  assert runs == [1100.0]
+  assert flag.consume() and not flag.consume()
+  clock.now += 1
+  wheel.advance()
+  clock.now += 1
+  wheel.advance()
+  assert runs == [1100.0, 1102.0]
+
+  # Never early: a deadline mid-tick waits for the next tick boundary
+  clock.now += 0.5
+  fired = []
+  wheel.after(0.2, lambda: fired.append(True))
+  wheel.advance()
+  assert fired == []
+  clock.now += 0.5
+  wheel.advance()
+  assert fired == [True]
+
+def test_nextDueAndAddedEvent():
+  clock = FakeClock()
+  wheel = TimingWheel(slots=8, clock=clock)
+  assert wheel.nextDue() is None
+  wheel.every(30, lambda: None, key="slow")
+  assert wheel.added.is_set()
+  wheel.added.clear()
+  clock.now += 0.5
+  assert wheel.nextDue() == 29.5
+  # Timers far beyond one turn of the wheel are still found; due times round up to a tick
+  timer = wheel.after(5, lambda: None)
+  assert wheel.added.is_set() and wheel.nextDue() == 5.5
+  wheel.cancel(timer)
+  assert wheel.nextDue() == 29.5
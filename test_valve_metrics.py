@@ -0,0 +1,196 @@
+import os
+import random
+import logging
+import pytest
+from datetime import date, timedelta
+from types import SimpleNamespace
+import valve_metrics
+
+def makeValve():
+  return SimpleNamespace(baseline_lpm=None, baseline_trend=None, baseline_std_dev=None, baseline_sample_count=0)
+
+def test_csvMigratedAndBaselineFromLast30Days(tmp_path):
+  csvFile = tmp_path / "valve_metrics.csv"
+  today = date.today()
+  lines = ["valve_name,date,total_seconds,total_liters,avg_liters_per_minute"]
+  # Old history outside the window must not affect the baseline
+  lines += [f"Front,{(today - timedelta(days=400 + i)).isoformat()},600,500,50.0" for i in range(100)]
+  lines += [f"Front,{(today - timedelta(days=i)).isoformat()},600,100,10.0" for i in range(1, 21)]
+  csvFile.write_text("\n".join(lines) + "\n")
+
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), str(csvFile))
+  previous = valve_metrics.set_store(store)
+  try:
+    assert store.migrated_rows == 120
+    assert not csvFile.exists()
+    assert (tmp_path / "valve_metrics.csv.migrated").exists()
+
+    valves = {"Front": makeValve(), "Back": makeValve()}
+    valve_metrics.load_baselines(valves, logging.getLogger("test_valve_metrics"))
+    assert valves["Front"].baseline_lpm == 10.0
+    assert valves["Front"].baseline_sample_count == 20
+    assert valves["Front"].baseline_trend == 0
+    assert valves["Back"].baseline_lpm is None
+
+    # A re-recorded day replaces the previous row instead of counting twice
+    valve_metrics.append_daily_summary("Back", today.isoformat(), 60, 12)
+    valve_metrics.append_daily_summary("Back", today.isoformat(), 60, 12)
+    assert store.daily_lpm("Back", (today - timedelta(days=1)).isoformat()) == [12.0]
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+def test_rollingBaselineMatchesFullRecompute():
+  rng = random.Random(7)
+  baseline = valve_metrics.RollingBaseline()
+  start = date(2025, 1, 1)
+  samples = []
+  for day in range(80):
+    if rng.random() < 0.2:
+      continue  # Days without irrigation
+    current = (start + timedelta(days=day)).isoformat()
+    for _ in range(rng.randint(1, 3)):
+      # Mid-day cycles replace the day's sample
+      lpm = rng.uniform(5, 15)
+      baseline.add(current, lpm)
+      samples = [s for s in samples if s[0] != current] + [(current, lpm)]
+    cutoff = (start + timedelta(days=day - valve_metrics.BASELINE_DAYS)).isoformat()
+    baseline.expire(cutoff)
+    samples = [s for s in samples if s[0] > cutoff]
+
+    expected = valve_metrics.compute_baseline([lpm for _, lpm in samples])
+    actual = baseline.stats()
+    assert baseline.entries() == samples
+    assert actual[0] == pytest.approx(expected[0])
+    assert actual[1] == pytest.approx(expected[1])
+    assert (actual[2] is None) == (expected[2] is None)
+    if expected[2] is not None:
+      assert actual[2] == pytest.approx(expected[2], abs=1e-6)
+
+def test_baselineUpdatedPerCycleAndPersisted(tmp_path):
+  dbFile = str(tmp_path / "metrics.db")
+  store = valve_metrics.MetricsStore(dbFile, None)
+  previous = valve_metrics.set_store(store)
+  try:
+    today = date.today()
+    for i in range(1, 12):
+      valve_metrics.append_daily_summary("Front", (today - timedelta(days=i)).isoformat(), 600, 100)
+    valve = makeValve()
+    valve.name = "Front"
+    valve_metrics.load_baselines({"Front": valve}, logging.getLogger("test_valve_metrics"))
+    assert valve.baseline_lpm == 10.0 and valve.baseline_sample_count == 11
+
+    # A mid-day cycle is reflected immediately
+    valve.secondsDaily, valve.litersDaily = 600, 220
+    valve_metrics.update_baseline(valve, today.isoformat())
+    assert valve.baseline_sample_count == 12
+    assert valve.baseline_lpm > 10.0
+    expected = valve.baseline_lpm
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+  # A new process restores the rolling state without rescanning the history
+  store = valve_metrics.MetricsStore(dbFile, None)
+  previous = valve_metrics.set_store(store)
+  try:
+    store._conn.execute("DELETE FROM daily_summary")
+    valve = makeValve()
+    valve_metrics.load_baselines({"Front": valve}, logging.getLogger("test_valve_metrics"))
+    assert valve.baseline_lpm == expected
+    assert valve.baseline_sample_count == 12
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+def makeCycle(name, start, liters=20.0):
+  return valve_metrics.CycleRecord(valve_name=name, start=start, end=start, seconds=120, liters=liters,
+                                   min_lpm=9.0, max_lpm=11.0, mean_lpm=10.0, trigger="schedule")
+
+def test_cycleRecordsBufferedAndFlushedInBatches(tmp_path):
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), None)
+  previous = valve_metrics.set_store(store)
+  try:
+    recorder = valve_metrics.CycleRecorder(logging.getLogger("test_valve_metrics"), batch_size=3, flush_interval=3600)
+    recorder.record(makeCycle("Front", "2025-05-01T06:00:00"))
+    recorder.record(makeCycle("Front", "2025-05-01T18:00:00"))
+    # Below the batch size nothing is written yet
+    assert recorder.pending() == 2
+    assert store.cycles("Front", "2025-05-01") == []
+
+    recorder.record(makeCycle("Back", "2025-05-01T07:00:00"))
+    assert recorder.flush()
+    assert [c.start for c in store.cycles("Front", "2025-05-01")] == ["2025-05-01T06:00:00", "2025-05-01T18:00:00"]
+
+    recorder.record(makeCycle("Front", "2025-05-02T06:00:00", liters=5.5))
+    assert recorder.flush()
+    assert recorder.pending() == 0
+    assert store.cycles("Front", "2025-05-02", "2025-05-03") == [makeCycle("Front", "2025-05-02T06:00:00", liters=5.5)]
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+def test_baselineUpdatedOnRecorderThreadWithClock(tmp_path, monkeypatch):
+  import threading
+  from datetime import datetime
+  from clock import VirtualClock
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), None)
+  previous = valve_metrics.set_store(store)
+  try:
+    # Simulated time far from today: the baseline window follows the recorder's clock
+    for i in range(1, 12):
+      valve_metrics.append_daily_summary("Front", (date(2020, 3, 1) - timedelta(days=i)).isoformat(), 600, 100)
+    threads = []
+    applyBaseline = valve_metrics.apply_baseline
+    monkeypatch.setattr(valve_metrics, "apply_baseline", lambda valve, baseline: threads.append(threading.current_thread().name) or applyBaseline(valve, baseline))
+    recorder = valve_metrics.CycleRecorder(logging.getLogger("test_valve_metrics"), clock=VirtualClock(datetime(2020, 3, 1, 8, 0)))
+    valve = makeValve()
+    valve.name, valve.secondsDaily, valve.litersDaily = "Front", 600, 220
+    recorder.update_baseline(valve, "2020-03-01")
+    assert recorder.flush()
+    assert threads == ["MetricsFlushTh"]
+    assert valve.baseline_sample_count == 12 and valve.baseline_lpm > 10.0
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+def test_dailyTotalsRestoredAfterRestart(tmp_path):
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), None)
+  previous = valve_metrics.set_store(store)
+  try:
+    valve_metrics.append_daily_summary("Front", "2025-05-01", 300, 42.5)
+    valves = {"Front": makeValve(), "Back": makeValve()}
+    for valve in valves.values():
+      valve.secondsDaily, valve.litersDaily = 0, 0
+    valve_metrics.restore_daily_totals(valves, "2025-05-01", logging.getLogger("test_valve_metrics"))
+    assert (valves["Front"].secondsDaily, valves["Front"].litersDaily) == (300, 42.5)
+    assert (valves["Back"].secondsDaily, valves["Back"].litersDaily) == (0, 0)
+  finally:
+    valve_metrics.set_store(previous)
+    store.close()
+
+def test_oldMonthsArchivedAndStreamedBack(tmp_path):
+  store = valve_metrics.MetricsStore(str(tmp_path / "metrics.db"), None)
+  archiveDir = str(tmp_path / "archive")
+  try:
+    for day in ("2024-01-15", "2024-01-31", "2024-02-10", "2024-03-01"):
+      store.add_daily_summary("Front", day, 600, 100, 10.0)
+    store.add_cycles([makeCycle("Front", "2024-01-15T06:00:00"), makeCycle("Front", "2024-03-01T06:00:00")])
+
+    assert store.archive("2024-03-01", archiveDir) == 4
+    assert sorted(os.listdir(archiveDir)) == ["cycles-2024-01.csv.gz", "daily_summary-2024-01.csv.gz", "daily_summary-2024-02.csv.gz"]
+    assert [row[1] for row in store.daily_rows()] == ["2024-03-01"]
+
+    assert list(valve_metrics.iter_archived_daily(archive_dir=archiveDir)) == [
+      ("Front", "2024-01-15", 600.0, 100.0, 10.0), ("Front", "2024-01-31", 600.0, 100.0, 10.0), ("Front", "2024-02-10", 600.0, 100.0, 10.0)]
+    assert [row[1] for row in valve_metrics.iter_archived_daily("2024-01-20", "2024-02-01", archiveDir)] == ["2024-01-31"]
+    assert list(valve_metrics.iter_archived_cycles(archive_dir=archiveDir)) == [makeCycle("Front", "2024-01-15T06:00:00")]
+
+    # A late row for an archived month is merged into its file, not duplicated
+    store.add_daily_summary("Front", "2024-01-31", 60, 12, 12.0)
+    store.add_daily_summary("Back", "2024-01-20", 60, 6, 6.0)
+    assert store.archive("2024-03-01", archiveDir) == 2
+    january = list(valve_metrics.iter_archived_daily(until="2024-02-01", archive_dir=archiveDir))
+    assert january == [("Front", "2024-01-15", 600.0, 100.0, 10.0), ("Back", "2024-01-20", 60.0, 6.0, 6.0), ("Front", "2024-01-31", 60.0, 12.0, 12.0)]
+  finally:
+    store.close()
@@ -40,8 +40,7 @@ def test_waterflow_history_structure():
   
   # Add a value and check it's added correctly
   irrigate.waterflow.setLastLiter_1m(5.5)
-  import time
-  time.sleep(61)  # Wait for more than 60 seconds
+  irrigate.clock.advance(61)  # More than 60 seconds
   irrigate.waterflow.setLastLiter_1m(6.5)
   
   history = irrigate.waterflow.getHistory()
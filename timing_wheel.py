@@ -0,0 +1,137 @@
+"""
+Hashed timing wheel on the monotonic clock for periodic work and deadlines.
+
+Timers are hashed into slots by the tick they are due in. The owner thread
+calls advance() once per tick; it visits only the slots of the ticks elapsed
+since the previous call, so its cost depends on the timers due rather than on
+how many are registered. Wall-clock changes (NTP setting the time at boot)
+never move a timer.
+
+  wheel.every(60, checkLeak, key="leak")     # callback run by advance()
+  flow = wheel.flag(60)                      # polled from another thread
+  if flow.consume(): ...
+  wheel.after(61, requeue)                   # one-shot deadline
+"""
+import math
+import time
+import threading
+
+class Timer():
+  __slots__ = ("key", "callback", "interval", "due", "fired", "cancelled")
+
+  def __init__(self, key, callback, interval):
+    self.key = key
+    self.callback = callback
+    self.interval = interval
+    self.due = 0
+    self.fired = False
+    self.cancelled = False
+
+  def consume(self):
+    """True if the flag timer expired since the previous call"""
+    fired = self.fired
+    self.fired = False
+    return fired
+
+class TimingWheel():
+  def __init__(self, tick = 1.0, slots = 64, clock = time.monotonic):
+    self.tick = tick
+    self.clock = clock
+    self._slots = [[] for _ in range(slots)]
+    self._keys = {}
+    self._lock = threading.Lock()
+    self._next = int(clock() // tick)
+    # Set whenever a timer is added, so an owner sleeping until nextDue() can re-plan
+    self.added = threading.Event()
+
+  def _add(self, timer, seconds):
+    deadline = self.clock() + seconds
+    with self._lock:
+      # Due at the first tick boundary at or after the deadline, never earlier
+      timer.due = max(math.ceil(deadline / self.tick), self._next)
+      if timer.key is not None:
+        old = self._keys.get(timer.key)
+        if old is not None:
+          old.cancelled = True
+        self._keys[timer.key] = timer
+      self._slots[timer.due % len(self._slots)].append(timer)
+    self.added.set()
+    return timer
+
+  def every(self, seconds, callback, key = None, bootstrap = False):
+    """
+    Run callback every seconds from advance(). A timer registered under an
+    existing key replaces it. With bootstrap the first run is on the next tick.
+    """
+    return self._add(Timer(key, callback, seconds), 0 if bootstrap else seconds)
+
+  def after(self, seconds, callback, key = None):
+    """Run callback once from advance(), seconds from now"""
+    return self._add(Timer(key, callback, None), seconds)
+
+  def flag(self, seconds, key = None, bootstrap = False):
+    """A periodic timer without callback: each expiry sets the flag read by Timer.consume()"""
+    timer = Timer(key, None, seconds)
+    timer.fired = bootstrap
+    return self._add(timer, seconds)
+
+  def cancel(self, timer):
+    """Cancel a timer (or the timer registered under a key)"""
+    with self._lock:
+      if not isinstance(timer, Timer):
+        timer = self._keys.get(timer)
+      if timer is None:
+        return
+      timer.cancelled = True
+      if timer.key is not None and self._keys.get(timer.key) is timer:
+        del self._keys[timer.key]
+
+  def nextDue(self):
+    """Seconds until the earliest pending timer is due (0 if overdue), or None without timers"""
+    with self._lock:
+      due = min((timer.due for slot in self._slots for timer in slot if not timer.cancelled), default=None)
+    if due is None:
+      return None
+    return max(due * self.tick - self.clock(), 0.0)
+
+  def pending(self):
+    with self._lock:
+      return sum(1 for slot in self._slots for timer in slot if not timer.cancelled)
+
+  def advance(self):
+    """Expire the timers due up to now and run their callbacks; returns how many expired"""
+    last = int(self.clock() // self.tick)
+    expired = []
+    with self._lock:
+      if last < self._next:
+        return 0
+      # Each slot needs one visit however far behind the wheel is
+      for current in range(self._next, self._next + min(last - self._next + 1, len(self._slots))):
+        slot = self._slots[current % len(self._slots)]
+        keep = []
+        for timer in slot:
+          if timer.cancelled:
+            continue
+          if timer.due <= last:
+            expired.append(timer)
+          else:
+            keep.append(timer)
+        slot[:] = keep
+      self._next = last + 1
+
+      for timer in expired:
+        if timer.interval is None:
+          if timer.key is not None and self._keys.get(timer.key) is timer:
+            del self._keys[timer.key]
+          continue
+        # Keeps its phase when slightly late; after a stall it runs once, not once per missed period
+        ticks = max(math.ceil(timer.interval / self.tick), 1)
+        timer.due = timer.due + ticks if timer.due + ticks > last else last + ticks
+        self._slots[timer.due % len(self._slots)].append(timer)
+
+    for timer in expired:
+      if timer.callback is None:
+        timer.fired = True
+      else:
+        timer.callback()
+    return len(expired)
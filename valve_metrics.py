@@ -1,16 +1,589 @@
 import csv
+import gzip
+import io
+import json
+import math
 import os
+import sqlite3
 import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, astuple
+from typing import Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
+from clock import SYSTEM as SYSTEM_CLOCK
 
+METRICS_DB = os.path.join("data", "valve_metrics.db")
+# Legacy CSV history, imported into the database once and then renamed
 METRICS_FILE = os.path.join("data", "valve_metrics.csv")
 
+# Rows older than the retention window are moved into monthly gzip CSV archives
+ARCHIVE_DIR = os.path.join("data", "archive")
+RETENTION_DAYS = 730
+
+BASELINE_DAYS = 30
+# Fewer daily samples than this leave the baseline unset
+MIN_SAMPLES = 10
+# A trend is only reported from this many samples on
+TREND_SAMPLES = 14
+
+
+class RollingBaseline:
+    """
+    Incrementally maintained baseline over a valve's daily L/min samples.
+
+    Produces the same statistics as compute_baseline() over the samples of the
+    last BASELINE_DAYS days, but every update is O(1): the tercile-weighted mean
+    keeps one deque (and running sum) per third of the window, the standard
+    deviation uses Welford's algorithm (with removal) and the trend keeps the
+    running regression sums. Recording the same day again replaces its sample,
+    so mid-day cycles refresh today's value.
+    """
+
+    def __init__(self, entries=()):
+        self.dates = deque()
+        self._thirds = (deque(), deque(), deque())
+        self._sums = [0.0, 0.0, 0.0]
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._sum = 0.0
+        self._index_sum = 0.0  # sum(i * y) with i the position in the window
+        for date, lpm in entries:
+            self.add(date, lpm)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def _rebalance(self):
+        first, middle, last = self._thirds
+        n = len(self.dates)
+        target_first = math.ceil(n / 3)
+        target_last = n - math.ceil(2 * n / 3)
+        while len(first) > target_first:
+            self._move(0, 1, first.pop(), left=True)
+        while len(first) < target_first:
+            if not middle:
+                self._move(2, 1, last.popleft(), left=False)
+            self._move(1, 0, middle.popleft(), left=False)
+        while len(last) > target_last:
+            self._move(2, 1, last.popleft(), left=False)
+        while len(last) < target_last:
+            self._move(1, 2, middle.pop(), left=True)
+
+    def _move(self, source, target, value, left):
+        self._sums[source] -= value
+        self._sums[target] += value
+        if left:
+            self._thirds[target].appendleft(value)
+        else:
+            self._thirds[target].append(value)
+
+    def _append(self, date, lpm):
+        n = len(self.dates)
+        self.dates.append(date)
+        self._thirds[2].append(lpm)
+        self._sums[2] += lpm
+        self._index_sum += n * lpm
+        self._sum += lpm
+        delta = lpm - self._mean
+        self._mean += delta / (n + 1)
+        self._m2 += delta * (lpm - self._mean)
+        self._rebalance()
+
+    def _remove(self, lpm, n):
+        """Welford removal of one sample from a window of n samples"""
+        self._sum -= lpm
+        if n == 1:
+            self._mean = self._m2 = self._sum = self._index_sum = 0.0
+            return
+        delta = lpm - self._mean
+        self._mean -= delta / (n - 1)
+        self._m2 = max(0.0, self._m2 - delta * (lpm - self._mean))
+
+    def _pop_oldest(self):
+        n = len(self.dates)
+        self.dates.popleft()
+        third = next(i for i in range(3) if self._thirds[i])
+        lpm = self._thirds[third].popleft()
+        self._sums[third] -= lpm
+        self._remove(lpm, n)
+        # Every remaining sample moves one position towards the start
+        self._index_sum -= self._sum
+        self._rebalance()
+
+    def _pop_newest(self):
+        n = len(self.dates)
+        self.dates.pop()
+        third = next(i for i in (2, 1, 0) if self._thirds[i])
+        lpm = self._thirds[third].pop()
+        self._sums[third] -= lpm
+        self._index_sum -= (n - 1) * lpm
+        self._remove(lpm, n)
+        self._rebalance()
+
+    def add(self, date, lpm):
+        """
+        Record the sample of a day (YYYY-MM-DD), replacing an earlier sample of the same day.
+
+        Returns False (without changing anything) for a day before the newest one.
+        """
+        if self.dates and date < self.dates[-1]:
+            return False
+        if self.dates and date == self.dates[-1]:
+            self._pop_newest()
+        self._append(date, lpm)
+        return True
+
+    def expire(self, cutoff_date):
+        """Drop samples on or before cutoff_date (YYYY-MM-DD)"""
+        while self.dates and self.dates[0] <= cutoff_date:
+            self._pop_oldest()
+
+    def entries(self):
+        return list(zip(self.dates, (lpm for third in self._thirds for lpm in third)))
+
+    def stats(self):
+        """(weighted mean, standard deviation, trend in % per 30 days or None), like compute_baseline()"""
+        n = len(self.dates)
+        if n == 0:
+            return None, None, None
+        first, middle, last = self._thirds
+        baseline_lpm = (0.5 * self._sums[0] + self._sums[1] + 1.5 * self._sums[2]) / \
+                       (0.5 * len(first) + len(middle) + 1.5 * len(last))
+        std_dev = math.sqrt(self._m2 / (n - 1)) if n > 1 else 0
+
+        baseline_trend_pct = None
+        if n >= TREND_SAMPLES:
+            x_mean = (n - 1) / 2
+            numerator = self._index_sum - x_mean * self._sum
+            denominator = (n - 1) * n * (2 * n - 1) / 6 - n * x_mean ** 2
+            trend = numerator / denominator if denominator != 0 else 0
+            baseline_trend_pct = (trend * 30 / baseline_lpm * 100) if baseline_lpm > 0 else 0
+
+        return baseline_lpm, std_dev, baseline_trend_pct
+
+
+@dataclass
+class CycleRecord:
+    """One irrigation cycle of a valve, with its per-minute flow profile"""
+    valve_name: str
+    start: str  # ISO timestamps (local time)
+    end: str
+    seconds: int
+    liters: float
+    min_lpm: Optional[float]  # Lowest/highest 1-minute flow reading, None without a flow meter
+    max_lpm: Optional[float]
+    mean_lpm: Optional[float]
+    trigger: str  # "schedule", "mqtt", "api" or "manual"
+
+
+def _optional_float(value):
+    return float(value) if value != '' else None
+
+
+# Archived tables: (date column, column types when read back from CSV)
+ARCHIVE_TABLES = {
+    "daily_summary": ("date", (str, str, float, float, float)),
+    "cycles": ("start", (str, str, str, int, float, _optional_float, _optional_float, _optional_float, str)),
+}
+
+
+def _read_archive(path, table):
+    """Stream the typed rows of one archive file"""
+    types = ARCHIVE_TABLES[table][1]
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            yield tuple(convert(value) for convert, value in zip(types, row))
+
+
+def _write_archive(path, header, rows, table):
+    """Atomically write a monthly archive, merging rows already archived for that month"""
+    merged = {}
+    if os.path.exists(path):
+        for row in _read_archive(path, table):
+            merged[row[:2]] = row
+    for row in rows:
+        merged[tuple(row[:2])] = row
+    date_index = header.index(ARCHIVE_TABLES[table][0])
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+            with io.TextIOWrapper(gz, newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(['' if value is None else value for value in row]
+                                 for row in sorted(merged.values(), key=lambda row: (row[date_index], row[0])))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+
+def _iter_archive(table, since, until, archive_dir):
+    prefix = table + "-"
+    try:
+        names = sorted(name for name in os.listdir(archive_dir) if name.startswith(prefix) and name.endswith(".csv.gz"))
+    except FileNotFoundError:
+        return
+    date_index = 1  # date / start is the second column of every archived table
+    for name in names:
+        month = name[len(prefix):-len(".csv.gz")]
+        if (since is not None and month < since[:7]) or (until is not None and month > until[:7]):
+            continue
+        for row in _read_archive(os.path.join(archive_dir, name), table):
+            if (since is None or row[date_index] >= since) and (until is None or row[date_index] < until):
+                yield row
+
+
+def iter_archived_daily(since=None, until=None, archive_dir=ARCHIVE_DIR):
+    """
+    Lazily stream archived daily summaries as (valve_name, date, total_seconds,
+    total_liters, avg_liters_per_minute), month by month. Only archive files
+    overlapping [since, until) are opened.
+    """
+    return _iter_archive("daily_summary", since, until, archive_dir)
+
+
+def iter_archived_cycles(since=None, until=None, archive_dir=ARCHIVE_DIR):
+    """Lazily stream archived CycleRecords started in [since, until), month by month"""
+    return (CycleRecord(*row) for row in _iter_archive("cycles", since, until, archive_dir))
+
+
+class MetricsStore:
+    """
+    Valve metrics in an embedded SQLite database (WAL mode).
+
+    daily_summary is keyed by (valve_name, date), so per-valve date range
+    queries are served by the primary key index and their cost depends on
+    the window size, not on how much history has accumulated.
+
+    Each valve's RollingBaseline is kept in memory and persisted in
+    baseline_state, in the same transaction as the daily summary it reflects.
+    """
+
+    def __init__(self, filename=METRICS_DB, csv_filename=METRICS_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_summary (
+                    valve_name TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    total_seconds REAL NOT NULL,
+                    total_liters REAL NOT NULL,
+                    avg_liters_per_minute REAL NOT NULL,
+                    PRIMARY KEY (valve_name, date)
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS baseline_state (
+                    valve_name TEXT PRIMARY KEY,
+                    entries TEXT NOT NULL
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cycles (
+                    valve_name TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    seconds INTEGER NOT NULL,
+                    liters REAL NOT NULL,
+                    min_lpm REAL,
+                    max_lpm REAL,
+                    mean_lpm REAL,
+                    trigger TEXT NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cycles_valve_start ON cycles (valve_name, start)")
+        self._baselines = {}
+        self.migrated_rows = self._migrate_csv(csv_filename)
+
+    def _migrate_csv(self, csv_filename):
+        """Import a legacy CSV history once, then rename it so it is never read again"""
+        if not csv_filename or not os.path.isfile(csv_filename):
+            return 0
+        with open(csv_filename, 'r', newline='') as f:
+            rows = [(row['valve_name'], row['date'], float(row['total_seconds']),
+                     float(row['total_liters']), float(row['avg_liters_per_minute']))
+                    for row in csv.DictReader(f)]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO daily_summary VALUES (?, ?, ?, ?, ?)", rows)
+            # Baselines are rebuilt from the imported rows
+            self._conn.execute("DELETE FROM baseline_state")
+        os.replace(csv_filename, csv_filename + ".migrated")
+        return len(rows)
+
+    def add_daily_summary(self, valve_name, date, total_seconds, total_liters, avg_liters_per_minute):
+        """Upsert a day's summary and fold it into the valve's rolling baseline"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO daily_summary VALUES (?, ?, ?, ?, ?)",
+                               (valve_name, date, total_seconds, total_liters, avg_liters_per_minute))
+            cutoff_date = (datetime.fromisoformat(date).date() - timedelta(days=BASELINE_DAYS)).isoformat()
+            baseline = self._baseline(valve_name, cutoff_date)
+            if not baseline.add(date, avg_liters_per_minute):
+                # A day before the newest sample: rebuild from the table instead
+                baseline = self._rebuild(valve_name, cutoff_date)
+            self._save_baseline(valve_name, baseline)
+
+    def add_cycles(self, records):
+        """Insert a batch of CycleRecords in a single transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO cycles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [astuple(record) for record in records])
+
+    def cycles(self, valve_name, since, until=None):
+        """A valve's CycleRecords started at or after since (ISO timestamp or date), oldest first"""
+        query = "SELECT * FROM cycles WHERE valve_name = ? AND start >= ?"
+        params = [valve_name, since]
+        if until is not None:
+            query += " AND start < ?"
+            params.append(until)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY start", params).fetchall()
+        return [CycleRecord(*row) for row in rows]
+
+    def daily_rows(self):
+        """All daily summaries as (valve_name, date, total_seconds, total_liters, avg_liters_per_minute), by valve and date"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT valve_name, date, total_seconds, total_liters, avg_liters_per_minute "
+                "FROM daily_summary ORDER BY valve_name, date").fetchall()
+
+    def daily_columns(self):
+        """
+        daily_rows() typed for vectorized use, without date strings to parse:
+        (valve_names, row counts per valve, rows) where each row is (days since
+        1970-01-01, total_seconds, total_liters, avg_liters_per_minute)
+        """
+        with self._lock:
+            counts = self._conn.execute(
+                "SELECT valve_name, COUNT(*) FROM daily_summary GROUP BY valve_name ORDER BY valve_name").fetchall()
+            rows = self._conn.execute(
+                "SELECT CAST(julianday(date) - 2440587.5 AS INTEGER), total_seconds, total_liters, avg_liters_per_minute "
+                "FROM daily_summary ORDER BY valve_name, date").fetchall()
+        return [name for name, _ in counts], [count for _, count in counts], rows
+
+    def recent_cycles(self, count):
+        """{valve_name: [CycleRecord]} with the last count cycles of each valve, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY valve_name ORDER BY start DESC) AS n "
+                "FROM cycles) WHERE n <= ? ORDER BY valve_name, start DESC", (count,)).fetchall()
+        result = {}
+        for row in rows:
+            result.setdefault(row[0], []).append(CycleRecord(*row[:-1]))
+        return result
+
+    def archive(self, before, archive_dir=ARCHIVE_DIR):
+        """
+        Move rows dated before `before` (YYYY-MM-DD) into monthly gzip CSV files
+        in archive_dir (<table>-<YYYY-MM>.csv.gz) and delete them from the
+        database. Rows are only deleted once their archive file is on disk.
+
+        Returns:
+            Number of rows moved
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+        moved = 0
+        with self._lock:
+            for table, (column, _) in ARCHIVE_TABLES.items():
+                cursor = self._conn.execute(f"SELECT * FROM {table} WHERE {column} < ?", (before,))
+                header = [description[0] for description in cursor.description]
+                by_month = {}
+                for row in cursor.fetchall():
+                    by_month.setdefault(row[header.index(column)][:7], []).append(row)
+                for month, rows in by_month.items():
+                    _write_archive(os.path.join(archive_dir, f"{table}-{month}.csv.gz"), header, rows, table)
+                    moved += len(rows)
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {table} WHERE {column} < ?", (before,))
+        return moved
+
+    def daily_totals(self, date):
+        """{valve_name: (total_seconds, total_liters)} recorded for a day (YYYY-MM-DD)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT valve_name, total_seconds, total_liters FROM daily_summary WHERE date = ?", (date,)).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def baseline(self, valve_name, cutoff_date):
+        """The valve's rolling baseline with samples on or before cutoff_date expired"""
+        with self._lock:
+            baseline = self._baseline(valve_name, cutoff_date)
+            if baseline.dates and baseline.dates[0] <= cutoff_date:
+                baseline.expire(cutoff_date)
+                with self._conn:
+                    self._save_baseline(valve_name, baseline)
+            return baseline
+
+    def _baseline(self, valve_name, cutoff_date):
+        baseline = self._baselines.get(valve_name)
+        if baseline is None:
+            row = self._conn.execute("SELECT entries FROM baseline_state WHERE valve_name = ?", (valve_name,)).fetchone()
+            if row is not None:
+                baseline = RollingBaseline(json.loads(row[0]))
+            else:
+                baseline = self._rebuild(valve_name, cutoff_date)
+            self._baselines[valve_name] = baseline
+        return baseline
+
+    def _rebuild(self, valve_name, cutoff_date):
+        rows = self._conn.execute(
+            "SELECT date, avg_liters_per_minute FROM daily_summary WHERE valve_name = ? AND date > ? ORDER BY date",
+            (valve_name, cutoff_date)).fetchall()
+        self._baselines[valve_name] = RollingBaseline(rows)
+        return self._baselines[valve_name]
+
+    def _save_baseline(self, valve_name, baseline):
+        self._conn.execute("INSERT OR REPLACE INTO baseline_state VALUES (?, ?)",
+                           (valve_name, json.dumps(baseline.entries())))
+
+    def daily_lpm(self, valve_name, since_date):
+        """avg_liters_per_minute of each day after since_date (YYYY-MM-DD), oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT avg_liters_per_minute FROM daily_summary WHERE valve_name = ? AND date > ? ORDER BY date",
+                (valve_name, since_date)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CycleRecorder:
+    """
+    Buffers CycleRecords in memory and writes them to the metrics store in
+    batches on a background thread, so finishing a cycle never waits for disk.
+    A batch is written once batch_size records are pending or flush_interval
+    seconds after the oldest pending one was recorded, whichever comes first.
+    Baseline updates queued with update_baseline are applied right away, but
+    on the same thread rather than the valve's. flush_interval is timed on
+    the clock; flush() waits for the write in real time.
+    """
+
+    def __init__(self, logger, batch_size=20, flush_interval=60.0, clock=SYSTEM_CLOCK):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._updates = {}  # valve name -> (valve, date, seconds, liters)
+        self._dueAt = None
+        self._writing = False
+        self._thread = None
+
+    def record(self, record):
+        with self._cond:
+            self._buffer.append(record)
+            if self._dueAt is None:
+                self._dueAt = self.clock.monotonic() + self.flush_interval
+            if len(self._buffer) >= self.batch_size:
+                self._dueAt = self.clock.monotonic()
+            self._start()
+            self.clock.notify(self._cond)
+
+    def update_baseline(self, valve, date_str):
+        """Fold the valve's current daily totals for date_str into its baseline in the background"""
+        with self._cond:
+            self._updates[valve.name] = (valve, date_str, valve.secondsDaily, valve.litersDaily)
+            self._start()
+            self.clock.notify(self._cond)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flushThread, args=())
+            self._thread.daemon = True
+            self._thread.name = "MetricsFlushTh"
+            self._thread.start()
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer) + len(self._updates) + (1 if self._writing else 0)
+
+    def flush(self, timeout=10):
+        """Write all buffered records now and wait for them to reach the store"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._buffer:
+                self._dueAt = self.clock.monotonic()
+                self.clock.notify(self._cond)
+            while self._buffer or self._updates or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.logger.warning(f"Timed out writing {len(self._buffer)} cycle records")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _due(self):
+        return self._dueAt is not None and self._dueAt <= self.clock.monotonic()
+
+    def _ready(self):
+        return bool(self._updates) or self._due()
+
+    def _flushThread(self):
+        while True:
+            with self._cond:
+                while not self._ready():
+                    self.clock.waitCondition(self._cond, None if self._dueAt is None else self._dueAt - self.clock.monotonic(), self._ready)
+                batch = []
+                if self._due():
+                    batch, self._buffer = self._buffer, []
+                    self._dueAt = None
+                updates, self._updates = self._updates, {}
+                self._writing = True
+            try:
+                if batch:
+                    get_store().add_cycles(batch)
+            except Exception as ex:
+                self.logger.error(f"Error writing {len(batch)} cycle records: {ex}")
+            try:
+                for valve, date_str, seconds, liters in updates.values():
+                    try:
+                        update_baseline(valve, date_str, seconds, liters, self.clock.now().date())
+                    except Exception as ex:
+                        self.logger.error(f"Error updating baseline of valve '{valve.name}': {ex}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide metrics store, opened (and migrated) on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore()
+        return _store
+
+
+def set_store(store):
+    """Replace the process-wide metrics store (e.g. in tests). Returns the previous one."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+        return previous
+
+
 def append_daily_summary(valve_name, date, total_seconds, total_liters):
     """
-    Append a daily summary for a valve to the CSV file.
+    Record a daily summary for a valve.
     Only call this if the valve actually operated (total_seconds > 0).
-    
+
     Args:
         valve_name: Name of the valve
         date: Date string in YYYY-MM-DD format
@@ -19,132 +592,169 @@ def append_daily_summary(valve_name, date, total_seconds, total_liters):
     """
     if total_seconds <= 0:
         return  # Don't record days when valve didn't operate
-    
+
     # Calculate average liters per minute
     avg_liters_per_minute = (total_liters / total_seconds) * 60 if total_seconds > 0 else 0
-    
-    # Create data directory and file with header if it doesn't exist
-    os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
-    file_exists = os.path.isfile(METRICS_FILE)
-    
-    with open(METRICS_FILE, 'a', newline='') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(['valve_name', 'date', 'total_seconds', 'total_liters', 'avg_liters_per_minute'])
-        writer.writerow([valve_name, date, total_seconds, round(total_liters, 2), round(avg_liters_per_minute, 2)])
+
+    get_store().add_daily_summary(valve_name, date, total_seconds, round(total_liters, 2), round(avg_liters_per_minute, 2))
 
 
-def load_baselines(valves_dict, logger):
+def compute_baseline(lpm_values):
     """
-    Load the last 30 days of data for each valve and calculate baselines.
+    Baseline statistics for a valve's daily avg_liters_per_minute values (oldest first).
+
+    Returns:
+        (weighted mean, standard deviation, trend in % per 30 days or None if fewer than 14 samples)
+    """
+    # Calculate weighted average (more weight to recent data)
+    n = len(lpm_values)
+    weighted_sum = 0
+    weight_total = 0
+
+    for i, lpm in enumerate(lpm_values):
+        # Weight: older = 0.5, middle = 1.0, recent = 1.5
+        if i < n / 3:
+            weight = 0.5
+        elif i < 2 * n / 3:
+            weight = 1.0
+        else:
+            weight = 1.5
+
+        weighted_sum += lpm * weight
+        weight_total += weight
+
+    baseline_lpm = weighted_sum / weight_total
+
+    # Calculate standard deviation
+    std_dev = statistics.stdev(lpm_values) if len(lpm_values) > 1 else 0
+
+    # Calculate trend (linear regression slope) - only if enough samples
+    baseline_trend_pct = None
+    if len(lpm_values) >= TREND_SAMPLES:
+        # y = mx + b, where x is day index (0 to n-1), y is lpm
+        x_values = list(range(len(lpm_values)))
+        x_mean = statistics.mean(x_values)
+        y_mean = statistics.mean(lpm_values)
+
+        numerator = sum((x - x_mean) * (y - y_mean) for x, y in zip(x_values, lpm_values))
+        denominator = sum((x - x_mean) ** 2 for x in x_values)
+
+        # Slope represents change in lpm per day
+        trend = numerator / denominator if denominator != 0 else 0
+
+        # Convert to percentage change per 30 days
+        baseline_trend_pct = (trend * 30 / baseline_lpm * 100) if baseline_lpm > 0 else 0
+
+    return baseline_lpm, std_dev, baseline_trend_pct
+
+
+def apply_baseline(valve, baseline):
+    """Copy a RollingBaseline's statistics onto a valve object (unset below MIN_SAMPLES)"""
+    valve.baseline_sample_count = len(baseline)
+    if len(baseline) < MIN_SAMPLES:
+        valve.baseline_lpm = None
+        valve.baseline_trend = None
+        valve.baseline_std_dev = None
+        return
+    baseline_lpm, std_dev, baseline_trend_pct = baseline.stats()
+    valve.baseline_lpm = round(baseline_lpm, 2)
+    valve.baseline_trend = round(baseline_trend_pct, 2) if baseline_trend_pct is not None else None
+    valve.baseline_std_dev = round(std_dev, 2)
+
+
+def load_baselines(valves_dict, logger, today=None):
+    """
+    Refresh each valve's baseline from its rolling state over the last 30 days.
     Updates valve objects with baseline metrics.
-    
+
+    The history is only queried for valves without persisted state (first run
+    after an upgrade or migration); otherwise this just expires old samples.
+
     Args:
         valves_dict: Dictionary of valve objects keyed by name
         logger: Logger instance
+        today: Current date (defaults to the system date)
     """
-    if not os.path.isfile(METRICS_FILE):
-        logger.info("No valve metrics file found. Baselines will be calculated after data is collected.")
-        return
-    
-    # Read all data from CSV
-    valve_data = defaultdict(list)
-    
-    with open(METRICS_FILE, 'r', newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            valve_data[row['valve_name']].append({
-                'date': datetime.strptime(row['date'], '%Y-%m-%d').date(),
-                'total_seconds': float(row['total_seconds']),
-                'total_liters': float(row['total_liters']),
-                'avg_liters_per_minute': float(row['avg_liters_per_minute'])
-            })
-    
-    # Calculate baselines for each valve
-    cutoff_date = datetime.now().date() - timedelta(days=30)
-    
+    store = get_store()
+    if store.migrated_rows:
+        logger.info(f"Migrated {store.migrated_rows} rows from '{METRICS_FILE}' into '{store.filename}'")
+        store.migrated_rows = 0
+
+    today = today if today is not None else datetime.now().date()
+    cutoff_date = (today - timedelta(days=BASELINE_DAYS)).isoformat()
+
     for valve_name, valve in valves_dict.items():
-        if valve_name not in valve_data:
+        baseline = store.baseline(valve_name, cutoff_date)
+        apply_baseline(valve, baseline)
+
+        if len(baseline) == 0:
             logger.info(f"No historical data for valve '{valve_name}'")
-            valve.baseline_lpm = None
-            valve.baseline_trend = None
-            valve.baseline_std_dev = None
-            valve.baseline_sample_count = 0
             continue
-        
-        # Filter to last 30 days
-        recent_data = [d for d in valve_data[valve_name] if d['date'] > cutoff_date]
-        
-        if len(recent_data) < 10:
-            logger.info(f"Insufficient data for valve '{valve_name}' (only {len(recent_data)} days, need 10+)")
-            valve.baseline_lpm = None
-            valve.baseline_trend = None
-            valve.baseline_std_dev = None
-            valve.baseline_sample_count = len(recent_data)
+
+        if len(baseline) < MIN_SAMPLES:
+            logger.info(f"Insufficient data for valve '{valve_name}' (only {len(baseline)} days, need {MIN_SAMPLES}+)")
             continue
-        
-        # Sort by date
-        recent_data.sort(key=lambda x: x['date'])
-        
-        # Extract avg_liters_per_minute values
-        lpm_values = [d['avg_liters_per_minute'] for d in recent_data]
-        
-        # Calculate weighted average (more weight to recent data)
-        n = len(lpm_values)
-        weighted_sum = 0
-        weight_total = 0
-        
-        for i, lpm in enumerate(lpm_values):
-            # Weight: older = 0.5, middle = 1.0, recent = 1.5
-            if i < n / 3:
-                weight = 0.5
-            elif i < 2 * n / 3:
-                weight = 1.0
-            else:
-                weight = 1.5
-            
-            weighted_sum += lpm * weight
-            weight_total += weight
-        
-        baseline_lpm = weighted_sum / weight_total
-        
-        # Calculate standard deviation
-        std_dev = statistics.stdev(lpm_values) if len(lpm_values) > 1 else 0
-        
-        # Calculate trend (linear regression slope) - only if enough samples
-        baseline_trend_pct = None
-        if len(lpm_values) >= 14:
-            # y = mx + b, where x is day index (0 to n-1), y is lpm
-            x_values = list(range(len(lpm_values)))
-            x_mean = statistics.mean(x_values)
-            y_mean = statistics.mean(lpm_values)
-            
-            numerator = sum((x - x_mean) * (y - y_mean) for x, y in zip(x_values, lpm_values))
-            denominator = sum((x - x_mean) ** 2 for x in x_values)
-            
-            # Slope represents change in lpm per day
-            trend = numerator / denominator if denominator != 0 else 0
-            
-            # Convert to percentage change per 30 days
-            baseline_trend_pct = (trend * 30 / baseline_lpm * 100) if baseline_lpm > 0 else 0
-        
-        # Update valve object
-        valve.baseline_lpm = round(baseline_lpm, 2)
-        valve.baseline_trend = round(baseline_trend_pct, 2) if baseline_trend_pct is not None else None
-        valve.baseline_std_dev = round(std_dev, 2)
-        valve.baseline_sample_count = len(recent_data)
-        
-        trend_text = f"{valve.baseline_trend:+.2f}% per month" if valve.baseline_trend is not None else "N/A (need 14+ samples)"
+
+        trend_text = f"{valve.baseline_trend:+.2f}% per month" if valve.baseline_trend is not None else f"N/A (need {TREND_SAMPLES}+ samples)"
         logger.info(f"Valve '{valve_name}' baseline: {valve.baseline_lpm} L/min, "
                    f"trend: {trend_text}, "
                    f"std dev: {valve.baseline_std_dev}, "
                    f"samples: {valve.baseline_sample_count}")
 
 
+def update_baseline(valve, date_str, seconds=None, liters=None, today=None):
+    """
+    Record a valve's running totals for date_str (YYYY-MM-DD) after a cycle and
+    refresh its baseline, so the next cycle is checked against it.
+
+    Args:
+        valve: Valve object
+        date_str: Date string in YYYY-MM-DD format
+        seconds, liters: The day's totals (default: the valve's current counters)
+        today: Current date (defaults to date_str)
+    """
+    seconds = valve.secondsDaily if seconds is None else seconds
+    liters = valve.litersDaily if liters is None else liters
+    if seconds <= 0:
+        return
+    append_daily_summary(valve.name, date_str, seconds, liters)
+    today = today if today is not None else datetime.fromisoformat(date_str).date()
+    cutoff_date = (today - timedelta(days=BASELINE_DAYS)).isoformat()
+    apply_baseline(valve, get_store().baseline(valve.name, cutoff_date))
+
+
+def restore_daily_totals(valves_dict, date_str, logger):
+    """
+    Restore the daily counters of valves from what was already recorded for
+    date_str (YYYY-MM-DD), so a restart mid-day continues today's totals.
+    """
+    totals = get_store().daily_totals(date_str)
+    for valve_name, valve in valves_dict.items():
+        if valve_name in totals:
+            seconds, liters = totals[valve_name]
+            valve.secondsDaily, valve.litersDaily = int(seconds), liters
+            logger.info(f"Restored today's totals for valve '{valve_name}': "
+                        f"{valve.secondsDaily}s, {valve.litersDaily:.2f}L")
+
+
+def archive_old_metrics(logger, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, today=None):
+    """
+    Move whole months older than retention_days out of the database into
+    compressed monthly archives, so the database (and startup) stays sized to
+    the retention window however long the history grows.
+    """
+    today = today if today is not None else datetime.now().date()
+    before = (today - timedelta(days=retention_days)).replace(day=1).isoformat()
+    moved = get_store().archive(before, archive_dir)
+    if moved:
+        logger.info(f"Archived {moved} metrics rows before {before} into '{archive_dir}'")
+    return moved
+
+
 def write_daily_summaries(valves_dict, date_str, logger):
     """
     Write daily summaries for all valves that operated today.
-    
+
     Args:
         valves_dict: Dictionary of valve objects keyed by name
         date_str: Date string in YYYY-MM-DD format
@@ -1,17 +1,24 @@
 import time
 import RPi.GPIO as GPIO
+from clock import SYSTEM as SYSTEM_CLOCK
 
 class BaseValve():
   def __init__(self, logger, config):
     self.logger = logger
     self.config = config
     self.name = config.name
+    self.clock = SYSTEM_CLOCK
+    # Called when is_open or enabled changes, so a running cycle reacts at once
+    self.onChange = None
+    # Set by the worker running a cycle: brings secondsLast/secondsDaily/secondsRemain up to date
+    self.progress = None
     self.enabled = config.enabled
     self.handled = False
     self.is_open = False
     self.secondsDaily = 0
     self.litersDaily = 0
     self.secondsRemain = 0
+    self._nextScheduleId = 1
     self.schedules = config.schedules
     for schedule in self.schedules:
       if not hasattr(schedule, "days"):
@@ -25,6 +32,70 @@ class BaseValve():
     self.baseline_std_dev = None
     self.baseline_sample_count = 0
     
+  @property
+  def is_open(self):
+    return self._is_open
+
+  @is_open.setter
+  def is_open(self, is_open):
+    self._is_open = is_open
+    self.changed()
+
+  @property
+  def enabled(self):
+    return self._enabled
+
+  @enabled.setter
+  def enabled(self, enabled):
+    self._enabled = enabled
+    self.changed()
+
+  def changed(self):
+    if self.onChange is not None:
+      self.onChange()
+
+  def updateProgress(self):
+    """Refresh the seconds counters of a running cycle before they are read"""
+    progress = self.progress
+    if progress is not None:
+      progress()
+
+  @property
+  def schedules(self):
+    return self._schedules
+
+  @schedules.setter
+  def schedules(self, schedules):
+    self._schedules = schedules
+    self.reindexSchedules()
+
+  def reindexSchedules(self):
+    """Give schedules without one a stable id and rebuild the id -> position index"""
+    self._nextScheduleId = max([self._nextScheduleId] + [s.id + 1 for s in self._schedules if getattr(s, 'id', None) is not None])
+    for schedule in self._schedules:
+      if getattr(schedule, 'id', None) is None:
+        schedule.id = self._nextScheduleId
+        self._nextScheduleId += 1
+    self._schedulePositions = {s.id: i for i, s in enumerate(self._schedules)}
+
+  def schedulePosition(self, scheduleId):
+    """Current list position of the schedule with this id, or None"""
+    return self._schedulePositions.get(scheduleId)
+
+  def scheduleById(self, scheduleId):
+    position = self._schedulePositions.get(scheduleId)
+    return self._schedules[position] if position is not None else None
+
+  def addSchedule(self, schedule):
+    self._schedules.append(schedule)
+    self.reindexSchedules()
+    return schedule.id
+
+  def removeSchedule(self, position):
+    schedule = self._schedules.pop(position)
+    self.reindexSchedules()
+    return schedule
+
   def open(self):
     self.logger.info("Opening valve")
 
@@ -34,11 +105,11 @@ class BaseValve():
 class TestValve(BaseValve):
   def open(self):
     BaseValve.open(self)
-    time.sleep(0.5)
+    self.clock.sleep(0.5)
 
   def close(self):
     BaseValve.close(self)
-    time.sleep(0.5)
+    self.clock.sleep(0.5)
 
 class ThreeWireValve(BaseValve):
   def __init__(self, logger, config):
@@ -1,9 +1,9 @@
 import time
 import threading
-from datetime import datetime
 from datetime import timedelta
 from paho.mqtt import client
 from collections import deque
+from clock import SYSTEM as SYSTEM_CLOCK
 import random
 
 class BaseWaterflow():
@@ -15,18 +15,23 @@ class BaseWaterflow():
     self.leakdetection = config.leakdetection
     self.started = False
     self._lastLiter_1m = 0
-    self._lastupdate = datetime.now()
-    self._lastHistoryUpdate = datetime.now()
+    self.setClock(SYSTEM_CLOCK)
+
+  def setClock(self, clock):
+    """Use clock (the engine's) for flow timestamps; restarts the history at its current time"""
+    self.clock = clock
+    self._lastupdate = clock.now()
+    self._lastHistoryUpdate = clock.now()
     self._history = deque(maxlen=120)  # Store last 120 minutes of flow data as (timestamp, value) tuples
     # Initialize with 120 zero values with timestamps going back 120 minutes
-    now = datetime.now()
+    now = clock.now()
     for i in range(120):
       # Start from 119 minutes ago up to current minute
       timestamp = now - timedelta(minutes=119-i)
       self._history.append((timestamp, 0.0))
 
   def lastLiter_1m(self):
-    now = datetime.now()
+    now = self.clock.now()
     
     # If no update for more than 60 seconds, flow is 0
     if now > self._lastupdate + timedelta(0, 60):
@@ -40,10 +45,10 @@ class BaseWaterflow():
 
   def setLastLiter_1m(self, value):
     self._lastLiter_1m = value
-    self._lastupdate = datetime.now()
+    self._lastupdate = self.clock.now()
     
     # Only add to history once per minute
-    now = datetime.now()
+    now = self.clock.now()
     if now > self._lastHistoryUpdate + timedelta(seconds=60):
       self._history.append((now, float(value)))
       self._lastHistoryUpdate = now
@@ -74,7 +79,7 @@ class TestWaterflow(BaseWaterflow):
 
   def tickerThread(self):
     while True:
-      time.sleep(10)
+      self.clock.sleep(10)
       _ = random.randint(0, 50)
       if _ > 25:
         _ = 0